@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the PacMan game and graphics.py
+
+Measures headless simulation speed, maze start-up time against board
+size, graphics object throughput on a backend that draws nothing, the
+cost of the movers' per call helpers and the number of canvas calls a
+frame makes. Results are written as JSON so
+runs can be compared across commits; every run is seeded.
+
+usage: python bench.py [--quick] [--seed N] [--output FILE]
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+import graphics as gx
+import instrument
+import pacman as pm
+
+clock = instrument.clock
+
+# board sizes (width, height) used for the generated layouts
+LAYOUT_SIZES = [(31, 15), (61, 31), (121, 61), (241, 121)]
+KEYS         = ['Left', 'Right', 'Up', 'Down']
+
+
+def timed(func, repeat):
+    r"""
+    Run func repeat times
+
+    Returns
+    -------
+    dict of 'best' and 'median' seconds per run
+
+    """
+    times = []
+    for run in range(repeat):
+        start = clock()
+        func()
+        times.append(clock() - start)
+    return {'best': min(times), 'median': instrument.percentile(times, 50)}
+
+
+def bench_ticks(layout, ticks, seed, repeat):
+    r"""
+    Headless simulation speed: ticks per second with no drawing. Pacman
+    is steered by seeded random key presses; a finished game is replaced
+    by a fresh one outside the timed region.
+
+    Parameters
+    ----------
+    layout : maze layout
+    ticks  : ticks per run
+    seed   : seed for the ghosts and the key presses
+    repeat : number of runs
+
+    """
+    def run():
+        keys   = random.Random(seed)
+        maze   = pm.Maze(layout, backend='null', seed=seed)
+        played = 0
+        spent  = 0.0
+        while played < ticks:
+            if maze.finished():
+                maze = pm.Maze(layout, backend='null', seed=seed + played)
+            if played % 10 == 0:
+                maze.key_pressed(keys.choice(KEYS))
+            start = clock()
+            maze.tick()
+            spent += clock() - start
+            played += 1
+        return spent
+
+    times = [run() for index in range(repeat)]
+    best  = min(times)
+    return {'ticks': ticks,
+            'best_ticks_per_sec': ticks / best,
+            'median_ticks_per_sec': ticks / instrument.percentile(times, 50),
+            'movers': len(pm.Maze(layout, backend='null').movables)}
+
+
+def bench_startup(sizes, seed, repeat):
+    r"""
+    Maze construction time (set_layout and window setup) per board size
+
+    Parameters
+    ----------
+    sizes  : list of (width, height)
+    seed   : layout seed
+    repeat : number of runs per size
+
+    """
+    results = []
+    for (width, height) in sizes:
+        layout = pm.generate_layout(width, height, seed=seed)
+        result = timed(lambda: pm.Maze(layout, backend='null', seed=seed), repeat)
+        result.update({'width': len(layout[0]), 'height': len(layout),
+                       'cells': len(layout[0]) * len(layout)})
+        results.append(result)
+    return results
+
+
+def bench_graphics(count, repeat):
+    r"""
+    graphics.py draw, undraw and reconfig throughput on the null backend,
+    i.e. the cost of the library without any canvas behind it
+
+    Parameters
+    ----------
+    count  : objects per run
+    repeat : number of runs
+
+    """
+    results = {}
+    for autoflush in (True, False):
+        win     = gx.GraphWin('bench', 800, 600, autoflush=autoflush, backend='null')
+        circles = [gx.Circle(gx.Point(i % 800, i % 600), 5) for i in range(count)]
+        polys   = [gx.Polygon(gx.Point(0, 0), gx.Point(10, 0), gx.Point(5, 8))
+                   for i in range(count)]
+
+        def draw():
+            for shape in circles:
+                shape.draw(win)
+
+        def undraw():
+            for shape in circles:
+                shape.undraw()
+
+        def draw_polygons():
+            for shape in polys:
+                shape.draw(win)
+            for shape in polys:
+                shape.undraw()
+
+        def reconfig():
+            for shape in circles:
+                shape.setFill('red')
+                shape.setFill('blue')
+            win.update()
+
+        def move():
+            for shape in circles:
+                shape.move(1, 1)
+            win.update()
+
+        mode = 'autoflush' if autoflush else 'batched'
+        for (name, func) in (('draw', draw), ('undraw', undraw)):
+            times = []
+            for run in range(repeat):
+                if name == 'undraw':
+                    draw()
+                start = clock()
+                func()
+                times.append(clock() - start)
+                if name == 'draw':
+                    undraw()
+            results['%s_%s_per_sec' % (name, mode)] = count / min(times)
+        draw()
+        for (name, func, ops) in (('reconfig', reconfig, 2 * count),
+                                  ('move', move, count),
+                                  ('polygon_draw_undraw', draw_polygons, 2 * count)):
+            results['%s_%s_per_sec' % (name, mode)] = ops / timed(func, repeat)['best']
+        undraw()
+        win.close()
+    return results
+
+
+def bench_mover_calls(calls, seed, repeat):
+    r"""
+    Cost per call of Ghost.choose_move and Movable.furthest_move
+
+    Parameters
+    ----------
+    calls  : calls per run
+    seed   : maze seed
+    repeat : number of runs
+
+    """
+    maze   = pm.Maze(pm.my_layout, backend='null', seed=seed)
+    ghost  = [mover for mover in maze.movables if isinstance(mover, pm.Ghost)][0]
+    pacman = [mover for mover in maze.movables if isinstance(mover, pm.Pacman)][0]
+    moves  = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+    def choose():
+        for index in range(calls):
+            ghost.choose_move()
+
+    def furthest():
+        for index in range(calls):
+            pacman.furthest_move(moves[index & 3])
+
+    return {'choose_move_us': timed(choose, repeat)['best'] / calls * 1e6,
+            'furthest_move_us': timed(furthest, repeat)['best'] / calls * 1e6}
+
+
+def bench_canvas_ops(ticks, seed):
+    r"""
+    Canvas operations issued per frame by a game on my_layout, counted
+    with the recording backend. Unlike timings these counts are exact
+    and identical from run to run.
+
+    Parameters
+    ----------
+    ticks : frames to play
+    seed  : seed for the ghosts and the key presses
+
+    """
+    keys    = random.Random(seed)
+    maze    = pm.Maze(pm.my_layout, backend='recording', seed=seed)
+    backend = maze.win.backend
+    setup   = backend.mark()
+    for index in range(ticks):
+        if index % 10 == 0:
+            maze.key_pressed(keys.choice(KEYS))
+        maze.tick()
+        maze.render()
+        maze.win.update()
+    frames = backend.frameCounts()[1:-1]
+    totals = [sum(counts.values()) for counts in frames]
+    ops    = {}
+    for counts in frames:
+        for (op, count) in counts.items():
+            ops[op] = ops.get(op, 0) + count
+    return {'setup_ops': setup,
+            'mean_ops_per_frame': sum(totals) / len(totals),
+            'max_ops_per_frame': max(totals),
+            'ops': ops}
+
+
+def code_version():
+    r""" git revision of the checkout bench.py is in, or None outside a checkout """
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                      stderr=subprocess.STDOUT,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(quick=False, seed=0):
+    r"""
+    Run every benchmark
+
+    Parameters
+    ----------
+    quick : T/F use smaller workloads, for smoke testing
+    seed  : seed for layouts, ghosts and key presses
+
+    Returns
+    -------
+    dict of metadata and results, ready for json
+
+    """
+    repeat = 2 if quick else 5
+    ticks  = 200 if quick else 2000
+    sizes  = LAYOUT_SIZES[:2] if quick else LAYOUT_SIZES
+    results = {
+        'ticks_my_layout': bench_ticks(pm.my_layout, ticks, seed, repeat),
+        'ticks_generated': [],
+        'startup': bench_startup(sizes, seed, repeat),
+        'graphics': bench_graphics(200 if quick else 2000, repeat),
+        'mover_calls': bench_mover_calls(1000 if quick else 20000, seed, repeat),
+        'canvas_ops': bench_canvas_ops(ticks // 2, seed),
+        }
+    for (width, height) in sizes:
+        layout = pm.generate_layout(width, height, seed=seed)
+        result = bench_ticks(layout, ticks // 2, seed, repeat)
+        result.update({'width': len(layout[0]), 'height': len(layout)})
+        results['ticks_generated'].append(result)
+    meta = {'seed': seed,
+            'quick': quick,
+            'version': code_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'meta': meta, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PacMan benchmarks')
+    parser.add_argument('--quick', action='store_true',
+                        help='small workloads, for smoke testing')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for layouts, ghosts and key presses')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write JSON here instead of stdout')
+    args   = parser.parse_args(argv)
+    report = run_all(args.quick, args.seed)
+    text   = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
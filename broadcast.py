@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Delta compressed game state for spectators and remote renderers
+
+A TickEncoder follows one Maze and turns each tick into a TickDelta of
+what changed since the tick before: movers whose quantised position,
+facing or colour changed, and the food and capsules eaten (collected
+from the maze's FoodEaten/CapsuleEaten events). A delta is serialised
+once per format, binary or JSON, and a FanOut sends the same bytes to
+every subscriber, so the cost per viewer is one socket write.
+
+A watcher joining mid game gets a keyframe (the encoder's state as of
+the last delta) in its welcome, then the deltas from there on.
+
+Binary tick frame, network byte order
+    header  : kind (B, TICK), tick (I), flags (B, LOST|OVER),
+              movers (B), food (H), capsules (B)
+    movers  : index (B), fields (B), then per the fields bits
+              NEAR: dx, dy (b, b) quanta | FAR: x, y (H, H) quanta |
+              COLORED: palette index (B); facing is fields bits 4-5
+    food    : x, y (H, H) per item, then the same for the capsules
+
+On a stream every payload is preceded by its length (I). A payload
+starting with '{' is a JSON control message rather than a tick.
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import collections
+import json
+import struct
+
+import events as ev
+
+# positions are sent in 1/QUANTUM of a cell, so up to 1023 cells across
+QUANTUM = 64
+# stream formats
+JSON    = 'json'
+BINARY  = 'binary'
+FORMATS = (JSON, BINARY)
+
+# payload kinds
+TICK = 0x01
+# tick flags
+LOST = 0x01
+OVER = 0x02
+# mover fields bits; facing (degrees / 90) rides in bits 4-5
+NEAR    = 0x01
+FAR     = 0x02
+TURNED  = 0x04
+COLORED = 0x08
+FACING_SHIFT = 4
+
+LENGTH = struct.Struct('>I')
+HEADER = struct.Struct('>BIBBHB')
+MOVER  = struct.Struct('>BB')
+SMALL  = struct.Struct('>bb')
+PLACE  = struct.Struct('>HH')
+COLOR  = struct.Struct('>B')
+
+# one tick's changes. movers : list of MoverChange; food/capsules :
+# lists of (x, y) eaten this tick; lost/over : the game's flags after it
+TickDelta = collections.namedtuple('TickDelta',
+                                   ['tick', 'movers', 'food', 'capsules', 'lost', 'over'])
+# a changed mover: position and the step from the last one in quanta,
+# facing in degrees, colour as a palette index; fields says what changed
+MoverChange = collections.namedtuple('MoverChange',
+                                     ['index', 'x', 'y', 'dx', 'dy', 'facing', 'color',
+                                      'fields'])
+
+
+def palette(config):
+    r""" list of every colour a mover can take under a Config """
+    colors = [config.pac_color] + list(config.ghost_colors) + [config.scared_color]
+    return sorted(set(colors), key=colors.index)
+
+
+def frame(payload, format):
+    r""" payload bytes ready to write to a stream of the given format """
+    if format == BINARY:
+        return LENGTH.pack(len(payload)) + payload
+    return payload + b'\n'
+
+
+def frame_message(message, format):
+    r""" a JSON control message ready to write to a stream """
+    return frame(json.dumps(message, separators=(',', ':')).encode(), format)
+
+
+class TickEncoder:
+    r"""
+    TickEncoder Class
+        Tracks the state last sent for one maze and encodes the changes
+        made by each tick. update() must be called after every tick,
+        whether or not anyone is watching, so deltas chain.
+
+    Attributes
+    ----------
+    maze     : Maze encoded
+    palette  : colours, sent once; movers refer to them by index
+    movers   : (x, y, facing, color) per mover as last sent, quantised
+    food     : every food place eaten up to the last delta
+    capsules : every capsule place eaten up to the last delta
+    tick     : tick of the last delta
+
+    Methods
+    -------
+    update      : return the TickDelta of the latest tick
+    keyframe    : return the full state as of the last delta
+    encode      : serialise a TickDelta to binary
+    encode_json : serialise a TickDelta to JSON
+
+    """
+
+    def __init__(self, maze):
+        if len(maze.movables) > 255:
+            raise ValueError('too many movers to encode')
+        self.maze     = maze
+        self.palette  = palette(maze.config)
+        self.colors   = dict((color, index) for (index, color) in enumerate(self.palette))
+        self.movers   = [self.quantise(state) for state in maze.buffer.latest()[1].movers]
+        self.food     = []
+        self.capsules = []
+        self.tick     = maze.ticks
+        self.new_food     = []
+        self.new_capsules = []
+        maze.events.subscribe(ev.FoodEaten, self.food_eaten, batched=True)
+        maze.events.subscribe(ev.CapsuleEaten, self.capsule_eaten, batched=True)
+
+    def food_eaten(self, event):
+        self.new_food.append(event.place)
+
+    def capsule_eaten(self, event):
+        self.new_capsules.append(event.place)
+
+    def quantise(self, state):
+        r""" (x, y, facing, color index) of a MoverState """
+        return (int(round(state.place[0] * QUANTUM)), int(round(state.place[1] * QUANTUM)),
+                state.direction, self.colors[state.color])
+
+    def update(self):
+        r"""
+        Return the TickDelta between the last delta and the maze's latest
+        snapshot, and remember the new state as sent
+
+        """
+        maze    = self.maze
+        changes = []
+        for (index, state) in enumerate(maze.buffer.latest()[1].movers):
+            new = self.quantise(state)
+            old = self.movers[index]
+            if new == old:
+                continue
+            fields = 0
+            (dx, dy) = (new[0] - old[0], new[1] - old[1])
+            if dx or dy:
+                fields = NEAR if -128 <= dx < 128 and -128 <= dy < 128 else FAR
+            if new[2] != old[2]:
+                fields |= TURNED
+            if new[3] != old[3]:
+                fields |= COLORED
+            changes.append(MoverChange(index, new[0], new[1], dx, dy, new[2], new[3],
+                                       fields))
+            self.movers[index] = new
+        delta = TickDelta(maze.ticks, changes, self.new_food, self.new_capsules,
+                          maze.lost, maze.finished())
+        self.food.extend(self.new_food)
+        self.capsules.extend(self.new_capsules)
+        self.new_food     = []
+        self.new_capsules = []
+        self.tick         = maze.ticks
+        return delta
+
+    def keyframe(self):
+        r""" dict of the full state as of the last delta, for a welcome """
+        return {'tick': self.tick, 'quantum': QUANTUM, 'palette': self.palette,
+                'movers': [[index, x, y, facing, color]
+                           for (index, (x, y, facing, color)) in enumerate(self.movers)],
+                'food': [list(place) for place in self.food],
+                'capsules': [list(place) for place in self.capsules]}
+
+    def encode(self, delta):
+        r""" binary payload of a TickDelta """
+        flags = (LOST if delta.lost else 0) | (OVER if delta.over else 0)
+        parts = [HEADER.pack(TICK, delta.tick, flags, len(delta.movers),
+                             len(delta.food), len(delta.capsules))]
+        for change in delta.movers:
+            fields = change.fields | (change.facing // 90) << FACING_SHIFT
+            parts.append(MOVER.pack(change.index, fields))
+            if change.fields & NEAR:
+                parts.append(SMALL.pack(change.dx, change.dy))
+            elif change.fields & FAR:
+                parts.append(PLACE.pack(change.x, change.y))
+            if change.fields & COLORED:
+                parts.append(COLOR.pack(change.color))
+        for place in delta.food:
+            parts.append(PLACE.pack(*place))
+        for place in delta.capsules:
+            parts.append(PLACE.pack(*place))
+        return b''.join(parts)
+
+    def encode_json(self, delta):
+        r""" JSON payload of a TickDelta, positions in quanta """
+        message = {'type': 'tick', 'tick': delta.tick,
+                   'movers': [[change.index, change.x, change.y, change.facing, change.color]
+                              for change in delta.movers],
+                   'food': [list(place) for place in delta.food],
+                   'capsules': [list(place) for place in delta.capsules],
+                   'lost': delta.lost, 'over': delta.over}
+        return json.dumps(message, separators=(',', ':')).encode()
+
+
+class TickDecoder:
+    r"""
+    TickDecoder Class
+        The receiving end: rebuilds a game's state from a welcome keyframe
+        and the tick payloads after it, in either format
+
+    Attributes
+    ----------
+    palette  : colours movers refer to by index
+    movers   : [x, y, facing, color] per mover, x and y in cells
+    food     : set of eaten food places
+    capsules : set of eaten capsule places
+    tick     : tick of the last payload applied
+    lost     : T/F pacman has been caught
+    over     : T/F the game has ended
+
+    Methods
+    -------
+    apply : apply one tick payload, returning the movers it changed
+
+    """
+
+    def __init__(self, welcome):
+        self.quantum  = welcome['quantum']
+        self.palette  = welcome['palette']
+        self.movers   = [self.place(x, y, facing, color)
+                         for (index, x, y, facing, color) in welcome['movers']]
+        self.food     = set(tuple(place) for place in welcome['food'])
+        self.capsules = set(tuple(place) for place in welcome['capsules'])
+        self.tick     = welcome['tick']
+        self.lost     = False
+        self.over     = False
+
+    def place(self, x, y, facing, color):
+        r""" mover row in cells and colour names from quanta and indices """
+        return [x / self.quantum, y / self.quantum, facing, self.palette[color]]
+
+    def apply(self, payload):
+        r"""
+        Apply a tick payload, binary or JSON
+
+        Returns
+        -------
+        list of the indices of the movers changed
+
+        """
+        if payload[:1] == b'{':
+            return self.apply_json(json.loads(payload.decode()))
+        (kind, tick, flags, movers, food, capsules) = HEADER.unpack_from(payload)
+        if kind != TICK:
+            raise ValueError('not a tick payload')
+        offset  = HEADER.size
+        changed = []
+        for count in range(movers):
+            (index, fields) = MOVER.unpack_from(payload, offset)
+            offset += MOVER.size
+            mover   = self.movers[index]
+            if fields & NEAR:
+                (dx, dy) = SMALL.unpack_from(payload, offset)
+                offset  += SMALL.size
+                mover[0] += dx / self.quantum
+                mover[1] += dy / self.quantum
+            elif fields & FAR:
+                (x, y)  = PLACE.unpack_from(payload, offset)
+                offset += PLACE.size
+                mover[0] = x / self.quantum
+                mover[1] = y / self.quantum
+            mover[2] = (fields >> FACING_SHIFT) * 90
+            if fields & COLORED:
+                mover[3] = self.palette[COLOR.unpack_from(payload, offset)[0]]
+                offset  += COLOR.size
+            changed.append(index)
+        for (eaten, count) in ((self.food, food), (self.capsules, capsules)):
+            for item in range(count):
+                eaten.add(PLACE.unpack_from(payload, offset))
+                offset += PLACE.size
+        self.tick = tick
+        self.lost = bool(flags & LOST)
+        self.over = bool(flags & OVER)
+        return changed
+
+    def apply_json(self, message):
+        changed = []
+        for (index, x, y, facing, color) in message['movers']:
+            self.movers[index] = self.place(x, y, facing, color)
+            changed.append(index)
+        self.food.update(tuple(place) for place in message['food'])
+        self.capsules.update(tuple(place) for place in message['capsules'])
+        self.tick = message['tick']
+        self.lost = message['lost']
+        self.over = message['over']
+        return changed
+
+
+class FanOut:
+    r"""
+    FanOut Class
+        Sends one serialised payload to many asyncio stream writers. The
+        payload is framed once and the same bytes object is written to
+        every subscriber; a subscriber whose unsent output grows past a
+        limit is dropped rather than left to hold up the others.
+
+    Attributes
+    ----------
+    format  : stream format of every subscriber, JSON or BINARY
+    writers : set of subscribed StreamWriters
+    limit   : unsent bytes at which a subscriber is dropped
+    sent    : payloads published
+    bytes   : bytes written over all subscribers
+
+    Methods
+    -------
+    add     : subscribe a writer
+    discard : unsubscribe a writer
+    publish : frame a payload and write it to every subscriber
+
+    """
+
+    def __init__(self, format, limit=1 << 20):
+        if format not in FORMATS:
+            raise ValueError('unknown format %r' % (format,))
+        self.format  = format
+        self.writers = set()
+        self.limit   = limit
+        self.sent    = 0
+        self.bytes   = 0
+
+    def __len__(self):
+        return len(self.writers)
+
+    def add(self, writer):
+        self.writers.add(writer)
+
+    def discard(self, writer):
+        self.writers.discard(writer)
+
+    def publish(self, payload):
+        r""" frame payload and write it to every subscriber still keeping up """
+        data = frame(payload, self.format)
+        for writer in list(self.writers):
+            if writer.is_closing():
+                self.writers.discard(writer)
+            elif writer.transport.get_write_buffer_size() > self.limit:
+                self.writers.discard(writer)
+                writer.close()
+            else:
+                writer.write(data)
+                self.bytes += len(data)
+        self.sent += 1
@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+Trajectory datasets of PacMan games for offline learning
+
+A Recorder steps a Maze with one action per tick and hands each
+(observation, action, reward, done) transition to a ShardWriter. The
+writer fills preallocated NumPy columns and, once a shard's worth of
+rows is buffered, passes the columns to a background thread that saves
+them as one NPZ shard, so the game never waits on compression or disk
+and no transition is ever held in a Python list.
+
+Observations are stacks of uint8 planes over the map, one per entry of
+PLANES, plus the exact mover positions. Rewards come from the maze's
+events, weighted by REWARDS.
+
+A ShardReader iterates a dataset a shard at a time. Shards written
+without compression are memory mapped, column by column, straight out
+of the NPZ file; compressed shards are decompressed one at a time.
+
+usage: python dataset.py record DIR [--games N] [--layout L] [--shard-mb M]
+                                    [--stored] [--explore P] [--seed N]
+       python dataset.py info DIR
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import argparse
+import json
+import os
+import random
+import struct
+import threading
+import zipfile
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import numpy as np
+
+import events as ev
+import instrument
+import pacman as pm
+import sweep
+
+clock = instrument.clock
+
+# observation planes, in order
+PLANES  = ('wall', 'food', 'capsule', 'pacman', 'ghost', 'scared')
+# action index to key; 0 is no key pressed
+ACTIONS = (None, 'Left', 'Right', 'Up', 'Down')
+# reward per event
+REWARDS = {ev.FoodEaten: 1.0, ev.CapsuleEaten: 5.0, ev.GhostCaptured: 20.0,
+           ev.Won: 100.0, ev.Lost: -100.0}
+
+INDEX = 'index.json'
+# zip local file header: signature ... name length, extra length
+LOCAL_HEADER = struct.Struct('<4s22xHH')
+
+
+class Recorder:
+    r"""
+    Recorder Class
+        Plays one game a tick at a time and records each transition
+
+    Attributes
+    ----------
+    maze    : Maze played
+    writer  : ShardWriter the transitions go to
+    episode : episode number stored with every transition
+    reward  : reward from the events of the tick under way
+    walls   : wall plane, the same every tick
+
+    Methods
+    -------
+    observe : return the (planes, positions) observation of the game now
+    step    : observe, act, tick and record the transition
+
+    """
+
+    def __init__(self, maze, writer, episode=0):
+        self.maze    = maze
+        self.writer  = writer
+        self.episode = episode
+        self.reward  = 0.0
+        self.size    = maze.width * maze.height
+        self.walls   = np.array([[maze.object_at((x, y)).is_wall()
+                                  for x in range(maze.width)]
+                                 for y in range(maze.height)], dtype=np.uint8)
+        for event_type in REWARDS:
+            maze.events.subscribe(event_type, self.score, batched=True)
+
+    def score(self, event):
+        self.reward += REWARDS[type(event)]
+
+    def bits(self, bitset):
+        r""" plane of a map bitset (bit y*width+x) """
+        data = bitset.to_bytes((self.size + 7) // 8, 'little')
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder='little')
+        return bits[:self.size].reshape(self.walls.shape)
+
+    def observe(self):
+        r"""
+        Return the observation of the game now
+
+        Returns
+        -------
+        (planes, positions): uint8 array (len(PLANES), height, width) and
+        float32 array (movers, 2) of map coordinates
+
+        """
+        maze   = self.maze
+        planes = np.zeros((len(PLANES),) + self.walls.shape, dtype=np.uint8)
+        planes[0] = self.walls
+        planes[1] = self.bits(maze.food_bits)
+        planes[2] = self.bits(maze.capsule_bits)
+        for mover in maze.movables:
+            (x, y) = mover.nearest_grid_point()
+            if isinstance(mover, pm.Pacman):
+                planes[3, y, x] = 1
+            elif mover.time_left > 0:
+                planes[5, y, x] = 1
+            else:
+                planes[4, y, x] = 1
+        positions = np.array([mover.place for mover in maze.movables], dtype=np.float32)
+        return (planes, positions)
+
+    def step(self, action=0):
+        r"""
+        Observe, press the action's key, tick and record the transition
+
+        Parameters
+        ----------
+        action : index into ACTIONS
+
+        Returns
+        -------
+        T/F the game is over
+
+        """
+        maze = self.maze
+        (planes, positions) = self.observe()
+        if ACTIONS[action] is not None:
+            maze.key_pressed(ACTIONS[action])
+        self.reward = 0.0
+        maze.tick()
+        done = maze.finished()
+        self.writer.append(obs=planes, positions=positions, action=np.uint8(action),
+                           reward=np.float32(self.reward), done=done,
+                           episode=np.int32(self.episode), tick=np.int32(maze.ticks - 1))
+        return done
+
+
+class ShardWriter:
+    r"""
+    ShardWriter Class
+        Buffers rows of named columns in NumPy arrays and writes them out
+        as NPZ shards on a background thread. A shard holds as many rows
+        as fit in shard_bytes uncompressed, so every shard but the last
+        has the same number of rows. append() blocks only if the writer
+        falls a whole queue of shards behind; no row is dropped. Once the
+        thread fails, append and flush raise its error and close does not
+        wait on shards that will never be written.
+
+    Attributes
+    ----------
+    directory : where the shards and index.json are written
+    shard_rows: rows per shard, fixed by the first row appended
+    compress  : T/F deflate the shards; False writes them to be memory mapped
+    columns   : column name to (dtype, row shape), from the first row
+    rows      : rows appended so far
+    shards    : list of dicts of file, rows and bytes of shards written
+    error     : exception raised by the writer thread, or None
+
+    Methods
+    -------
+    append : add a row
+    flush  : hand the rows buffered so far to the writer as a shard
+    close  : write everything and stop the writer thread
+
+    """
+
+    def __init__(self, directory, shard_bytes=64 << 20, compress=True, max_queue=4):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory   = directory
+        self.shard_bytes = shard_bytes
+        self.compress    = compress
+        self.columns     = None
+        self.shard_rows  = None
+        self.buffer      = None
+        self.filled      = 0
+        self.rows        = 0
+        self.number      = 0
+        self.shards      = []
+        self.error       = None
+        self.queue       = queue.Queue(max_queue)
+        self.thread      = threading.Thread(target=self._writer)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _allocate(self):
+        self.buffer = dict((name, np.empty((self.shard_rows,) + shape, dtype=dtype))
+                           for (name, (dtype, shape)) in self.columns.items())
+        self.filled = 0
+
+    def append(self, **row):
+        r"""
+        Add a row of column values; every row must have the columns,
+        dtypes and shapes of the first
+
+        """
+        if self.error is not None:
+            raise RuntimeError('shard writer failed: %s' % self.error)
+        if self.columns is None:
+            self.columns = {}
+            for (name, value) in row.items():
+                value = np.asarray(value)
+                self.columns[name] = (value.dtype, value.shape)
+            row_bytes = sum(dtype.itemsize * int(np.prod(shape))
+                            for (dtype, shape) in self.columns.values())
+            self.shard_rows = max(1, self.shard_bytes // row_bytes)
+            self._allocate()
+        index = self.filled
+        for (name, value) in row.items():
+            self.buffer[name][index] = value
+        self.filled += 1
+        self.rows   += 1
+        if self.filled == self.shard_rows:
+            self.flush()
+
+    def flush(self):
+        r""" hand the buffered rows to the writer thread as one shard """
+        if self.error is not None:
+            raise RuntimeError('shard writer failed: %s' % self.error)
+        if not self.filled:
+            return
+        columns = dict((name, array[:self.filled]) for (name, array) in self.buffer.items())
+        self.queue.put((self.number, columns))
+        self.number += 1
+        self._allocate()
+
+    def close(self):
+        r""" write the buffered rows and any queued shards, then stop """
+        if self.thread is None:
+            return
+        try:
+            if self.columns is not None and self.error is None:
+                self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise RuntimeError('shard writer failed: %s' % self.error)
+
+    def _writer(self):
+        save = np.savez_compressed if self.compress else np.savez
+        try:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    break
+                (number, columns) = entry
+                name = 'shard-%06d.npz' % number
+                path = os.path.join(self.directory, name)
+                # write aside and rename, so a reader never sees half a shard
+                with open(path + '.tmp', 'wb') as f:
+                    save(f, **columns)
+                os.replace(path + '.tmp', path)
+                rows = len(next(iter(columns.values())))
+                self.shards.append({'file': name, 'rows': rows,
+                                    'bytes': os.path.getsize(path)})
+                self._write_index()
+        except Exception as e:
+            self.error = e
+            # keep draining so a flush already waiting on a full queue
+            # gets through and close's None is seen
+            while self.queue.get() is not None:
+                pass
+
+    def _write_index(self):
+        index = {'shards': self.shards,
+                 'rows': sum(shard['rows'] for shard in self.shards),
+                 'compressed': self.compress,
+                 'columns': dict((name, [dtype.str, list(shape)])
+                                 for (name, (dtype, shape)) in self.columns.items())}
+        path = os.path.join(self.directory, INDEX)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+
+def memmap_member(path, member):
+    r"""
+    Memory map an array stored uncompressed in an NPZ file
+
+    Parameters
+    ----------
+    path   : NPZ file name
+    member : ZipInfo of the array's .npy member
+
+    """
+    with open(path, 'rb') as f:
+        f.seek(member.header_offset)
+        (signature, name_length, extra_length) = LOCAL_HEADER.unpack(
+            f.read(LOCAL_HEADER.size))
+        if signature != b'PK\x03\x04':
+            raise ValueError('bad zip member in %s' % path)
+        f.seek(name_length + extra_length, os.SEEK_CUR)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            (shape, fortran, dtype) = np.lib.format.read_array_header_1_0(f)
+        else:
+            (shape, fortran, dtype) = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if not shape or 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran else 'C')
+
+
+class ShardReader:
+    r"""
+    ShardReader Class
+        Reads a directory written by ShardWriter without loading more
+        than one shard at a time
+
+    Attributes
+    ----------
+    directory : dataset directory
+    index     : contents of index.json
+    rows      : total rows
+
+    Methods
+    -------
+    shard   : return the columns of one shard
+    batches : yield dicts of column arrays, a batch of rows at a time
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX)) as f:
+            self.index = json.load(f)
+        self.rows = self.index['rows']
+
+    def __len__(self):
+        return self.rows
+
+    def shard(self, number, columns=None):
+        r"""
+        Return a dict of column name to array for one shard. Stored
+        (uncompressed) members are memory mapped, deflated ones read.
+
+        Parameters
+        ----------
+        number  : shard position in the index
+        columns : names of the columns wanted, None for all
+
+        """
+        path   = os.path.join(self.directory, self.index['shards'][number]['file'])
+        result = {}
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                name = member.filename[:-len('.npy')]
+                if columns is not None and name not in columns:
+                    continue
+                if member.compress_type == zipfile.ZIP_STORED:
+                    result[name] = memmap_member(path, member)
+                else:
+                    with archive.open(member) as f:
+                        result[name] = np.lib.format.read_array(f)
+        return result
+
+    def batches(self, size=1024, columns=None):
+        r"""
+        Yield dicts of column arrays of up to size rows, in order. Batches
+        don't span shards, so the last of each shard may be short.
+
+        Parameters
+        ----------
+        size    : rows per batch
+        columns : names of the columns wanted, None for all
+
+        """
+        for number in range(len(self.index['shards'])):
+            shard = self.shard(number, columns)
+            rows  = len(next(iter(shard.values())))
+            for start in range(0, rows, size):
+                yield dict((name, array[start:start + size])
+                           for (name, array) in shard.items())
+
+
+def record(directory, games, layout='classic', shard_bytes=64 << 20, compress=True,
+           explore=0.1, seed=0, max_ticks=5000):
+    r"""
+    Record games steered by sweep.Autopilot, taking a random action
+    instead with probability explore
+
+    Returns
+    -------
+    dict of transitions, shards, bytes written and transitions per second
+
+    """
+    keys  = random.Random(seed)
+    grid  = sweep.load_layout(layout, 4)
+    start = clock()
+    with ShardWriter(directory, shard_bytes, compress) as writer:
+        for game in range(games):
+            maze     = pm.Maze(grid, backend='null', seed=seed + game)
+            recorder = Recorder(maze, writer, game)
+            pilot    = sweep.Autopilot(maze)
+            done     = False
+            while not done and maze.ticks < max_ticks:
+                if keys.random() < explore:
+                    action = keys.randrange(len(ACTIONS))
+                else:
+                    action = ACTIONS.index(pilot.key())
+                done = recorder.step(action)
+            maze.close()
+    elapsed = clock() - start
+    return {'transitions': writer.rows,
+            'shards': len(writer.shards),
+            'bytes': sum(shard['bytes'] for shard in writer.shards),
+            'transitions_per_sec': writer.rows / elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PacMan trajectory datasets')
+    commands = parser.add_subparsers(dest='command')
+    recording = commands.add_parser('record', help='record autopilot games')
+    recording.add_argument('directory')
+    recording.add_argument('--games', type=int, default=10)
+    recording.add_argument('--layout', default='classic',
+                           help="'classic' or 'WxH[:seed]', as in sweep.py")
+    recording.add_argument('--shard-mb', type=float, default=64,
+                           help='uncompressed size of a shard')
+    recording.add_argument('--stored', action='store_true',
+                           help="don't compress, so shards can be memory mapped")
+    recording.add_argument('--explore', type=float, default=0.1,
+                           help='probability of a random action')
+    recording.add_argument('--seed', type=int, default=0)
+    info = commands.add_parser('info', help='summarise a dataset')
+    info.add_argument('directory')
+    args = parser.parse_args(argv)
+    if args.command == 'record':
+        result = record(args.directory, args.games, args.layout,
+                        int(args.shard_mb * (1 << 20)), not args.stored, args.explore,
+                        args.seed)
+    elif args.command == 'info':
+        reader = ShardReader(args.directory)
+        result = {'transitions': len(reader), 'shards': len(reader.index['shards']),
+                  'columns': reader.index['columns'], 'episodes': 0, 'reward': 0.0}
+        for batch in reader.batches(1 << 16, ['reward', 'done']):
+            result['episodes'] += int(batch['done'].sum())
+            result['reward']   += float(batch['reward'].sum())
+    else:
+        parser.error('give a command')
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Publish/subscribe event bus for PacMan game events
+
+Components subscribe to the event types they care about instead of the
+maze looping over every mover. Subscribers are called either at once
+(game logic that must react within the tick) or in a batch when the
+maze flushes the bus at the end of the tick (stats, recorders,
+renderers and other observers outside the hot loop).
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import collections
+
+
+# EVENTS
+# place is a map location; pacman/ghost are the movers involved;
+# start is where pacman was at the start of the tick
+FoodEaten     = collections.namedtuple('FoodEaten',     ['place'])
+CapsuleEaten  = collections.namedtuple('CapsuleEaten',  ['place'])
+GhostCaptured = collections.namedtuple('GhostCaptured', ['ghost', 'place'])
+PacmanMoved   = collections.namedtuple('PacmanMoved',   ['pacman', 'place', 'start'])
+Won           = collections.namedtuple('Won',           [])
+Lost          = collections.namedtuple('Lost',          ['place'])
+
+EVENT_TYPES = (FoodEaten, CapsuleEaten, GhostCaptured, PacmanMoved, Won, Lost)
+
+
+class EventBus:
+    r"""
+    EventBus Class
+        Delivers typed events to the subscribers of that type only. Not
+        thread safe: publish and flush from the simulation thread.
+
+    Attributes
+    ----------
+    immediate : event type to handlers called during publish
+    batched   : event type to handlers called by flush
+    queued    : events waiting for flush
+
+    Methods
+    -------
+    subscribe   : register a handler for an event type
+    unsubscribe : remove a handler
+    publish     : deliver an event
+    flush       : deliver queued events to batched handlers
+
+    """
+
+    def __init__(self):
+        self.immediate = {}
+        self.batched   = {}
+        self.queued    = []
+
+    def subscribe(self, event_type, handler, batched=False):
+        r"""
+        Register handler(event) for events of event_type
+
+        Parameters
+        ----------
+        event_type : one of EVENT_TYPES (or any class)
+        handler    : function taking the event
+        batched    : T/F call at flush() instead of during publish()
+
+        """
+        table = self.batched if batched else self.immediate
+        table.setdefault(event_type, []).append(handler)
+
+    def unsubscribe(self, event_type, handler):
+        r""" remove handler from both tables for event_type, if present """
+        for table in (self.immediate, self.batched):
+            handlers = table.get(event_type)
+            if handlers and handler in handlers:
+                handlers.remove(handler)
+                if not handlers:
+                    del table[event_type]
+
+    def publish(self, event):
+        r"""
+        Deliver event to immediate subscribers now, and queue it for
+        batched subscribers
+
+        Parameters
+        ----------
+        event : instance of a subscribed event type
+
+        """
+        event_type = type(event)
+        handlers   = self.immediate.get(event_type)
+        if handlers:
+            for handler in list(handlers):
+                handler(event)
+        if event_type in self.batched:
+            self.queued.append(event)
+
+    def flush(self):
+        r""" deliver queued events to batched subscribers, in order """
+        if not self.queued:
+            return
+        (queued, self.queued) = (self.queued, [])
+        for event in queued:
+            for handler in list(self.batched.get(type(event), ())):
+                handler(event)
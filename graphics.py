@@ -153,12 +153,18 @@ __version__ = "4.3"
 #     Added ability to set text atttributes.
 #     Added Entry boxes.
 
-import time, os, sys
+import time, os, math, struct, threading, zlib, collections, json
 
 try:  # import as appropriate for 2.x vs. 3.x
-   import tkinter as tk
-except:
-   import Tkinter as tk
+   import queue
+except ImportError:
+   import Queue as queue
+
+# tkinter and numpy are imported on first use (see _getRoot and
+#   _importNumpy) so that importing this module is cheap and needs
+#   no display.
+tk = None
+np = None
 
 
 ##########################################################################
@@ -172,56 +178,113 @@ OBJ_ALREADY_DRAWN = "Object currently drawn"
 UNSUPPORTED_METHOD = "Object doesn't support operation"
 BAD_OPTION = "Illegal option value"
 DEAD_THREAD = "Graphics thread quit unexpectedly"
-
-_root = tk.Tk()
-_root.withdraw()
+NO_INPUT = "Backend does not receive input events"
+NO_NUMPY = "The raster backend requires numpy"
+
+_root = None
+
+def _getRoot():
+    # Returns the shared Tk root, creating it (hidden) on first use
+    global _root, tk
+    if _root is None:
+        if tk is None:
+            try:  # import as appropriate for 2.x vs. 3.x
+               import tkinter as tk
+            except ImportError:
+               import Tkinter as tk
+        _root = tk.Tk()
+        _root.withdraw()
+    return _root
+
+def _importNumpy():
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise GraphicsError(NO_NUMPY)
+    return np
 
 def update():
-    _root.update()
+    if _root is not None:
+        _root.update()
 
 ############################################################################
 # Graphics classes start here
 
-class GraphWin(tk.Canvas):
+class GraphWin:
 
-    """A GraphWin is a toplevel window for displaying graphics."""
+    """A GraphWin is a toplevel window for displaying graphics.
+
+    Drawing is delegated to a rendering backend (see Backend). By
+    default this is a Tk window; pass backend="raster" (or call
+    setDefaultBackend) to draw into an off-screen NumPy framebuffer
+    instead."""
 
     def __init__(self, title="Graphics Window",
-                 width=200, height=200, autoflush=True):
-        master = tk.Toplevel(_root)
-        master.protocol("WM_DELETE_WINDOW", self.close)
-        tk.Canvas.__init__(self, master, width=width, height=height)
-        self.master.title(title)
-        self.pack()
-        master.resizable(0,0)
+                 width=200, height=200, autoflush=True, backend=None):
+        if backend is None:
+            backend = _defaultBackend
+        if isinstance(backend, str):
+            if backend not in BACKENDS:
+                raise GraphicsError("unknown backend: %s" % backend)
+            backend = BACKENDS[backend]
         self.foreground = "black"
         self.items = []
         self.mouseX = None
         self.mouseY = None
-        self.bind("<Button-1>", self._onClick)
-        self.bind_all("<Key>", self._onKey)
         self.height = height
         self.width = width
         self.autoflush = autoflush
         self._mouseCallback = None
         self.trans = None
         self.closed = False
-        master.lift()
         self.lastKey = ""
-        if autoflush: _root.update()
+        # key presses and clicks in arrival order (see nextEvent)
+        self.events = collections.deque(maxlen=256)
+        self._eventLock = threading.Lock()
+        # objects with configuration changes waiting for the next update
+        self._pending = {}
+        self.recorder = None
+        self.backend = backend(self, title, width, height)
+        if autoflush: self.backend.update()
+
+    def __getattr__(self, name):
+        # Canvas operations (create_line, delete, itemconfig, ...) are
+        # answered by the backend, so a GraphWin can still be used like
+        # the Tk canvas it used to be.
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
 
     def __checkOpen(self):
         if self.closed:
             raise GraphicsError("window is closed")
 
     def _onKey(self, evnt):
-        self.lastKey = evnt.keysym
+        self.sendKey(evnt.keysym)
+
+    def sendKey(self, key):
+        """Queue a key press as if it came from the keyboard"""
+        self.lastKey = key
+        self._post(InputEvent("key", key=key))
+
+    def sendClick(self, x, y):
+        """Queue a mouse click at raw window pixel (x,y)"""
+        self.mouseX = x
+        self.mouseY = y
+        self._post(InputEvent("click", x=x, y=y))
+
+    def _post(self, event):
+        with self._eventLock:
+            self.events.append(event)
+        self.backend.notify()
 
 
     def setBackground(self, color):
         """Set background color of the window"""
         self.__checkOpen()
-        self.config(bg=color)
+        self.backend.setBackground(color)
         self.__autoflush()
 
     def setCoords(self, x1, y1, x2, y2):
@@ -234,9 +297,16 @@ class GraphWin(tk.Canvas):
         """Close the window"""
 
         if self.closed: return
+        self.stopRecording()
         self.closed = True
-        self.master.destroy()
+        self.backend.notify()  # wake anything blocked in nextEvent
+        self.backend.close()
         self.__autoflush()
+        # drawn objects and the backend point back at the window; let go
+        # of them so a closed window is freed without the cycle collector
+        self.items = []
+        self._pending.clear()
+        self.backend.win = None
 
 
     def isClosed(self):
@@ -247,9 +317,46 @@ class GraphWin(tk.Canvas):
         return not self.closed
 
 
+    def isInteractive(self):
+        """Return True if the window can deliver mouse and key input"""
+        return self.backend.interactive
+
+
+    def startRecording(self, directory, format="png", maxQueue=64):
+        """Capture every frame shown by update() into directory. See
+        FrameRecorder for the formats. Returns the recorder."""
+        self.stopRecording()
+        self.recorder = FrameRecorder(self, directory, format, maxQueue)
+        return self.recorder
+
+
+    def stopRecording(self):
+        """Stop recording, wait for queued frames to be written and
+        return the recorder (or None if not recording)"""
+        recorder = self.recorder
+        if recorder is not None:
+            self.recorder = None
+            recorder.close()
+        return recorder
+
+
+    def saveFrame(self, filename):
+        """Write the current frame to filename: a PNG for raster frames,
+        postscript for Tk. Raises GraphicsError on backends without
+        frames."""
+        self.__checkOpen()
+        frame = self.backend.snapshot()
+        if isinstance(frame, str):
+            data = frame.encode("latin-1")
+        else:
+            data = _encodePNG(frame)
+        with open(filename, "wb") as f:
+            f.write(data)
+
+
     def __autoflush(self):
         if self.autoflush:
-            _root.update()
+            self.backend.update()
 
 
     def plot(self, x, y, color="black"):
@@ -269,21 +376,87 @@ class GraphWin(tk.Canvas):
     def flush(self):
         """Update drawing to the window"""
         self.__checkOpen()
-        self.update_idletasks()
+        self._flushConfig()
+        self.backend.flush()
+
+    def update(self):
+        """Send batched configuration changes to the backend and
+        process pending events"""
+        self._flushConfig()
+        self.backend.update()
+        if self.recorder is not None:
+            self.recorder.capture()
+
+    def _queueConfig(self, item):
+        # Defer an item's configuration change until the next update.
+        # Repeated changes to the same item within a frame collapse
+        # into a single itemconfig call.
+        self._pending[item] = True
+
+    def _flushConfig(self):
+        if not self._pending: return
+        pending = self._pending
+        self._pending = {}
+        for item in pending:
+            if item.canvas is self:
+                item._pushConfig()
+
+    def pollEvents(self, kind=None):
+        """Remove and return the queued events of kind ("key", "click"
+        or None for all) in arrival order. Never blocks."""
+        with self._eventLock:
+            if kind is None:
+                taken = list(self.events)
+                self.events.clear()
+                return taken
+            taken = [e for e in self.events if e.kind == kind]
+            if taken:
+                kept = [e for e in self.events if e.kind != kind]
+                self.events.clear()
+                self.events.extend(kept)
+            return taken
+
+    def _takeEvent(self, kind):
+        # Remove and return the oldest queued event of kind, or None
+        with self._eventLock:
+            for event in self.events:
+                if kind is None or event.kind == kind:
+                    self.events.remove(event)
+                    return event
+        return None
+
+    def nextEvent(self, kind=None, timeout=None):
+        """Wait for the next event of kind ("key", "click" or None for
+        either) and return it, or None if timeout seconds pass first.
+        Waiting is driven by the backend's event loop, not polling."""
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            event = self._takeEvent(kind)
+            if event is not None:
+                return event
+            if self.isClosed(): raise GraphicsError("nextEvent in closed window")
+            if not self.backend.interactive: raise GraphicsError(NO_INPUT)
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+            self._flushConfig()
+            self.backend.waitEvent(remaining)
 
     def getMouse(self):
         """Wait for mouse click and return Point object representing
         the click"""
         self.update()      # flush any prior clicks
-        self.mouseX = None
-        self.mouseY = None
-        while self.mouseX == None or self.mouseY == None:
-            self.update()
+        self.pollEvents("click")
+        try:
+            event = self.nextEvent("click")
+        except GraphicsError:
             if self.isClosed(): raise GraphicsError("getMouse in closed window")
-            time.sleep(.1) # give up thread
-        x,y = self.toWorld(self.mouseX, self.mouseY)
-        self.mouseX = None
-        self.mouseY = None
+            raise
+        x,y = self.toWorld(event.x, event.y)
         return Point(x,y)
 
     def checkMouse(self):
@@ -292,34 +465,32 @@ class GraphWin(tk.Canvas):
         if self.isClosed():
             raise GraphicsError("checkMouse in closed window")
         self.update()
-        if self.mouseX != None and self.mouseY != None:
-            x,y = self.toWorld(self.mouseX, self.mouseY)
-            self.mouseX = None
-            self.mouseY = None
+        clicks = self.pollEvents("click")
+        if clicks:
+            x,y = self.toWorld(clicks[-1].x, clicks[-1].y)
             return Point(x,y)
         else:
             return None
 
     def getKey(self):
         """Wait for user to press a key and return it as a string."""
-        self.lastKey = ""
-        while self.lastKey == "":
-            self.update()
+        try:
+            return self.nextEvent("key").key
+        except GraphicsError:
             if self.isClosed(): raise GraphicsError("getKey in closed window")
-            time.sleep(.1) # give up thread
-
-        key = self.lastKey
-        self.lastKey = ""
-        return key
+            raise
 
     def checkKey(self):
-        """Return last key pressed or None if no key pressed since last call"""
+        """Return the oldest key pressed since the last call, or ""
+        if there is none. Keys pressed in quick succession are
+        returned by successive calls rather than lost."""
         if self.isClosed():
             raise GraphicsError("checkKey in closed window")
         self.update()
-        key = self.lastKey
-        self.lastKey = ""
-        return key
+        event = self._takeEvent("key")
+        if event is None:
+            return ""
+        return event.key
 
     def getHeight(self):
         """Return the height of the window"""
@@ -347,8 +518,7 @@ class GraphWin(tk.Canvas):
         self._mouseCallback = func
 
     def _onClick(self, e):
-        self.mouseX = e.x
-        self.mouseY = e.y
+        self.sendClick(e.x, e.y)
         if self._mouseCallback:
             self._mouseCallback(Point(e.x, e.y))
 
@@ -357,6 +527,7 @@ class GraphWin(tk.Canvas):
 
     def delItem(self, item):
         self.items.remove(item)
+        self._pending.pop(item, None)
 
     def redraw(self):
         for item in self.items[:]:
@@ -365,6 +536,25 @@ class GraphWin(tk.Canvas):
         self.update()
 
 
+class InputEvent:
+
+    """A key press or mouse click received by a GraphWin. kind is "key"
+    (with key set to the Tk keysym) or "click" (with raw window pixel
+    x and y); time is the time.time() the event arrived."""
+
+    def __init__(self, kind, key=None, x=None, y=None):
+        self.kind = kind
+        self.key = key
+        self.x = x
+        self.y = y
+        self.time = time.time()
+
+    def __repr__(self):
+        if self.kind == "key":
+            return "InputEvent(key=%r)" % (self.key,)
+        return "InputEvent(click=(%r, %r))" % (self.x, self.y)
+
+
 class Transform:
 
     """Internal class for 2-D coordinate transformations"""
@@ -425,6 +615,10 @@ class GraphicsObject:
             config[option] = DEFAULT_CONFIG[option]
         self.config = config
 
+        # applied holds the option values Tk currently has for the drawn
+        #    item, so reconfiguring only sends the options that changed.
+        self.applied = {}
+
     def setFill(self, color):
         """Set interior color to color"""
         self._reconfig("fill", color)
@@ -448,9 +642,10 @@ class GraphicsObject:
         if graphwin.isClosed(): raise GraphicsError("Can't draw to closed window")
         self.canvas = graphwin
         self.id = self._draw(graphwin, self.config)
+        self.applied = self.config.copy()
         graphwin.addItem(self)
         if graphwin.autoflush:
-            _root.update()
+            graphwin.backend.update()
 
 
     def undraw(self):
@@ -463,9 +658,10 @@ class GraphicsObject:
             self.canvas.delete(self.id)
             self.canvas.delItem(self)
             if self.canvas.autoflush:
-                _root.update()
+                self.canvas.backend.update()
         self.canvas = None
         self.id = None
+        self.applied = {}
 
 
     def move(self, dx, dy):
@@ -485,20 +681,38 @@ class GraphicsObject:
                 y = dy
             self.canvas.move(self.id, x, y)
             if canvas.autoflush:
-                _root.update()
+                canvas.backend.update()
 
     def _reconfig(self, option, setting):
         # Internal method for changing configuration of the object
         # Raises an error if the option does not exist in the config
         #    dictionary for this object
+        # Windows without autoflush batch the change until their next
+        #    update; otherwise only the changed options are sent at once.
         if option not in self.config:
             raise GraphicsError(UNSUPPORTED_METHOD)
         options = self.config
         options[option] = setting
-        if self.canvas and not self.canvas.isClosed():
-            self.canvas.itemconfig(self.id, options)
-            if self.canvas.autoflush:
-                _root.update()
+        canvas = self.canvas
+        if canvas and not canvas.isClosed():
+            if not canvas.autoflush:
+                canvas._queueConfig(self)
+            elif self._pushConfig():
+                canvas.backend.update()
+
+    def _pushConfig(self):
+        # Internal method sending Tk the options that differ from the
+        #    last applied values. Returns True if anything was sent.
+        applied = self.applied
+        changed = {}
+        for option, setting in self.config.items():
+            if applied.get(option) != setting:
+                changed[option] = setting
+        if not changed:
+            return False
+        self.canvas.itemconfig(self.id, changed)
+        applied.update(changed)
+        return True
 
 
     def _draw(self, canvas, options):
@@ -513,9 +727,12 @@ class GraphicsObject:
 
 
 class Point(GraphicsObject):
+    # a class level alias, an instance attribute bound method would make
+    # every point a reference cycle only the garbage collector can free
+    setFill = GraphicsObject.setOutline
+
     def __init__(self, x, y):
         GraphicsObject.__init__(self, ["outline", "fill"])
-        self.setFill = self.setOutline
         self.x = x
         self.y = y
 
@@ -611,10 +828,11 @@ class Circle(Oval):
 
 class Line(_BBox):
 
+    setOutline = GraphicsObject.setFill
+
     def __init__(self, p1, p2):
         _BBox.__init__(self, p1, p2, ["arrow","fill","width"])
         self.setFill(DEFAULT_CONFIG['outline'])
-        self.setOutline = self.setFill
 
     def clone(self):
         other = Line(self.p1, self.p2)
@@ -651,27 +869,41 @@ class Polygon(GraphicsObject):
     def getPoints(self):
         return list(map(Point.clone, self.points))
 
+    def setPoints(self, points):
+        """Move the vertices to points, a list of Points, changing the
+        drawn item in place rather than drawing a new one"""
+        self.points = list(map(Point.clone, points))
+        canvas = self.canvas
+        if canvas and not canvas.isClosed():
+            args = []
+            for p in self.points:
+                args.extend(canvas.toScreen(p.x, p.y))
+            canvas.coords(self.id, *args)
+            if canvas.autoflush:
+                canvas.backend.update()
+
     def _move(self, dx, dy):
         for p in self.points:
             p.move(dx,dy)
 
     def _draw(self, canvas, options):
-        args = [canvas]
+        args = []
         for p in self.points:
             x,y = canvas.toScreen(p.x,p.y)
             args.append(x)
             args.append(y)
         args.append(options)
-        return GraphWin.create_polygon(*args)
+        return canvas.create_polygon(*args)
 
 class Text(GraphicsObject):
 
+    setOutline = GraphicsObject.setFill
+
     def __init__(self, p, text):
         GraphicsObject.__init__(self, ["justify","fill","text","font"])
         self.setText(text)
         self.anchor = p.clone()
         self.setFill(DEFAULT_CONFIG['outline'])
-        self.setOutline = self.setFill
 
     def _draw(self, canvas, options):
         p = self.anchor
@@ -727,7 +959,8 @@ class Entry(GraphicsObject):
         self.anchor = p.clone()
         #print self.anchor
         self.width = width
-        self.text = tk.StringVar(_root)
+        root = _getRoot()
+        self.text = tk.StringVar(root)
         self.text.set("")
         self.fill = "gray"
         self.color = "black"
@@ -760,7 +993,7 @@ class Entry(GraphicsObject):
     def clone(self):
         other = Entry(self.anchor, self.width)
         other.config = self.config.copy()
-        other.text = tk.StringVar()
+        other.text = tk.StringVar(_getRoot())
         other.text.set(self.text.get())
         other.fill = self.fill
         return other
@@ -817,11 +1050,12 @@ class Image(GraphicsObject):
         self.anchor = p.clone()
         self.imageId = Image.idCount
         Image.idCount = Image.idCount + 1
+        root = _getRoot()
         if len(pixmap) == 1: # file name provided
-            self.img = tk.PhotoImage(file=pixmap[0], master=_root)
+            self.img = tk.PhotoImage(file=pixmap[0], master=root)
         else: # width and height provided
             width, height = pixmap
-            self.img = tk.PhotoImage(master=_root, width=width, height=height)
+            self.img = tk.PhotoImage(master=root, width=width, height=height)
 
     def _draw(self, canvas, options):
         p = self.anchor
@@ -889,6 +1123,918 @@ class Image(GraphicsObject):
         self.img.write( filename, format=ext)
 
 
+##########################################################################
+# Rendering backends
+#
+# A GraphWin hands all of its drawing to a backend object. Backends
+# speak a small subset of the Tk canvas protocol: create_* methods take
+# screen coordinates followed by an optional options dictionary and
+# return an integer item id that delete, move, coords and itemconfig
+# accept. Anything that is not canvas specific (title, events, closing)
+# is also owned by the backend.
+
+class Backend:
+
+    """Base class for rendering backends.
+
+    Subclasses are constructed with the owning GraphWin plus the window
+    title, width and height. A backend that can deliver input sets
+    interactive to True and reports clicks and key presses through the
+    window's _onClick and _onKey methods."""
+
+    interactive = False
+
+    def __init__(self, win, title, width, height):
+        self.win = win
+        self.title = title
+        self.width = width
+        self.height = height
+
+    def create_line(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def create_rectangle(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def create_oval(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def create_polygon(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def create_text(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def create_image(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def create_window(self, *args, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def delete(self, item):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def move(self, item, dx, dy):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def coords(self, item, *coords):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def itemconfig(self, item, options=None, **kw):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def setBackground(self, color):
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def snapshot(self):
+        """Return a copy of the current frame for recording, either an
+        RGB array or postscript text"""
+        raise GraphicsError(UNSUPPORTED_METHOD)
+
+    def update(self):
+        """Bring the display up to date and process pending events"""
+        pass
+
+    def waitEvent(self, timeout=None):
+        """Process events until the window is notified of one or
+        timeout seconds pass"""
+        raise GraphicsError(NO_INPUT)
+
+    def notify(self):
+        """Called by the window whenever an event is queued"""
+        pass
+
+    def flush(self):
+        """Bring the display up to date without processing events"""
+        self.update()
+
+    def close(self):
+        pass
+
+
+class TkBackend(Backend):
+
+    """Backend drawing into a Tk canvas in its own toplevel window"""
+
+    interactive = True
+
+    def __init__(self, win, title, width, height):
+        Backend.__init__(self, win, title, width, height)
+        root = _getRoot()
+        master = tk.Toplevel(root)
+        master.protocol("WM_DELETE_WINDOW", win.close)
+        self.widget = tk.Canvas(master, width=width, height=height)
+        master.title(title)
+        self.widget.pack()
+        master.resizable(0,0)
+        self.widget.bind("<Button-1>", win._onClick)
+        self.widget.bind_all("<Key>", win._onKey)
+        master.lift()
+        # bumped on every queued event; waitEvent runs the Tk event
+        #   loop until it changes
+        self.signal = tk.IntVar(root, 0)
+
+    def __getattr__(self, name):
+        # Fall back to the Tk canvas for everything else (master,
+        # bind, postscript, ...).
+        if name == "widget":
+            raise AttributeError(name)
+        return getattr(self.widget, name)
+
+    def create_line(self, *args, **kw):
+        return self.widget.create_line(*args, **kw)
+
+    def create_rectangle(self, *args, **kw):
+        return self.widget.create_rectangle(*args, **kw)
+
+    def create_oval(self, *args, **kw):
+        return self.widget.create_oval(*args, **kw)
+
+    def create_polygon(self, *args, **kw):
+        return self.widget.create_polygon(*args, **kw)
+
+    def create_text(self, *args, **kw):
+        return self.widget.create_text(*args, **kw)
+
+    def create_image(self, *args, **kw):
+        return self.widget.create_image(*args, **kw)
+
+    def create_window(self, *args, **kw):
+        return self.widget.create_window(*args, **kw)
+
+    def delete(self, item):
+        self.widget.delete(item)
+
+    def move(self, item, dx, dy):
+        self.widget.move(item, dx, dy)
+
+    def coords(self, item, *coords):
+        return self.widget.coords(item, *coords)
+
+    def itemconfig(self, item, options=None, **kw):
+        return self.widget.itemconfig(item, options, **kw)
+
+    def setBackground(self, color):
+        self.widget.config(bg=color)
+
+    def snapshot(self):
+        return self.widget.postscript(colormode="color")
+
+    def update(self):
+        _getRoot().update()
+
+    def waitEvent(self, timeout=None):
+        root = _getRoot()
+        timer = None
+        if timeout is not None:
+            timer = root.after(int(timeout * 1000) + 1, self.notify)
+        root.wait_variable(self.signal)
+        if timer is not None:
+            root.after_cancel(timer)
+
+    def notify(self):
+        self.signal.set(self.signal.get() + 1)
+
+    def flush(self):
+        self.widget.update_idletasks()
+
+    def close(self):
+        self.widget.master.destroy()
+
+
+class NullBackend(Backend):
+
+    """Backend that accepts every canvas operation and draws nothing.
+    Runs graphics code without a display when only the cost of the
+    library itself (or of the program driving it) matters."""
+
+    def __init__(self, win, title, width, height):
+        Backend.__init__(self, win, title, width, height)
+        self.nextId = 1
+
+    def _create(self, *args, **kw):
+        item = self.nextId
+        self.nextId = item + 1
+        return item
+
+    create_line = create_rectangle = create_oval = _create
+    create_polygon = create_text = create_image = create_window = _create
+
+    def delete(self, item):
+        pass
+
+    def move(self, item, dx, dy):
+        pass
+
+    def coords(self, item, *coords):
+        return []
+
+    def itemconfig(self, item, options=None, **kw):
+        pass
+
+    def setBackground(self, color):
+        pass
+
+
+class RecordingBackend(NullBackend):
+
+    """Backend that draws nothing but records every canvas call.
+
+    Each create_*, delete, move, coords, itemconfig and update call is
+    appended to trace as a TraceEntry with its time, frame number,
+    item id and arguments. Frames are counted by update() calls, so
+    frameCounts() tells how many canvas operations each frame cost,
+    which makes rendering performance testable without a display. A
+    trace can be saved, loaded and replayed onto any other backend."""
+
+    def __init__(self, win, title, width, height):
+        NullBackend.__init__(self, win, title, width, height)
+        self.trace = []
+        self.frame = 0
+
+    def _record(self, op, item, args, options):
+        self.trace.append(TraceEntry(time.time(), self.frame, op, item,
+                                     tuple(args), options))
+
+    def _recordCreate(self, op, args, kw):
+        coords, options = _splitArgs(args, kw)
+        item = self._create()
+        self._record(op, item, coords, options)
+        return item
+
+    def create_line(self, *args, **kw):
+        return self._recordCreate("create_line", args, kw)
+
+    def create_rectangle(self, *args, **kw):
+        return self._recordCreate("create_rectangle", args, kw)
+
+    def create_oval(self, *args, **kw):
+        return self._recordCreate("create_oval", args, kw)
+
+    def create_polygon(self, *args, **kw):
+        return self._recordCreate("create_polygon", args, kw)
+
+    def create_text(self, *args, **kw):
+        return self._recordCreate("create_text", args, kw)
+
+    def create_image(self, *args, **kw):
+        return self._recordCreate("create_image", args, kw)
+
+    def create_window(self, *args, **kw):
+        return self._recordCreate("create_window", args, kw)
+
+    def delete(self, item):
+        self._record("delete", item, (), {})
+
+    def move(self, item, dx, dy):
+        self._record("move", item, (dx, dy), {})
+
+    def coords(self, item, *coords):
+        if coords:
+            self._record("coords", item, _splitArgs(coords, {})[0], {})
+        return []
+
+    def itemconfig(self, item, options=None, **kw):
+        settings = dict(options or {})
+        settings.update(kw)
+        self._record("itemconfig", item, (), settings)
+
+    def setBackground(self, color):
+        self._record("setBackground", None, (color,), {})
+
+    def update(self):
+        self._record("update", None, (), {})
+        self.frame = self.frame + 1
+
+    def mark(self):
+        """Return a position in the trace for opsSince()"""
+        return len(self.trace)
+
+    def opsSince(self, mark, ops=None):
+        """Number of canvas operations (not counting update) recorded
+        since mark, optionally only those whose name is in ops"""
+        count = 0
+        for entry in self.trace[mark:]:
+            if entry.op == "update":
+                continue
+            if ops is None or entry.op in ops:
+                count = count + 1
+        return count
+
+    def frameCounts(self):
+        """Return a list with, for each frame, a dictionary of operation
+        name to number of calls made while drawing that frame"""
+        frames = [{} for i in range(self.frame + 1)]
+        for entry in self.trace:
+            if entry.op == "update":
+                continue
+            counts = frames[entry.frame]
+            counts[entry.op] = counts.get(entry.op, 0) + 1
+        return frames
+
+    def saveTrace(self, filename):
+        """Write the trace to filename as JSON lines. Images and widgets
+        in options are written by name, which is how Tk refers to them"""
+        with open(filename, "w") as f:
+            for entry in self.trace:
+                f.write(json.dumps(entry._asdict(), default=str) + "\n")
+
+
+TraceEntry = collections.namedtuple("TraceEntry",
+                                    ["time", "frame", "op", "item", "args", "options"])
+
+
+def loadTrace(filename):
+    """Read a trace written by RecordingBackend.saveTrace"""
+    trace = []
+    with open(filename) as f:
+        for line in f:
+            data = json.loads(line)
+            options = data["options"]
+            if isinstance(options.get("font"), list):
+                options["font"] = tuple(options["font"])
+            trace.append(TraceEntry(data["time"], data["frame"], data["op"],
+                                    data["item"], tuple(data["args"]), options))
+    return trace
+
+
+def replayTrace(trace, target, realtime=False):
+    """Reissue a recorded trace against target, a GraphWin or a backend.
+    Item ids are mapped to the ones target hands out. With realtime,
+    calls are paced to match the recorded timestamps."""
+    if isinstance(target, GraphWin):
+        target = target.backend
+    ids = {}
+    start = time.time()
+    first = trace[0].time if trace else 0
+    for entry in trace:
+        if realtime:
+            delay = (entry.time - first) - (time.time() - start)
+            if delay > 0:
+                time.sleep(delay)
+        op = entry.op
+        if op.startswith("create_"):
+            ids[entry.item] = getattr(target, op)(*(list(entry.args) + [dict(entry.options)]))
+        elif op == "delete":
+            target.delete(ids.pop(entry.item, entry.item))
+        elif op == "move":
+            target.move(ids.get(entry.item, entry.item), *entry.args)
+        elif op == "coords":
+            target.coords(ids.get(entry.item, entry.item), *entry.args)
+        elif op == "itemconfig":
+            target.itemconfig(ids.get(entry.item, entry.item), dict(entry.options))
+        elif op == "setBackground":
+            target.setBackground(*entry.args)
+        elif op == "update":
+            target.update()
+
+
+# Named colors understood by the raster backend. The values match Tk 8.6,
+#   which uses the web definitions of green, gray, maroon and purple.
+_COLOR_NAMES = {
+    "black": (0, 0, 0),
+    "white": (255, 255, 255),
+    "red": (255, 0, 0),
+    "green": (0, 128, 0),
+    "blue": (0, 0, 255),
+    "yellow": (255, 255, 0),
+    "cyan": (0, 255, 255),
+    "magenta": (255, 0, 255),
+    "purple": (128, 0, 128),
+    "orange": (255, 165, 0),
+    "pink": (255, 192, 203),
+    "brown": (165, 42, 42),
+    "maroon": (128, 0, 0),
+    "navy": (0, 0, 128),
+    "gray": (128, 128, 128),
+    "grey": (128, 128, 128),
+    "lightgray": (211, 211, 211),
+    "darkgray": (169, 169, 169),
+    "gold": (255, 215, 0),
+    }
+
+_colorCache = {}
+
+def _parseColor(color):
+    # Returns an (r,g,b) tuple, or None for the empty (transparent) color
+    try:
+        return _colorCache[color]
+    except KeyError:
+        pass
+    if color == "" or color is None:
+        rgb = None
+    elif color[0] == "#" and len(color) == 7:
+        rgb = (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+    elif color[0] == "#" and len(color) == 4:
+        rgb = tuple(int(c, 16) * 17 for c in color[1:])
+    elif color.lower().replace(" ", "") in _COLOR_NAMES:
+        rgb = _COLOR_NAMES[color.lower().replace(" ", "")]
+    else:
+        raise GraphicsError(BAD_OPTION)
+    _colorCache[color] = rgb
+    return rgb
+
+
+# 5x7 bitmap font used by the raster backend for Text objects. Each glyph
+#   is seven rows of five bits, most significant bit leftmost. Lower case
+#   letters are drawn with the upper case glyphs.
+_FONT_ROWS = {
+    "0": "0e11131519110e", "1": "040c040404040e", "2": "0e11010204081f",
+    "3": "1f02040201110e", "4": "02060a121f0202",
+    "5": "1f101e0101110e", "6": "0608101e11110e", "7": "1f010204080808",
+    "8": "0e11110e11110e", "9": "0e11110f01020c",
+    "A": "0e1111111f1111", "B": "1e11111e11111e", "C": "0e11101010110e",
+    "D": "1c12111111121c", "E": "1f10101e10101f", "F": "1f10101e101010",
+    "G": "0e11101711110f", "H": "1111111f111111",
+    "I": "0e04040404040e", "J": "0702020202120c", "K": "11121418141211",
+    "L": "1010101010101f", "M": "111b1515111111", "N": "11111915131111",
+    "O": "0e11111111110e", "P": "1e11111e101010", "Q": "0e11111115120d",
+    "R": "1e11111e141211", "S": "0f10100e01011e", "T": "1f040404040404",
+    "U": "1111111111110e", "V": "11111111110a04", "W": "1111111515150a",
+    "X": "11110a040a1111", "Y": "1111110a040404", "Z": "1f01020408101f",
+    " ": "00000000000000", "!": "04040404040004", ".": "00000000000c0c",
+    ",": "000000000c0408", ":": "000c0c000c0c00", ";": "000c0c000c0408",
+    "-": "0000001f000000", "+": "0004041f040400", "/": "00010204081000",
+    "%": "18190204081303", "(": "02040808080402", ")": "08040202020408",
+    "?": "0e110102040004", "=": "00001f001f0000", "'": "0c040800000000",
+    "_": "0000000000001f", "<": "02040810080402", ">": "08040201020408",
+    "*": "0004150e150400", "#": "0a0a1f0a1f0a0a", '"': "0a0a0000000000",
+    }
+
+_glyphCache = {}
+
+def _glyph(char):
+    # Returns the glyph for char as a 7x5 boolean array
+    try:
+        return _glyphCache[char]
+    except KeyError:
+        pass
+    rows = _FONT_ROWS.get(char.upper(), _FONT_ROWS["?"])
+    bits = [int(rows[i:i+2], 16) for i in range(0, 14, 2)]
+    glyph = np.array([[(row >> (4-col)) & 1 for col in range(5)]
+                      for row in bits], dtype=bool)
+    _glyphCache[char] = glyph
+    return glyph
+
+
+def _splitArgs(args, kw):
+    # Splits Tk style create_* arguments into a flat coordinate list and
+    #   an options dictionary.
+    args = list(args)
+    options = {}
+    if args and isinstance(args[-1], dict):
+        options.update(args.pop())
+    options.update(kw)
+    if len(args) == 1 and isinstance(args[0], (list, tuple)):
+        args = list(args[0])
+    coords = []
+    for a in args:
+        if isinstance(a, (list, tuple)):
+            coords.extend(float(c) for c in a)
+        else:
+            coords.append(float(a))
+    return coords, options
+
+
+class RasterBackend(Backend):
+
+    """Backend rendering into an in-memory RGB framebuffer with NumPy.
+
+    Lines, rectangles, ovals, polygons and text are supported; images
+    and embedded widgets are not, and line arrows are ignored. Only the
+    regions touched since the last update are repainted, so animating a
+    few objects over a large static scene stays cheap. The current frame
+    is available from getFrame() as a (height, width, 3) uint8 array."""
+
+    def __init__(self, win, title, width, height):
+        _importNumpy()
+        Backend.__init__(self, win, title, width, height)
+        self.background = _parseColor("#d9d9d9")  # Tk's default canvas color
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+        self.frame[:] = self.background
+        # id -> [kind, coords, options, bbox]; dict order is stacking order
+        self.items = {}
+        self.nextId = 1
+        self.dirty = []
+
+    def _create(self, kind, args, kw):
+        coords, options = _splitArgs(args, kw)
+        item = self.nextId
+        self.nextId = item + 1
+        record = [kind, coords, options, None]
+        record[3] = self._bbox(record)
+        self.items[item] = record
+        self._damage(record[3])
+        return item
+
+    def create_line(self, *args, **kw):
+        return self._create("line", args, kw)
+
+    def create_rectangle(self, *args, **kw):
+        return self._create("rectangle", args, kw)
+
+    def create_oval(self, *args, **kw):
+        return self._create("oval", args, kw)
+
+    def create_polygon(self, *args, **kw):
+        return self._create("polygon", args, kw)
+
+    def create_text(self, *args, **kw):
+        return self._create("text", args, kw)
+
+    def _records(self, item):
+        if item == "all":
+            return list(self.items)
+        if item in self.items:
+            return [item]
+        return []
+
+    def delete(self, item):
+        for i in self._records(item):
+            self._damage(self.items.pop(i)[3])
+
+    def move(self, item, dx, dy):
+        for i in self._records(item):
+            record = self.items[i]
+            coords = record[1]
+            for j in range(0, len(coords), 2):
+                coords[j] += dx
+                coords[j+1] += dy
+            self._reshape(record)
+
+    def coords(self, item, *coords):
+        record = self.items.get(item)
+        if record is None:
+            return []
+        if not coords:
+            return list(record[1])
+        record[1] = _splitArgs(coords, {})[0]
+        self._reshape(record)
+
+    def itemconfig(self, item, options=None, **kw):
+        for i in self._records(item):
+            record = self.items[i]
+            if options:
+                record[2].update(options)
+            record[2].update(kw)
+            self._reshape(record)
+
+    def setBackground(self, color):
+        self.background = _parseColor(color) or self.background
+        self._damage((0, 0, self.width, self.height))
+
+    def update(self):
+        self._render()
+
+    def getFrame(self):
+        """Return the framebuffer after painting any pending changes.
+        The array is live; copy it to keep a frame."""
+        self._render()
+        return self.frame
+
+    def snapshot(self):
+        return self.getFrame().copy()
+
+    def _reshape(self, record):
+        # An item changed geometry or options: repaint old and new area
+        self._damage(record[3])
+        record[3] = self._bbox(record)
+        self._damage(record[3])
+
+    def _damage(self, box):
+        if box is None:
+            return
+        x0, y0, x1, y1 = box
+        x0 = max(x0, 0)
+        y0 = max(y0, 0)
+        x1 = min(x1, self.width)
+        y1 = min(y1, self.height)
+        if x0 < x1 and y0 < y1:
+            self.dirty.append((x0, y0, x1, y1))
+
+    def _bbox(self, record):
+        # Integer pixel box (x0, y0, x1, y1), exclusive upper bound,
+        #   covering everything the item can paint.
+        kind, coords, options, _ = record
+        if kind == "text":
+            x0, y0, x1, y1 = self._textBox(coords, options)
+        else:
+            xs = coords[0::2]
+            ys = coords[1::2]
+            if not xs:
+                return None
+            pad = float(options.get("width", 1)) + 1
+            x0 = min(xs) - pad
+            y0 = min(ys) - pad
+            x1 = max(xs) + pad
+            y1 = max(ys) + pad
+        return (int(math.floor(x0)), int(math.floor(y0)),
+                int(math.ceil(x1)) + 1, int(math.ceil(y1)) + 1)
+
+    def _mergedDirty(self):
+        # Coalesce overlapping damage rectangles
+        rects = self.dirty
+        self.dirty = []
+        merged = []
+        for rect in rects:
+            x0, y0, x1, y1 = rect
+            changed = True
+            while changed:
+                changed = False
+                for other in merged:
+                    ox0, oy0, ox1, oy1 = other
+                    if x0 <= ox1 and ox0 <= x1 and y0 <= oy1 and oy0 <= y1:
+                        merged.remove(other)
+                        x0 = min(x0, ox0)
+                        y0 = min(y0, oy0)
+                        x1 = max(x1, ox1)
+                        y1 = max(y1, oy1)
+                        changed = True
+                        break
+            merged.append((x0, y0, x1, y1))
+        return merged
+
+    def _render(self):
+        if not self.dirty:
+            return
+        for clip in self._mergedDirty():
+            x0, y0, x1, y1 = clip
+            self.frame[y0:y1, x0:x1] = self.background
+            for record in self.items.values():
+                box = record[3]
+                if (box is None or box[0] >= x1 or box[2] <= x0
+                        or box[1] >= y1 or box[3] <= y0):
+                    continue
+                self._paint(record, clip)
+
+    def _paint(self, record, clip):
+        kind, coords, options, box = record
+        # restrict work to the part of the item inside the clip
+        x0 = max(box[0], clip[0])
+        y0 = max(box[1], clip[1])
+        x1 = min(box[2], clip[2])
+        y1 = min(box[3], clip[3])
+        if x0 >= x1 or y0 >= y1:
+            return
+        region = self.frame[y0:y1, x0:x1]
+        # pixel centres of the region
+        ys = np.arange(y0, y1, dtype=float)[:, None] + 0.5
+        xs = np.arange(x0, x1, dtype=float)[None, :] + 0.5
+        width = float(options.get("width", 1))
+        if kind == "line":
+            color = _parseColor(options.get("fill", "black"))
+            if color is None:
+                return
+            mask = np.zeros(region.shape[:2], dtype=bool)
+            for j in range(0, len(coords) - 2, 2):
+                mask |= _segmentMask(xs, ys, coords[j:j+4], width)
+            region[mask] = color
+        elif kind == "rectangle" or kind == "oval":
+            ax, ay, bx, by = coords[:4]
+            cx = (ax + bx) / 2.0
+            cy = (ay + by) / 2.0
+            rx = abs(bx - ax) / 2.0
+            ry = abs(by - ay) / 2.0
+            if kind == "oval":
+                inside = _ellipseMask(xs, ys, cx, cy, rx, ry)
+            else:
+                inside = (abs(xs - cx) <= rx) & (abs(ys - cy) <= ry)
+            fill = _parseColor(options.get("fill", ""))
+            if fill is not None:
+                region[inside] = fill
+            outline = _parseColor(options.get("outline", "black"))
+            if outline is not None and width > 0:
+                half = width / 2.0
+                if kind == "oval":
+                    inner = _ellipseMask(xs, ys, cx, cy, rx - half, ry - half)
+                    outer = _ellipseMask(xs, ys, cx, cy, rx + half, ry + half)
+                else:
+                    inner = ((abs(xs - cx) <= rx - half)
+                             & (abs(ys - cy) <= ry - half))
+                    outer = ((abs(xs - cx) <= rx + half)
+                             & (abs(ys - cy) <= ry + half))
+                region[outer & ~inner] = outline
+        elif kind == "polygon":
+            points = list(zip(coords[0::2], coords[1::2]))
+            fill = _parseColor(options.get("fill", "black"))
+            if fill is not None and len(points) >= 3:
+                inside = np.zeros(region.shape[:2], dtype=bool)
+                for (ax, ay), (bx, by) in zip(points, points[1:] + points[:1]):
+                    if ay == by:
+                        continue
+                    crosses = (ay > ys) != (by > ys)
+                    xcross = ax + (ys - ay) * (bx - ax) / (by - ay)
+                    inside ^= crosses & (xs < xcross)
+                region[inside] = fill
+            outline = _parseColor(options.get("outline", ""))
+            if outline is not None and width > 0:
+                mask = np.zeros(region.shape[:2], dtype=bool)
+                for (ax, ay), (bx, by) in zip(points, points[1:] + points[:1]):
+                    mask |= _segmentMask(xs, ys, (ax, ay, bx, by), width)
+                region[mask] = outline
+        elif kind == "text":
+            self._paintText(record, region, x0, y0)
+
+    def _textLayout(self, coords, options):
+        # Returns (scale, lines, left, top, width, height) for a text
+        #   item anchored at its center like Tk's default.
+        text = str(options.get("text", ""))
+        font = options.get("font", DEFAULT_CONFIG["font"])
+        scale = max(1, int(font[1] / 8.0 + 0.5))
+        lines = text.split("\n")
+        cols = max(len(line) for line in lines)
+        w = cols * 6 * scale
+        h = len(lines) * 8 * scale
+        x, y = coords[0], coords[1]
+        return scale, lines, int(x - w / 2.0), int(y - h / 2.0), w, h
+
+    def _textBox(self, coords, options):
+        scale, lines, left, top, w, h = self._textLayout(coords, options)
+        return left - 1, top - 1, left + w + 2, top + h + 1
+
+    def _paintText(self, record, region, x0, y0):
+        kind, coords, options, box = record
+        color = _parseColor(options.get("fill", "black"))
+        if color is None:
+            return
+        scale, lines, left, top, w, h = self._textLayout(coords, options)
+        justify = options.get("justify", "center")
+        font = options.get("font", DEFAULT_CONFIG["font"])
+        bold = len(font) > 2 and "bold" in font[2]
+        rh, rw = region.shape[:2]
+        for row, line in enumerate(lines):
+            lw = len(line) * 6 * scale
+            if justify == "left":
+                lx = left
+            elif justify == "right":
+                lx = left + w - lw
+            else:
+                lx = left + (w - lw) // 2
+            ly = top + row * 8 * scale
+            for col, char in enumerate(line):
+                glyph = _glyph(char)
+                if scale > 1:
+                    glyph = glyph.repeat(scale, 0).repeat(scale, 1)
+                for dx in ((0, 1) if bold else (0,)):
+                    px = lx + col * 6 * scale - x0 + dx
+                    py = ly - y0
+                    # clip the glyph against the region being painted
+                    sx0 = max(0, -px)
+                    sy0 = max(0, -py)
+                    sx1 = min(glyph.shape[1], rw - px)
+                    sy1 = min(glyph.shape[0], rh - py)
+                    if sx0 >= sx1 or sy0 >= sy1:
+                        continue
+                    target = region[py+sy0:py+sy1, px+sx0:px+sx1]
+                    target[glyph[sy0:sy1, sx0:sx1]] = color
+
+
+def _segmentMask(xs, ys, segment, width):
+    # Pixels whose centres lie within width/2 of the segment
+    ax, ay, bx, by = segment
+    dx = bx - ax
+    dy = by - ay
+    length = dx*dx + dy*dy
+    if length == 0:
+        t = 0.0
+    else:
+        t = np.clip(((xs - ax) * dx + (ys - ay) * dy) / length, 0.0, 1.0)
+    px = xs - (ax + t * dx)
+    py = ys - (ay + t * dy)
+    half = max(width, 1.0) / 2.0
+    return px*px + py*py <= half*half
+
+
+def _ellipseMask(xs, ys, cx, cy, rx, ry):
+    # Pixels whose centres lie inside the axis aligned ellipse
+    if rx <= 0 or ry <= 0:
+        return np.zeros(np.broadcast(xs, ys).shape, dtype=bool)
+    nx = (xs - cx) / rx
+    ny = (ys - cy) / ry
+    return nx*nx + ny*ny <= 1.0
+
+
+class FrameRecorder:
+
+    """Records the frames of a GraphWin without stalling the caller.
+
+    capture() grabs the current frame from the backend and puts it on a
+    bounded queue; a background thread encodes and writes it. If the
+    writer falls behind, frames are dropped (and counted in dropped)
+    rather than blocking the drawing loop.
+
+    Format "png" writes frame_000000.png, ... for raster frames; Tk
+    frames are postscript and are written as frame_000000.eps. Format
+    "raw" appends every frame to frames.raw instead. Both formats write
+    index.txt with one line per frame: number, capture time, file name
+    or byte offset, byte length, height and width (0 for postscript)."""
+
+    def __init__(self, win, directory, format="png", maxQueue=64):
+        if format not in ("png", "raw"):
+            raise GraphicsError(BAD_OPTION)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.win = win
+        self.directory = directory
+        self.format = format
+        self.captured = 0
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self.queue = queue.Queue(maxQueue)
+        self.thread = threading.Thread(target=self._writer)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def capture(self):
+        """Queue the window's current frame. Never blocks."""
+        frame = self.win.backend.snapshot()
+        try:
+            self.queue.put_nowait((self.captured, time.time(), frame))
+        except queue.Full:
+            self.dropped = self.dropped + 1
+        self.captured = self.captured + 1
+
+    def close(self):
+        """Write any queued frames and stop the writer thread"""
+        if self.thread is None: return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise GraphicsError("frame writer failed: %s" % self.error)
+
+    def _writer(self):
+        index = open(os.path.join(self.directory, "index.txt"), "w")
+        raw = None
+        if self.format == "raw":
+            raw = open(os.path.join(self.directory, "frames.raw"), "wb")
+        try:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    break
+                number, stamp, frame = entry
+                if isinstance(frame, str):
+                    data = frame.encode("latin-1")
+                    height = width = 0
+                    ext = "eps"
+                elif self.format == "png":
+                    data = _encodePNG(frame)
+                    height, width = frame.shape[:2]
+                    ext = "png"
+                else:
+                    data = frame.tobytes()
+                    height, width = frame.shape[:2]
+                if raw is not None:
+                    where = str(raw.tell())
+                    raw.write(data)
+                else:
+                    where = "frame_%06d.%s" % (number, ext)
+                    with open(os.path.join(self.directory, where), "wb") as f:
+                        f.write(data)
+                index.write("%d %.6f %s %d %d %d\n"
+                            % (number, stamp, where, len(data), height, width))
+                self.written = self.written + 1
+        except Exception as e:
+            self.error = e
+            # keep draining so capture() keeps dropping instead of failing
+            while self.queue.get() is not None:
+                pass
+        finally:
+            index.close()
+            if raw is not None:
+                raw.close()
+
+
+def _encodePNG(frame, level=1):
+    # Encodes a (height, width, 3) uint8 array as an RGB PNG
+    height, width = frame.shape[:2]
+    rows = np.zeros((height, width*3 + 1), dtype=np.uint8)  # filter byte 0
+    rows[:, 1:] = frame.reshape(height, width*3)
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(rows.tobytes(), level))
+            + chunk(b"IEND", b""))
+
+
+BACKENDS = {"tk": TkBackend, "raster": RasterBackend, "null": NullBackend,
+            "recording": RecordingBackend}
+
+_defaultBackend = os.environ.get("GRAPHICS_BACKEND", "tk")
+
+def setDefaultBackend(backend):
+    """Select the backend used by GraphWins created without an explicit
+    one. backend is a name from BACKENDS or a Backend subclass."""
+    global _defaultBackend
+    if isinstance(backend, str) and backend not in BACKENDS:
+        raise GraphicsError("unknown backend: %s" % backend)
+    _defaultBackend = backend
+
+
 def color_rgb(r,g,b):
     """r,g,b are intensities of red, green, and blue in range(256)
     Returns color specifier string for the resulting color"""
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+Visit heatmaps of PacMan games
+
+A Heatmap holds NumPy counts over the map cells: how long pacman and
+each ghost spent in every cell, and where pacman was caught (Maze.loser)
+and where ghosts were captured. A HeatmapRecorder fills one in while a
+game is played. Heatmaps of the same layout add up, so games played in
+worker processes each return their own and reduce() sums them.
+
+The result is drawn over the maze with graphics.py, in a window or on
+the raster backend for a PNG, so traffic can be seen without replaying
+the games.
+
+usage: python heatmap.py collect [--games N] [--layout L] [--processes N]
+                                 [--output FILE.npz] [--png FILE] [--layer L]
+       python heatmap.py show FILE.npz [--layout L] [--layer L] [--png FILE]
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import argparse
+import functools
+import json
+import math
+import multiprocessing
+
+import numpy as np
+
+import events as ev
+import graphics as gx
+import instrument
+import pacman as pm
+import sweep
+
+clock = instrument.clock
+
+# marks drawn over the heat
+DEATH_COLOR   = 'red'
+CAPTURE_COLOR = 'cyan'
+
+
+class Heatmap:
+    r"""
+    Heatmap Class
+        Per cell counts over the games of one layout
+
+    Attributes
+    ----------
+    occupancy : float64 array (movers, height, width) of ticks spent in
+        each cell; layer 0 is pacman, then the ghosts in layout order
+    deaths    : int64 array (height, width) of places pacman was caught
+    captures  : int64 array (height, width) of places ghosts were captured
+    games     : number of games counted
+    ticks     : ticks counted
+    layout    : pacman.layout_key of the layout counted, or None if
+        not known (files saved before it was stored)
+
+    Methods
+    -------
+    merge : add another Heatmap of the same layout into this one
+    check : raise ValueError unless a maze has this heatmap's layout
+    layer : return the occupancy of pacman, the ghosts or everyone
+    save  : write to an NPZ file
+    load  : read from an NPZ file (class method)
+
+    """
+
+    def __init__(self, width, height, movers, layout=None):
+        self.occupancy = np.zeros((movers, height, width))
+        self.deaths    = np.zeros((height, width), dtype=np.int64)
+        self.captures  = np.zeros((height, width), dtype=np.int64)
+        self.games     = 0
+        self.ticks     = 0
+        self.layout    = layout
+
+    def merge(self, other):
+        r""" add other's counts into this heatmap and return it """
+        known = None not in (self.layout, other.layout)
+        if other.occupancy.shape != self.occupancy.shape or (known and other.layout != self.layout):
+            raise ValueError('heatmaps of different layouts')
+        if self.layout is None:
+            self.layout = other.layout
+        self.occupancy += other.occupancy
+        self.deaths    += other.deaths
+        self.captures  += other.captures
+        self.games     += other.games
+        self.ticks     += other.ticks
+        return self
+
+    def check(self, maze):
+        r""" raise ValueError unless maze is of the layout counted """
+        shape = (len(maze.movables), maze.height, maze.width)
+        if self.occupancy.shape != shape:
+            raise ValueError('heatmap of a %dx%d layout with %d movers, not %dx%d with %d'
+                             % (self.occupancy.shape[2], self.occupancy.shape[1],
+                                self.occupancy.shape[0], shape[2], shape[1], shape[0]))
+        if self.layout is not None and self.layout != maze.layout_report.key:
+            raise ValueError('heatmap of another %dx%d layout' % (shape[2], shape[1]))
+
+    def layer(self, name='all'):
+        r"""
+        Return a (height, width) occupancy array
+
+        Parameters
+        ----------
+        name : 'pacman', 'ghosts', 'all' or a mover index
+
+        """
+        if name == 'pacman':
+            return self.occupancy[0]
+        if name == 'ghosts':
+            return self.occupancy[1:].sum(axis=0)
+        if name == 'all':
+            return self.occupancy.sum(axis=0)
+        return self.occupancy[int(name)]
+
+    def save(self, filename):
+        np.savez_compressed(filename, occupancy=self.occupancy, deaths=self.deaths,
+                            captures=self.captures, games=self.games, ticks=self.ticks,
+                            layout=np.array(self.layout or ''))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            (movers, height, width) = data['occupancy'].shape
+            heatmap = cls(width, height, movers)
+            heatmap.occupancy[...] = data['occupancy']
+            heatmap.deaths[...]    = data['deaths']
+            heatmap.captures[...]  = data['captures']
+            heatmap.games          = int(data['games'])
+            heatmap.ticks          = int(data['ticks'])
+            if 'layout' in data.files:
+                heatmap.layout     = str(data['layout']) or None
+        return heatmap
+
+
+def reduce(heatmaps):
+    r""" sum an iterable of Heatmaps of one layout into the first """
+    return functools.reduce(Heatmap.merge, heatmaps)
+
+
+class HeatmapRecorder:
+    r"""
+    HeatmapRecorder Class
+        Counts one game into a Heatmap. Call step() in place of
+        Maze.tick(); catches and captures arrive as maze events.
+
+    Attributes
+    ----------
+    maze    : Maze played
+    heatmap : Heatmap counted into
+
+    Methods
+    -------
+    step : tick the maze and count where every mover is
+
+    """
+
+    def __init__(self, maze, heatmap=None):
+        if heatmap is None:
+            heatmap = Heatmap(maze.width, maze.height, len(maze.movables),
+                              maze.layout_report.key)
+        self.maze    = maze
+        self.heatmap = heatmap
+        self.cells   = heatmap.occupancy.reshape(len(maze.movables), -1)
+        heatmap.games += 1
+        maze.events.subscribe(ev.Lost, self.lost, batched=True)
+        maze.events.subscribe(ev.GhostCaptured, self.captured, batched=True)
+
+    def lost(self, event):
+        if event.place is not None:
+            (x, y) = (int(round(event.place[0])), int(round(event.place[1])))
+            self.heatmap.deaths[y, x] += 1
+
+    def captured(self, event):
+        (x, y) = (int(round(event.place[0])), int(round(event.place[1])))
+        self.heatmap.captures[y, x] += 1
+
+    def step(self, dt=1.0):
+        r""" tick the maze by dt and count dt in every mover's cell """
+        maze  = self.maze
+        maze.tick(dt)
+        cells = self.cells
+        width = maze.width
+        for (index, mover) in enumerate(maze.movables):
+            (x, y) = mover.nearest_grid_point()
+            cells[index, y*width + x] += maze.last_dt
+        self.heatmap.ticks += 1
+
+
+def play_games(layout, seeds, max_ticks=5000):
+    r"""
+    Play autopilot games on the null backend and return their Heatmap
+
+    Parameters
+    ----------
+    layout    : maze layout
+    seeds     : ghost seeds, one game each
+    max_ticks : ticks after which a game is abandoned
+
+    """
+    heatmap = None
+    for seed in seeds:
+        maze     = pm.Maze(layout, backend='null', seed=seed)
+        recorder = HeatmapRecorder(maze, heatmap)
+        heatmap  = recorder.heatmap
+        pilot    = sweep.Autopilot(maze)
+        while not maze.finished() and maze.ticks < max_ticks:
+            pilot.step()
+            recorder.step()
+        maze.close()
+    return heatmap
+
+
+def _play_task(task):
+    r""" worker process body: (layout, seeds) to a Heatmap """
+    (layout, seeds) = task
+    return play_games(layout, seeds)
+
+
+def collect(layout, games, seed=0, processes=None, chunk=10):
+    r"""
+    Play games in worker processes and reduce their heatmaps into one
+
+    Parameters
+    ----------
+    layout    : maze layout
+    games     : number of games, seeds seed .. seed+games-1
+    seed      : first seed
+    processes : worker processes, None for one per CPU, 0 to play here
+    chunk     : games per task; each task sends back one Heatmap
+
+    """
+    if games < 1:
+        raise ValueError('games must be at least 1, got %d' % games)
+    tasks = [(layout, range(start, min(start + chunk, seed + games)))
+             for start in range(seed, seed + games, chunk)]
+    if processes == 0:
+        return reduce(map(_play_task, tasks))
+    pool = multiprocessing.Pool(processes)
+    try:
+        return reduce(pool.imap_unordered(_play_task, tasks))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def heat_color(level):
+    r""" black through red and yellow to white, for level in [0, 1] """
+    red   = min(max(3*level, 0.0), 1.0)
+    green = min(max(3*level - 1, 0.0), 1.0)
+    blue  = min(max(3*level - 2, 0.0), 1.0)
+    return gx.color_rgb(int(red*255), int(green*255), int(blue*255))
+
+
+def overlay(maze, heatmap, layer='all'):
+    r"""
+    Draw a heatmap over a maze's window: a square per visited cell,
+    shaded on a log scale from the least to the most visited, with rings where pacman was caught and ghosts
+    were captured, larger for more
+
+    Parameters
+    ----------
+    maze    : Maze of the heatmap's layout, with a window to draw on
+    heatmap : Heatmap
+    layer   : occupancy layer, as in Heatmap.layer
+
+    Returns
+    -------
+    list of the graphics objects drawn
+
+    Raises
+    ------
+    ValueError if the maze is not of the heatmap's layout
+
+    """
+    heatmap.check(maze)
+    counts = heatmap.layer(layer)
+    if not counts.any():
+        return []
+    low    = math.log(counts[counts > 0].min())
+    span   = math.log(counts.max()) - low or 1.0
+    half   = maze.grid_size * 0.45
+    drawn  = []
+    for (y, x) in zip(*np.nonzero(counts)):
+        (sx, sy) = maze.to_screen((int(x), int(y)))
+        square   = gx.Rectangle(gx.Point(sx - half, sy - half), gx.Point(sx + half, sy + half))
+        color    = heat_color((math.log(counts[y, x]) - low) / span)
+        square.setFill(color)
+        square.setOutline(color)
+        drawn.append(square)
+    for (marks, color) in ((heatmap.deaths, DEATH_COLOR),
+                           (heatmap.captures, CAPTURE_COLOR)):
+        most = marks.max()
+        for (y, x) in zip(*np.nonzero(marks)):
+            (sx, sy) = maze.to_screen((int(x), int(y)))
+            ring     = gx.Circle(gx.Point(sx, sy), half * (0.3 + 0.7*marks[y, x]/most))
+            ring.setOutline(color)
+            drawn.append(ring)
+    for item in drawn:
+        item.draw(maze.win)
+    return drawn
+
+
+def export_png(layout, heatmap, filename, layer='all'):
+    r""" draw a heatmap over its layout on the raster backend and save a PNG """
+    maze = pm.Maze(layout, backend='raster')
+    try:
+        overlay(maze, heatmap, layer)
+        maze.win.saveFrame(filename)
+    finally:
+        maze.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PacMan visit heatmaps')
+    commands = parser.add_subparsers(dest='command')
+    collecting = commands.add_parser('collect', help='play games and count visits')
+    collecting.add_argument('--games', type=int, default=100)
+    collecting.add_argument('--seed', type=int, default=0)
+    collecting.add_argument('--processes', type=int, default=None,
+                            help='worker processes, 0 to play in this one')
+    collecting.add_argument('--output', metavar='FILE', help='save the heatmap (.npz)')
+    showing = commands.add_parser('show', help='draw a saved heatmap over its maze')
+    showing.add_argument('input', metavar='FILE')
+    for command in (collecting, showing):
+        command.add_argument('--layout', default='classic',
+                             help="'classic' or 'WxH[:seed]', as in sweep.py")
+        command.add_argument('--layer', default='all',
+                             help="'pacman', 'ghosts', 'all' or a mover index")
+        command.add_argument('--png', metavar='FILE', help='export the overlay as a PNG')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('give a command')
+    if args.command == 'collect' and args.games < 1:
+        parser.error('--games must be at least 1')
+    try:
+        layout = sweep.load_layout(args.layout, 4)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.command == 'collect':
+        start   = clock()
+        heatmap = collect(layout, args.games, args.seed, args.processes)
+        elapsed = clock() - start
+        if args.output:
+            heatmap.save(args.output)
+        print(json.dumps({'games': heatmap.games, 'ticks': heatmap.ticks,
+                          'deaths': int(heatmap.deaths.sum()),
+                          'captures': int(heatmap.captures.sum()),
+                          'games_per_sec': heatmap.games / elapsed},
+                         indent=2, sort_keys=True))
+    else:
+        heatmap = Heatmap.load(args.input)
+        maze    = pm.Maze(layout, backend='null')
+        try:
+            heatmap.check(maze)
+        except ValueError as error:
+            parser.error('%s: %s, give its --layout' % (args.input, error))
+        finally:
+            maze.close()
+        if not args.png:
+            maze = pm.Maze(layout)
+            overlay(maze, heatmap, args.layer)
+            maze.prompt_to_close()
+    if args.png:
+        export_png(layout, heatmap, args.png, args.layer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation for the PacMan game loop
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import array
+import collections
+import gc
+import threading
+import time
+import tracemalloc
+
+import graphics as gx
+
+
+def percentile(values, pct):
+    r"""
+    Nearest-rank percentile of a sequence
+
+    Parameters
+    ----------
+    values : sequence of numbers, need not be sorted
+    pct    : float in [0, 100]
+
+    Returns
+    -------
+    float percentile value, or None for an empty sequence
+
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+class LatencyTracker:
+    r"""
+    LatencyTracker Class
+        Follows key presses from the window event, through the tick that
+        consumes them, to the window update that first shows the result.
+        Thread safe: the simulation and drawing may report from different
+        threads.
+
+    Attributes
+    ----------
+    pending : (press time, consume time, tick) waiting to be displayed,
+        the most recent size of them; headless games never display any
+    samples : recent (input->tick, tick->display, input->display) seconds
+
+    Methods
+    -------
+    consumed    : record that a tick consumed a key press
+    displayed   : record that a window update showed a tick
+    percentiles : latency percentiles per stage in milliseconds
+    summary     : printable percentile report
+
+    """
+
+    STAGES = ('input_to_tick', 'tick_to_display', 'input_to_display')
+
+    def __init__(self, size=4096):
+        r"""
+        Parameters
+        ----------
+        size : number of most recent samples and pending presses kept
+
+        """
+        self.lock    = threading.Lock()
+        self.pending = collections.deque(maxlen=size)
+        self.samples = collections.deque(maxlen=size)
+
+    def consumed(self, pressed, tick, when=None):
+        r"""
+        Record that a key press was consumed
+
+        Parameters
+        ----------
+        pressed : time.time() of the key press
+        tick    : number of the tick whose snapshot shows the response
+        when    : time.time() it was consumed, defaults to now
+
+        """
+        if when is None:
+            when = time.time()
+        with self.lock:
+            self.pending.append((pressed, when, tick))
+
+    def displayed(self, tick, when=None):
+        r"""
+        Record that the window now shows the snapshot of tick, resolving
+        every consumed press up to that tick
+
+        Parameters
+        ----------
+        tick : tick number of the snapshot on screen
+        when : time.time() the update finished, defaults to now
+
+        """
+        if when is None:
+            when = time.time()
+        with self.lock:
+            if not self.pending:
+                return
+            waiting = collections.deque(maxlen=self.pending.maxlen)
+            for (pressed, used, used_tick) in self.pending:
+                if used_tick <= tick:
+                    self.samples.append((used - pressed, when - used, when - pressed))
+                else:
+                    waiting.append((pressed, used, used_tick))
+            self.pending = waiting
+
+    def percentiles(self, pcts=(50, 90, 99)):
+        r"""
+        Latency percentiles per stage
+
+        Parameters
+        ----------
+        pcts : percentiles to report
+
+        Returns
+        -------
+        dict of stage name to dict of percentile to milliseconds, plus
+        'count' of samples
+
+        """
+        with self.lock:
+            samples = list(self.samples)
+        result = {'count': len(samples)}
+        for (index, stage) in enumerate(self.STAGES):
+            values = [sample[index] * 1000.0 for sample in samples]
+            result[stage] = dict((pct, percentile(values, pct)) for pct in pcts)
+        return result
+
+    def summary(self, pcts=(50, 90, 99)):
+        r""" printable percentile report """
+        report = self.percentiles(pcts)
+        lines  = ['input latency over %d key presses (ms)' % report['count']]
+        for stage in self.STAGES:
+            cells = []
+            for pct in pcts:
+                value = report[stage][pct]
+                cells.append('p%d %s' % (pct, '-' if value is None else '%.1f' % value))
+            lines.append('  %-16s %s' % (stage, '  '.join(cells)))
+        return '\n'.join(lines)
+
+
+# high resolution timer, falls back to time.time where unavailable
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class TickProfiler:
+    r"""
+    TickProfiler Class
+        Wall time per game loop phase, kept in fixed size ring buffers so
+        recording a sample costs an array store. Each phase is written by
+        one thread, so the simulation and drawing threads of Maze.run can
+        share a profiler.
+
+    Attributes
+    ----------
+    counts : samples recorded per phase
+    rings  : per phase array of the most recent samples in seconds
+    size   : ring buffer length
+
+    Methods
+    -------
+    record      : store one sample for a phase
+    samples     : recent samples of a phase, oldest first
+    percentiles : per phase percentiles in milliseconds
+    summary     : printable percentile report
+    hud_text    : one line per phase of p50/p99 for an on screen display
+
+    """
+
+    PHASES = ('pacman', 'ghosts', 'collision', 'canvas', 'update', 'sleep')
+
+    def __init__(self, size=1024, phases=PHASES):
+        r"""
+        Parameters
+        ----------
+        size   : number of most recent samples kept per phase
+        phases : names of the phases to track
+
+        """
+        self.size   = size
+        self.phases = tuple(phases)
+        self.rings  = dict((phase, array.array('d', [0.0] * size)) for phase in phases)
+        self.counts = dict((phase, 0) for phase in phases)
+
+    def record(self, phase, seconds):
+        r"""
+        Store one sample
+
+        Parameters
+        ----------
+        phase   : name from phases
+        seconds : wall time spent
+
+        """
+        count = self.counts[phase]
+        self.rings[phase][count % self.size] = seconds
+        self.counts[phase] = count + 1
+
+    def samples(self, phase):
+        r""" recent samples of phase in seconds, oldest first """
+        count = self.counts[phase]
+        ring  = self.rings[phase]
+        if count <= self.size:
+            return list(ring[:count])
+        start = count % self.size
+        return list(ring[start:]) + list(ring[:start])
+
+    def percentiles(self, pcts=(50, 90, 99)):
+        r"""
+        Per phase percentiles
+
+        Parameters
+        ----------
+        pcts : percentiles to report
+
+        Returns
+        -------
+        dict of phase name to dict of percentile to milliseconds, plus
+        'mean' milliseconds and sample 'count'
+
+        """
+        result = {}
+        for phase in self.phases:
+            values = [s * 1000.0 for s in self.samples(phase)]
+            stats  = dict((pct, percentile(values, pct)) for pct in pcts)
+            stats['mean']  = sum(values) / len(values) if values else None
+            stats['count'] = self.counts[phase]
+            result[phase]  = stats
+        return result
+
+    def summary(self, pcts=(50, 90, 99)):
+        r""" printable percentile report """
+        report = self.percentiles(pcts)
+        lines  = ['time per phase (ms)']
+        for phase in self.phases:
+            stats = report[phase]
+            cells = []
+            for key in ('mean',) + tuple(pcts):
+                value = stats[key]
+                label = key if key == 'mean' else 'p%d' % key
+                cells.append('%s %s' % (label, '-' if value is None else '%.2f' % value))
+            lines.append('  %-10s %s  (n=%d)' % (phase, '  '.join(cells), stats['count']))
+        return '\n'.join(lines)
+
+    def hud_text(self):
+        r""" one line per phase of p50/p99 milliseconds """
+        report = self.percentiles((50, 99))
+        lines  = []
+        for phase in self.phases:
+            stats = report[phase]
+            if stats[50] is None:
+                continue
+            lines.append('%-9s %6.2f %6.2f' % (phase, stats[50], stats[99]))
+        return '\n'.join(lines)
+
+
+class ProfilerHUD:
+    r"""
+    ProfilerHUD Class
+        On screen text showing a TickProfiler's p50/p99 per phase,
+        refreshed every few frames
+
+    Methods
+    -------
+    update : count a frame and refresh the text when due
+    undraw : remove the text from the window
+
+    """
+
+    def __init__(self, profiler, win, point, every=10, color='white'):
+        r"""
+        Parameters
+        ----------
+        profiler : TickProfiler to display
+        win      : graphics window to draw in
+        point    : graphics Point anchoring the text
+        every    : frames between refreshes
+        color    : text color
+
+        """
+        self.profiler = profiler
+        self.every    = every
+        self.frames   = 0
+        self.text     = gx.Text(point, '')
+        self.text.setTextColor(color)
+        self.text.setFace('courier')
+        self.text.setSize(9)
+        self.text.draw(win)
+
+    def update(self):
+        r""" count a frame and refresh the text when due """
+        self.frames += 1
+        if self.frames % self.every == 0:
+            self.text.setText(self.profiler.hud_text())
+
+    def undraw(self):
+        r""" remove the text from the window """
+        self.text.undraw()
+
+
+class MemoryTracker:
+    r"""
+    MemoryTracker Class
+        Samples tracemalloc totals, live object counts per class and any
+        watched gauges every few ticks, and flags series that only ever
+        grow. Sampling walks the garbage collector's object list, so keep
+        the interval large in long sessions.
+
+    Attributes
+    ----------
+    classes : class names whose live instances are counted
+    every   : ticks between samples
+    gauges  : name to function returning a number, sampled with the rest
+    series  : name to list of (tick, value) samples
+
+    Methods
+    -------
+    watch   : add a gauge to sample
+    tick    : sample if tick is due
+    sample  : sample now
+    growing : names of series that grew at every recent sample
+    report  : printable summary with the top allocation sites
+    stop    : stop tracemalloc if this tracker started it
+
+    """
+
+    CLASSES = ('Point', 'Circle', 'Polygon', 'Line', 'Text', 'Nothing', 'Food',
+               'Capsule', 'Wall', 'Pacman', 'Ghost', 'Snapshot', 'MoverState')
+
+    def __init__(self, every=100, classes=CLASSES, frames=1):
+        r"""
+        Parameters
+        ----------
+        every   : ticks between samples
+        classes : class names whose live instances are counted
+        frames  : stack frames tracemalloc keeps per allocation
+
+        """
+        self.every   = every
+        self.classes = frozenset(classes)
+        self.gauges  = collections.OrderedDict()
+        self.series  = collections.OrderedDict()
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start(frames)
+        self.first   = tracemalloc.take_snapshot()
+
+    def watch(self, name, func):
+        r"""
+        Sample func() as series name
+
+        Parameters
+        ----------
+        name : series name
+        func : function of no arguments returning a number
+
+        """
+        self.gauges[name] = func
+
+    def tick(self, tick):
+        r""" sample if tick is a multiple of every """
+        if tick % self.every == 0:
+            self.sample(tick)
+
+    def sample(self, tick):
+        r""" record every series now, labelled with tick """
+        (current, peak) = tracemalloc.get_traced_memory()
+        values = collections.OrderedDict()
+        values['traced_bytes'] = current
+        values['peak_bytes']   = peak
+        counts = dict((name, 0) for name in sorted(self.classes))
+        for obj in gc.get_objects():
+            name = type(obj).__name__
+            if name in counts:
+                counts[name] += 1
+        for name in sorted(counts):
+            values['live.' + name] = counts[name]
+        for (name, func) in self.gauges.items():
+            values[name] = func()
+        for (name, value) in values.items():
+            self.series.setdefault(name, []).append((tick, value))
+
+    def growing(self, window=5):
+        r"""
+        Names of series that increased at each of the last window samples,
+        excluding peak_bytes which never falls by definition
+
+        Parameters
+        ----------
+        window : number of consecutive increases needed to be flagged
+
+        """
+        flagged = []
+        for (name, samples) in self.series.items():
+            if name == 'peak_bytes' or len(samples) <= window:
+                continue
+            recent = [value for (tick, value) in samples[-window - 1:]]
+            if all(later > earlier for (earlier, later) in zip(recent, recent[1:])):
+                flagged.append(name)
+        return flagged
+
+    def report(self, top=10, window=5):
+        r"""
+        Printable summary: first and last value of each series, series
+        growing monotonically, and the allocation sites that grew most
+        since tracking started
+
+        Parameters
+        ----------
+        top    : number of allocation sites to list
+        window : see growing
+
+        """
+        lines = ['memory over %d samples' % len(self.series.get('traced_bytes', []))]
+        flagged = self.growing(window)
+        for (name, samples) in self.series.items():
+            (first_tick, first) = samples[0]
+            (last_tick, last)   = samples[-1]
+            note = '  GROWING' if name in flagged else ''
+            lines.append('  %-22s %12s -> %-12s (tick %d -> %d)%s'
+                         % (name, first, last, first_tick, last_tick, note))
+        stats = tracemalloc.take_snapshot().compare_to(self.first, 'lineno')
+        lines.append('top allocation growth')
+        for stat in stats[:top]:
+            lines.append('  %s' % stat)
+        return '\n'.join(lines)
+
+    def stop(self):
+        r""" stop tracemalloc if this tracker started it """
+        if self.started and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.started = False
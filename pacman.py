@@ -14,7 +14,13 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import division
 import graphics as gx
+import events as ev
+import instrument
+import argparse
+import collections
+import hashlib
 import math
+import threading
 import time
 import random
 
@@ -24,13 +30,15 @@ import random
 GRID_SIZE   = 30
 MARGIN      = GRID_SIZE
 PAC_SIZE    = GRID_SIZE * 0.8
-PAC_SPEED   = 0.25 # grid points per tick
+PAC_SPEED   = 0.25 # grid points per tick of dt = 1
 GHOST_SPEED = 0.20
 FOOD_SIZE   = GRID_SIZE * 0.15
 DEG_TO_RAD  = math.pi / 180
 CAP_SIZE    = GRID_SIZE * 0.3
-SCARED_TIME = 100
+SCARED_TIME = 100  # ticks of dt = 1
 WARN_TIME   = 50
+EPSILON     = 1e-9 # grid points, allowance for rounding in moves
+PLACES      = 6    # decimals mover positions are kept to
 
 # Set colors
 BACKGROUND_COLOR = 'black'
@@ -41,6 +49,47 @@ GHOST_COLORS     = ['red','green','blue','purple']
 CAP_COLOR        = 'white'
 SCARED_COLOR     = 'white'
 
+# Per game settings. The globals above are only the defaults: a Maze and
+# its movers read their own Config, so games with different settings can
+# run side by side in one process. Sizes in pixels, speeds in grid points
+# per tick, times in ticks; catch_distance is how close (in grid points)
+# a ghost must come to catch pacman.
+Config = collections.namedtuple('Config', [
+    'grid_size', 'margin', 'pac_size', 'food_size', 'cap_size',
+    'pac_speed', 'ghost_speed', 'scared_time', 'warn_time', 'catch_distance',
+    'background_color', 'wall_color', 'pac_color', 'food_color',
+    'ghost_colors', 'cap_color', 'scared_color'])
+
+DEFAULT_CONFIG = Config(
+    grid_size        = GRID_SIZE,
+    margin           = MARGIN,
+    pac_size         = PAC_SIZE,
+    food_size        = FOOD_SIZE,
+    cap_size         = CAP_SIZE,
+    pac_speed        = PAC_SPEED,
+    ghost_speed      = GHOST_SPEED,
+    scared_time      = SCARED_TIME,
+    warn_time        = WARN_TIME,
+    catch_distance   = 1.6,
+    background_color = BACKGROUND_COLOR,
+    wall_color       = WALL_COLOR,
+    pac_color        = PAC_COLOR,
+    food_color       = FOOD_COLOR,
+    ghost_colors     = tuple(GHOST_COLORS),
+    cap_color        = CAP_COLOR,
+    scared_color     = SCARED_COLOR)
+
+# Key to move, directions reversed for graphics.py
+KEY_MOVES = {
+    'Left'     : (-1,  0),
+    'Right'    : ( 1,  0),
+    'Up'       : ( 0, -1),
+    'Down'     : ( 0,  1),
+    'KP_Left'  : (-1,  0),
+    'KP_Right' : ( 1,  0),
+    'KP_Up'    : ( 0, -1),
+    'KP_Down'  : ( 0,  1)}
+
 # Ghost shape layout
 GHOST_SHAPE = [
     ( 0.00,  0.50),
@@ -85,6 +134,287 @@ raw_layout = r"""
 my_layout = [x.strip() for x in raw_layout.split('\n') if x.strip()]
 
 
+def generate_layout(width, height, ghosts=4, seed=None, loops=0.3):
+    r"""
+    Generate a random maze layout in the same format as my_layout
+
+    A perfect maze is carved with a depth first search, then a fraction
+    of the remaining inner walls is knocked out so the maze has loops and
+    junctions like a real pacman board. Every open cell holds food, with
+    capsules near the corners, ghosts near the centre and pacman near the
+    bottom middle.
+
+    Parameters
+    ----------
+    width  : int >= 7, rounded up to an odd number
+    height : int >= 7, rounded up to an odd number
+    ghosts : number of ghosts to place
+    seed   : random seed, same seed gives the same layout
+    loops  : fraction of inner walls to remove after carving
+
+    Returns
+    -------
+    list of strings, one per row
+
+    """
+    rng    = random.Random(seed)
+    width  = max(width, 7) | 1
+    height = max(height, 7) | 1
+    grid   = [['%'] * width for y in range(height)]
+    # carve a perfect maze through the odd cells
+    grid[1][1] = '.'
+    stack = [(1, 1)]
+    while stack:
+        (x, y)  = stack[-1]
+        options = [(dx, dy) for (dx, dy) in ((2, 0), (-2, 0), (0, 2), (0, -2))
+                   if 0 < x + dx < width - 1 and 0 < y + dy < height - 1
+                   and grid[y + dy][x + dx] == '%']
+        if not options:
+            stack.pop()
+            continue
+        (dx, dy) = rng.choice(options)
+        grid[y + dy//2][x + dx//2] = '.'
+        grid[y + dy][x + dx]       = '.'
+        stack.append((x + dx, y + dy))
+    # knock out walls separating two open cells to make loops
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            if grid[y][x] != '%' or (x + y) % 2 == 0 or rng.random() >= loops:
+                continue
+            if ((grid[y][x-1] != '%' and grid[y][x+1] != '%') or
+                    (grid[y-1][x] != '%' and grid[y+1][x] != '%')):
+                grid[y][x] = '.'
+    cells = [(x, y) for y in range(height) for x in range(width) if grid[y][x] == '.']
+
+    def nearest(target):
+        (tx, ty) = target
+        return min(cells, key=lambda c: (abs(c[0] - tx) + abs(c[1] - ty), c))
+
+    for corner in ((1, 1), (width - 2, 1), (1, height - 2), (width - 2, height - 2)):
+        (x, y) = nearest(corner)
+        grid[y][x] = 'o'
+        cells.remove((x, y))
+    (x, y) = nearest((width // 2, height - 2))
+    grid[y][x] = 'P'
+    cells.remove((x, y))
+    for index in range(min(ghosts, len(cells))):
+        (x, y) = nearest((width // 2, height // 2))
+        grid[y][x] = 'G'
+        cells.remove((x, y))
+    return [''.join(row) for row in grid]
+
+
+class LayoutError(ValueError):
+    r""" a layout that can't make a playable game """
+    pass
+
+
+# analyze_layout results by layout hash, oldest first
+LAYOUT_REPORTS      = collections.OrderedDict()
+LAYOUT_REPORTS_SIZE = 256
+
+
+def layout_key(layout):
+    r""" hash identifying a layout's contents """
+    return hashlib.sha1('\n'.join(layout).encode()).hexdigest()
+
+
+def analyze_layout(layout):
+    r"""
+    Check a layout's connectivity before any game is built on it: label
+    the connected regions of open cells (anything but a wall; the map
+    edge counts as a wall) and see what pacman can reach. Results are
+    cached by layout hash, so a layout is only ever analysed once.
+
+    Parameters
+    ----------
+    layout : list of strings, as my_layout
+
+    Returns
+    -------
+    LayoutReport
+
+    """
+    key    = layout_key(layout)
+    report = LAYOUT_REPORTS.get(key)
+    if report is not None:
+        return report
+    height = len(layout)
+    width  = len(layout[0]) if height else 0
+    kinds  = {}
+    for (y, row) in enumerate(layout):
+        for (x, char) in enumerate(row[:width]):
+            if char != '%':
+                kinds[(x, y)] = char
+    # flood fill the open cells into regions
+    region = {}
+    count  = 0
+    for start in kinds:
+        if start in region:
+            continue
+        region[start] = count
+        stack = [start]
+        while stack:
+            (x, y) = stack.pop()
+            for (dx, dy) in DIRECTIONS:
+                cell = (x + dx, y + dy)
+                if cell in kinds and cell not in region:
+                    region[cell] = count
+                    stack.append(cell)
+        count += 1
+    degree  = dict((cell, sum((cell[0] + dx, cell[1] + dy) in kinds
+                              for (dx, dy) in DIRECTIONS))
+                   for cell in kinds)
+    cells   = dict((char, sorted(cell for (cell, kind) in kinds.items() if kind == char))
+                   for char in 'P.oG')
+    reached = set(region[cell] for cell in cells['P'])
+    unreachable_food = tuple(cell for cell in cells['.'] if region[cell] not in reached)
+    report = LayoutReport(
+        key                  = key,
+        width                = width,
+        height               = height,
+        open_cells           = len(kinds),
+        components           = count,
+        food                 = len(cells['.']),
+        unreachable_food     = unreachable_food,
+        unreachable_capsules = tuple(cell for cell in cells['o']
+                                     if region[cell] not in reached),
+        dead_ends            = sum(1 for value in degree.values() if value == 1),
+        junctions            = sum(1 for value in degree.values() if value > 2),
+        boxed_ghosts         = tuple(cell for cell in cells['G'] if degree[cell] == 0),
+        isolated_ghosts      = tuple(cell for cell in cells['G']
+                                     if region[cell] not in reached),
+        winnable             = bool(cells['P'] and cells['.'] and not unreachable_food))
+    LAYOUT_REPORTS[key] = report
+    if len(LAYOUT_REPORTS) > LAYOUT_REPORTS_SIZE:
+        LAYOUT_REPORTS.popitem(last=False)
+    return report
+
+
+def check_layout(layout):
+    r"""
+    Return the LayoutReport of a layout, raising LayoutError if the game
+    could never be won: no pacman, no food, or food pacman can't reach
+    (food_count would never get to 0).
+    """
+    report = analyze_layout(layout)
+    if not report.winnable:
+        problems = []
+        if not report.food:
+            problems.append('no food')
+        if report.unreachable_food:
+            problems.append('%d food unreachable, e.g. at %s'
+                            % (len(report.unreachable_food), report.unreachable_food[0]))
+        if not any('P' in row for row in layout):
+            problems.append('no pacman')
+        raise LayoutError('layout %s can never be won: %s'
+                          % (report.key[:12], ', '.join(problems)))
+    return report
+
+
+def make_config(**changes):
+    r"""
+    Return DEFAULT_CONFIG with some settings changed. The pixel sizes of
+    the margin, pacman, food and capsules follow grid_size unless given.
+
+    Parameters
+    ----------
+    changes : Config field names and values, e.g. ghost_speed=0.25
+
+    Returns
+    -------
+    Config
+
+    """
+    grid  = changes.get('grid_size', DEFAULT_CONFIG.grid_size)
+    sizes = {'margin'    : grid,
+             'pac_size'  : grid * 0.8,
+             'food_size' : grid * 0.15,
+             'cap_size'  : grid * 0.3}
+    sizes.update(changes)
+    if 'ghost_colors' in sizes:
+        sizes['ghost_colors'] = tuple(sizes['ghost_colors'])
+    return DEFAULT_CONFIG._replace(**sizes)
+
+
+def closest_approach(a_start, a_end, b_start, b_end):
+    r"""
+    Smallest squared distance between two points moving in straight
+    lines at constant speed over the same tick, a from a_start to a_end
+    while b goes from b_start to b_end
+
+    Returns
+    -------
+    float squared distance
+    """
+    # relative position r(t) = r0 + t*v for t in [0, 1]
+    (rx, ry) = (b_start[0] - a_start[0], b_start[1] - a_start[1])
+    (vx, vy) = ((b_end[0] - b_start[0]) - (a_end[0] - a_start[0]),
+                (b_end[1] - b_start[1]) - (a_end[1] - a_start[1]))
+    speed_sq = vx*vx + vy*vy
+    t = 0.0
+    if speed_sq > 0:
+        t = min(max(-(rx*vx + ry*vy) / speed_sq, 0.0), 1.0)
+    (rx, ry) = (rx + t*vx, ry + t*vy)
+    return rx*rx + ry*ry
+
+
+def grid_points_between(start, end):
+    r"""
+    Integer grid points on an axis aligned move from start to end, in
+    the order they are passed, start excluded. Empty for diagonal moves
+    or moves off the grid lines.
+
+    """
+    (x0, y0) = start
+    (x1, y1) = end
+    if y0 == y1 and y0 == int(y0):
+        (a, b, make) = (x0, x1, lambda v: (v, int(y0)))
+    elif x0 == x1 and x0 == int(x0):
+        (a, b, make) = (y0, y1, lambda v: (int(x0), v))
+    else:
+        return []
+    if b > a:
+        return [make(v) for v in range(int(math.floor(a)) + 1, int(math.floor(b)) + 1)]
+    return [make(v) for v in range(int(math.ceil(a)) - 1, int(math.ceil(b)) - 1, -1)]
+
+
+def popcount(bits):
+    r""" number of set bits in a non-negative int """
+    return bin(bits).count('1')
+
+# Immutable views of the game published once per simulation tick.
+# kind is 'pacman' or 'ghost'; place is in (float) map coordinates
+MoverState = collections.namedtuple('MoverState',
+                                    ['kind', 'place', 'direction', 'color'])
+# tick   : simulation tick number
+# time   : wall clock time the snapshot was published
+# movers : tuple of MoverState, in Maze.movables order
+# eaten  : length of Maze.eaten when published
+# lost   : True once pacman has been caught
+# dt     : time step of the tick, in standard ticks
+Snapshot = collections.namedtuple('Snapshot',
+                                  ['tick', 'time', 'movers', 'eaten', 'lost', 'dt'])
+# A run of open cells between two junctions. end is the junction (or
+# dead end) reached, length the number of steps to it, waypoints the
+# corners then end in order, heading the direction of the last step.
+Corridor = collections.namedtuple('Corridor',
+                                  ['end', 'length', 'waypoints', 'heading'])
+
+# ghost choice order, kept so seeded games choose as before
+DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+# Result of analyze_layout. key is the layout hash; components the number
+# of separate regions of open cells; unreachable_food/_capsules the items
+# pacman can never get to; dead_ends/junctions count open cells with one
+# or more than two open neighbours; boxed_ghosts the ghost starts with no
+# way out; isolated_ghosts those that can never reach pacman; winnable
+# whether eating every food is possible at all. Cells are (x, y).
+LayoutReport = collections.namedtuple('LayoutReport',
+    ['key', 'width', 'height', 'open_cells', 'components', 'food',
+     'unreachable_food', 'unreachable_capsules', 'dead_ends', 'junctions',
+     'boxed_ghosts', 'isolated_ghosts', 'winnable'])
+
+
 # CLASSES
 class Maze:
     r""" Maze class
@@ -95,11 +425,35 @@ class Maze:
 
         Attributes
         ----------
-        food_count : number of food objects in map
+        buffer     : StateBuffer holding the latest published snapshots
+        corridors  : CorridorGraph of the layout, for ghost routes
+        capsule_bits : bitset of cells holding a capsule, bit y*width+x
+        config     : Config of this game's settings
+        eaten      : append-only list of eaten food and capsule objects
+        events     : EventBus for game events; ghosts subscribe to it
+        backend    : graphics backend used for win
+        food_bits  : bitset of cells holding food, bit y*width+x
+        food_count : number of food objects in map, popcount of food_bits
+        food_index : FoodIndex answering nearest food queries
         game_over  : T/F to end gameplay
+        ghost_count: number of ghosts made so far, for their colours
         height     : map height in objects
+        hud        : ProfilerHUD showing profiler on screen, or None
+        latency    : LatencyTracker for key presses this session
+        layout_report : LayoutReport of the layout, from analyze_layout
+        lost       : T/F pacman has been caught
         map        : 2D array of objects
+        memory     : MemoryTracker sampling allocations, or None
         movables   : list of movable objects
+        origin     : map cell drawn at the top left margin point
+        profiler   : TickProfiler timing each loop phase, or None
+        random     : random number generator for ghost decisions
+        renderer   : Renderer drawing snapshots into win
+        ticks      : number of simulation ticks run
+        time       : game time simulated, in standard (dt = 1) ticks
+        validate   : T/F refuse layouts that can't be won
+        view_size  : (columns, rows) shown when scrolling, or None
+        viewport   : Viewport keeping canvas items near the view, or None
         width      : map width in objects
         win        : graphics window object
 
@@ -113,17 +467,35 @@ class Maze:
         to_screen       : convert from map coords to screen coords
         make_object     : initialize objects in map
         object_at       : return object at specified map coords
+        cell_bit        : return the bitset bit for a map location
+        has_food        : T/F food remains at a map location
+        food_in         : count the food left in a rectangle of the map
+        nearest_food    : return the location of the closest remaining food
         remove_food     : process food removal logic & win check
         remove_capsule  : process capsule removal and ghost fear
-        pacman_loc      : update all movers with pacman location
+        pacman_loc      : publish pacman's move to subscribers for collisions
+        read_input      : hand key presses queued by the window to pacman
+        key_pressed     : pass a key press to the movers a player controls
         finished        : return game status, game_over(T) or not(F)?
-        winner          : set game over flag to true
-        loser           : send player message of loss, set game over flag to true
-        play            : Move movers, update window graphic object, animation delay
+        winner          : set game over flag to true, publish Won
+        loser           : set lost and game over flags to true, publish Lost
+        enable_profiling: time loop phases, optionally with an on screen HUD
+        enable_memory_tracking: sample memory and live objects every N ticks
+        snapshot        : return an immutable Snapshot of the game state
+        save_state      : return the game state as an immutable tuple
+        restore_state   : go back to a state returned by save_state
+        tick            : advance the simulation by dt and publish a snapshot
+        quiet_time      : how far the game can jump without anything happening
+        skip_ahead      : tick straight over the quiet time
+        render          : draw the latest snapshots into the window
+        play            : Tick, render, update window graphic object, animation delay
+        run             : play to the end with simulation and drawing on separate threads
         done            : Release map and movable objects, call for closure
+        close           : close the window and break the maze's reference cycles
     """
 
-    def __init__(self, layout):
+    def __init__(self, layout, backend=None, seed=None, config=None, validate=False,
+                 viewport=None):
         r""" 
         Initialize parameters and maze layout
 
@@ -131,16 +503,51 @@ class Maze:
         ----------
         layout  : [1x15] of (31x1) strings specifying maze layout via characters in the
             set {'%', 'P', '.', 'G', 'o'}
+        backend : graphics backend name or class for the window, None for
+            the graphics default; 'null' runs without drawing anything
+        seed    : seed for the ghosts' random choices, None for unseeded
+        config  : Config of game settings, None for DEFAULT_CONFIG
+        validate: T/F raise LayoutError for a layout that can't be won,
+            before any of the game is built
+        viewport: (columns, rows) of cells to show in a window that
+            scrolls to follow pacman, None to show the whole maze
         
         """
         # initialize maze parameters
+        self.config      = DEFAULT_CONFIG if config is None else config
+        self.grid_size   = self.config.grid_size
+        self.margin      = self.config.margin
+        self.ghost_count = 0
+        self.backend     = backend
+        self.random      = random.Random(seed)
         self.game_over   = False
+        self.lost        = False
         self.movables    = []
         self.food_count  = 0
+        self.food_bits   = 0
+        self.capsule_bits = 0
+        self.food_index  = None
+        self.corridors   = None
+        self.eaten       = []
+        self.events      = ev.EventBus()
+        self.ticks       = 0
+        self.time        = 0.0
+        self.last_dt     = 1.0
+        self.buffer      = StateBuffer()
+        self.latency     = instrument.LatencyTracker()
+        self.profiler    = None
+        self.hud         = None
+        self.memory      = None
         self.win         = None
+        self.renderer    = None
         self.map         = []
         self.height      = None
         self.width       = None
+        self.validate    = validate
+        self.layout_report = None
+        self.view_size   = viewport
+        self.viewport    = None
+        self.origin      = (0, 0)
         # Initialize all objects in the layout
         self.set_layout(layout)
 
@@ -150,11 +557,13 @@ class Maze:
         message = gx.Text(mes_loc, 'Click anywhere to quit.')
         message.setTextColor('white')
         message.draw(self.win)
-        self.win.getMouse()
+        if self.win.isInteractive():
+            self.win.getMouse()
         self.win.close()
 
     def set_layout(self, layout):
         r""" 
+        analyse the layout (cached), checking it if validate is set
         set height and wideth attributes
         initialize window graphics object
         calls for map to be drawn
@@ -166,18 +575,27 @@ class Maze:
             set {'%', 'P', '.', 'G', 'o'}
 
         """
+        if self.validate:
+            self.layout_report = check_layout(layout)
+        else:
+            self.layout_report = analyze_layout(layout)
         self.height = len(layout)
         self.width  = len(layout[0])
         self.win    = self.make_window()
+        self.food_index = FoodIndex(self.width, self.height)
         self.make_map()
         # loop through layout and create objects
         for x in range(self.width):
             for y in range(self.height):
                 char = layout[y][x]
                 self.make_object((x, y), char)
-        # loop through movables and draw them
-        for mover in self.movables:
-            mover.draw_me()
+        self.corridors = CorridorGraph(self)
+        if self.view_size is not None:
+            self.viewport = Viewport(self, *self.view_size)
+        # publish the starting positions and draw the movables
+        self.renderer = Renderer(self)
+        self.buffer.publish(self.snapshot())
+        self.render()
 
     def make_window(self):
         r""" 
@@ -188,15 +606,23 @@ class Maze:
         win : graphics window object
 
         """
-        grid_width    = (self.width-1)  * GRID_SIZE
-        grid_height   = (self.height-1) * GRID_SIZE
-        screen_width  = 2*MARGIN + grid_width
-        screen_height = 2*MARGIN + grid_height
+        (columns, rows) = (self.width, self.height)
+        if self.view_size is not None:
+            columns = min(self.view_size[0], columns)
+            rows    = min(self.view_size[1], rows)
+        grid_width    = (columns-1) * self.grid_size
+        grid_height   = (rows-1)    * self.grid_size
+        screen_width  = 2*self.margin + grid_width
+        screen_height = 2*self.margin + grid_height
         # start window
+        # autoflush off: canvas changes are batched and sent once per
+        # frame by the win.update() in play()
         win = gx.GraphWin(title = 'PacMan!',
                           width = screen_width,
-                          height = screen_height)
-        win.setBackground(BACKGROUND_COLOR)
+                          height = screen_height,
+                          autoflush = False,
+                          backend = self.backend)
+        win.setBackground(self.config.background_color)
         return win
 
     def make_map(self):
@@ -218,8 +644,8 @@ class Maze:
             denotes location of object in map
         """
         (x, y) = point
-        x = x*GRID_SIZE + MARGIN
-        y = y*GRID_SIZE + MARGIN
+        x = (x - self.origin[0])*self.grid_size + self.margin
+        y = (y - self.origin[1])*self.grid_size + self.margin
         return (x, y)
 
     def make_object(self, location, character):
@@ -245,13 +671,17 @@ class Maze:
             # it's food
             self.food_count += 1
             self.map[y][x]   = Food(self, location)
+            self.food_bits  |= self.cell_bit(location)
+            self.food_index.add(location)
         if character == 'G':
             # it's a ghost
-            ghost = Ghost(self, location)
+            self.ghost_count += 1
+            ghost = Ghost(self, location, self.ghost_count)
             self.movables.append(ghost)
         if character == 'o':
             # it's a power capsule
             self.map[y][x] = Capsule(self, location)
+            self.capsule_bits |= self.cell_bit(location)
 
     def object_at(self, location):
         r""" return the object in the map at desired location
@@ -271,6 +701,55 @@ class Maze:
         # return object at location for valid locations
         return self.map[y][x]
 
+    def cell_bit(self, location):
+        r""" return the food/capsule bitset bit for a map location """
+        (x, y) = location
+        return 1 << (y*self.width + x)
+
+    def has_food(self, location):
+        r""" T/F food remains at an integer map location """
+        (x, y) = location
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        return bool(self.food_bits & self.cell_bit(location))
+
+    def food_in(self, corner, other):
+        r"""
+        Count the food left in a rectangle of the map
+
+        Parameters
+        ----------
+        corner, other : opposite (x, y) corners of the rectangle, inclusive
+
+        Returns
+        -------
+        int food count
+
+        """
+        (x0, x1) = sorted((corner[0], other[0]))
+        (y0, y1) = sorted((corner[1], other[1]))
+        (x0, x1) = (max(x0, 0), min(x1, self.width - 1))
+        (y0, y1) = (max(y0, 0), min(y1, self.height - 1))
+        if x0 > x1:
+            return 0
+        row_mask = (1 << (x1 - x0 + 1)) - 1
+        count    = 0
+        for y in range(y0, y1 + 1):
+            count += popcount((self.food_bits >> (y*self.width + x0)) & row_mask)
+        return count
+
+    def nearest_food(self, place):
+        r"""
+        Return the remaining food closest to place, by straight line
+        distance, or None once all food is eaten
+
+        Parameters
+        ----------
+        place : (x, y) map location, may be fractional
+
+        """
+        return self.food_index.nearest(place)
+
     def remove_food(self, place):
         r"""
         replace food object with nothing object,
@@ -284,8 +763,12 @@ class Maze:
 
         """
         (x, y) = place
+        self.eaten.append(self.map[y][x])
         self.map[y][x]   = Nothing()
-        self.food_count -= 1
+        self.food_bits  &= ~self.cell_bit(place)
+        self.food_count  = popcount(self.food_bits)
+        self.food_index.remove(place)
+        self.events.publish(ev.FoodEaten(place))
         if self.food_count == 0:
             self.winner()
 
@@ -300,23 +783,52 @@ class Maze:
 
         """
         (x, y) = place
+        self.eaten.append(self.map[y][x])
         self.map[y][x] = Nothing()
-        # trigger ghost fear for all ghosts
-        for mover in self.movables:
-            mover.capsule_eaten()
+        self.capsule_bits &= ~self.cell_bit(place)
+        # ghosts subscribe to this to become scared
+        self.events.publish(ev.CapsuleEaten(place))
 
     def pacman_loc(self, mypac, location):
-        r""" update all movers with pacman location
+        r""" publish pacman's move this tick; ghosts check for collisions
+            along the whole of both moves
 
         Parameters
         ----------
         mypac    : pacman object
-        location : integer touple within map constraints
-            denotes location in map to remove food from
+        location : (x, y) map location of pacman
 
         """
+        self.events.publish(ev.PacmanMoved(mypac, location, mypac.previous))
+
+    def collide(self):
+        r""" check for collisions once every mover has moved this tick """
         for mover in self.movables:
-            mover.pacman_loc(mypac, location)
+            if isinstance(mover, Pacman):
+                self.pacman_loc(mover, mover.place)
+
+    def read_input(self):
+        r""" hand key presses queued by the window to pacman, in order """
+        for event in self.win.pollEvents('key'):
+            self.key_pressed(event.key, event.time)
+
+    def key_pressed(self, key, when=None, player=0):
+        r"""
+        Pass a key press to the movers controlled by a player
+
+        Parameters
+        ----------
+        key    : Tk keysym string, e.g. 'Left'
+        when   : time.time() of the press, defaults to now
+        player : player number; pacman is player 0, ghosts are only
+            controlled by a player once given one
+
+        """
+        if when is None:
+            when = time.time()
+        for mover in self.movables:
+            if mover.player == player:
+                mover.key_pressed(key, when)
 
     def finished(self):
         r""" 
@@ -332,24 +844,327 @@ class Maze:
     def winner(self):
         r""" set game over flag to true """
         self.game_over = True
+        self.events.publish(ev.Won())
 
-    def loser(self):
-        r""" send player message of loss and set game over flag to true """
-        mes_loc = gx.Point(self.win.getWidth()/2, self.win.getHeight()/4)
-        message = gx.Text(mes_loc, 'You Lose!')
-        message.setTextColor('white')
-        message.draw(self.win)
+    def loser(self, place=None):
+        r""" set lost and game over flags to true, renderer shows the message
+
+        Parameters
+        ----------
+        place : map location where pacman was caught, if known
+
+        """
+        self.lost      = True
         self.game_over = True
+        self.events.publish(ev.Lost(place))
+
+    def enable_profiling(self, hud=False, size=1024):
+        r"""
+        Time every phase of the game loop into a TickProfiler
+
+        Parameters
+        ----------
+        hud  : T/F draw the per phase p50/p99 on screen
+        size : samples kept per phase
+
+        Returns
+        -------
+        TickProfiler
+
+        """
+        self.profiler = instrument.TickProfiler(size)
+        if hud and self.hud is None:
+            self.hud = instrument.ProfilerHUD(self.profiler, self.win,
+                                              gx.Point(self.margin + 110, self.margin + 45))
+        return self.profiler
+
+    def enable_memory_tracking(self, every=100):
+        r"""
+        Sample tracemalloc, live objects per class and the number of
+        items held by the window every few ticks
+
+        Parameters
+        ----------
+        every : ticks between samples
+
+        Returns
+        -------
+        MemoryTracker
+
+        """
+        self.memory = instrument.MemoryTracker(every)
+        self.memory.watch('win.items', lambda: len(self.win.items))
+        self.memory.watch('eaten', lambda: len(self.eaten))
+        self.memory.sample(self.ticks)
+        return self.memory
+
+    def snapshot(self):
+        r"""
+        Return an immutable Snapshot of the current game state
+
+        Returns
+        -------
+        Snapshot of mover states, eaten item count and loss flag
+
+        """
+        movers = tuple(mover.state() for mover in self.movables)
+        return Snapshot(self.ticks, time.time(), movers, len(self.eaten), self.lost,
+                        self.last_dt)
+
+    def save_state(self):
+        r"""
+        Return everything a tick can change, as an immutable tuple. Cheap
+        enough to take every tick: the map is not copied, only the food
+        bitsets and the length of the eaten list, as eaten objects are
+        only ever appended.
+
+        Returns
+        -------
+        tuple for restore_state
+
+        """
+        return (self.ticks, self.time, self.last_dt, self.game_over, self.lost,
+                self.food_bits, self.capsule_bits, self.food_count, len(self.eaten),
+                self.random.getstate(), tuple(mover.save() for mover in self.movables))
+
+    def restore_state(self, state):
+        r"""
+        Go back to a state returned by save_state on this maze. Food and
+        capsules eaten since are put back in the map (and redrawn if the
+        renderer had removed them) and the restored state is published.
+        Events are not replayed; subscribers see the ticks run again.
+
+        Parameters
+        ----------
+        state : tuple from save_state
+
+        """
+        (self.ticks, self.time, self.last_dt, self.game_over, self.lost,
+         self.food_bits, self.capsule_bits, self.food_count, eaten,
+         random_state, movers) = state
+        self.random.setstate(random_state)
+        renderer = self.renderer
+        for index in range(len(self.eaten) - 1, eaten - 1, -1):
+            item   = self.eaten[index]
+            (x, y) = item.place
+            self.map[y][x] = item
+            if isinstance(item, Food):
+                self.food_index.add(item.place)
+            if renderer is not None and index < renderer.drawn:
+                if self.viewport is not None:
+                    self.viewport.refresh(item.place)
+                else:
+                    item.dot.draw(self.win)
+        del self.eaten[eaten:]
+        if renderer is not None:
+            renderer.drawn = min(renderer.drawn, eaten)
+        for (mover, saved) in zip(self.movables, movers):
+            mover.restore(saved)
+        self.buffer.publish(self.snapshot())
+
+    def tick(self, dt=1.0):
+        r""" Read input, move all movables and publish the resulting
+            snapshot. Touches no graphics, so it may run on any thread.
+
+        Parameters
+        ----------
+        dt : time step in standard ticks; speeds and timers scale by it,
+            so ten ticks of 1 and one tick of 10 cover the same game time
+
+        """
+        self.read_input()
+        profiler = self.profiler
+        if profiler is None:
+            for mover in self.movables:
+                mover.previous = mover.place
+                mover.move(dt)
+            self.collide()
+        else:
+            clock = instrument.clock
+            (pac_time, ghost_time) = (0.0, 0.0)
+            for mover in self.movables:
+                mover.previous = mover.place
+                start = clock()
+                mover.move(dt)
+                if isinstance(mover, Pacman):
+                    pac_time += clock() - start
+                else:
+                    ghost_time += clock() - start
+            start = clock()
+            self.collide()
+            profiler.record('pacman', pac_time)
+            profiler.record('ghosts', ghost_time)
+            profiler.record('collision', clock() - start)
+        self.ticks  += 1
+        self.time   += dt
+        self.last_dt = dt
+        # batched subscribers see this tick's events once it is complete
+        self.events.flush()
+        self.buffer.publish(self.snapshot())
+        if self.memory is not None:
+            self.memory.tick(self.ticks)
+
+    def quiet_time(self):
+        r"""
+        Return how much game time can pass in a single tick with nothing
+        happening that stepping tick by tick would handle differently:
+        no input, no turns or ghost decisions, no capsule or last food
+        eaten, no scared timer running out and no mover coming within
+        reach of pacman.
+
+        Returns
+        -------
+        float time in standard ticks, 0 if something is due now
+
+        """
+        if self.win.events:
+            return 0.0
+        quiet = min(mover.quiet_time() for mover in self.movables)
+        reach = self.config.catch_distance
+        pacmen = [mover for mover in self.movables if isinstance(mover, Pacman)]
+        for mover in self.movables:
+            if isinstance(mover, Pacman):
+                continue
+            for mypac in pacmen:
+                # keep clear of the collision distance at the fastest
+                # the two could be closing
+                (delt_x, delt_y) = (mover.place[0] - mypac.place[0],
+                                    mover.place[1] - mypac.place[1])
+                gap   = math.sqrt(delt_x*delt_x + delt_y*delt_y) - reach
+                quiet = min(quiet, max(gap, 0.0) / (mover.speed + mypac.speed))
+        return quiet
+
+    def skip_ahead(self, limit=100):
+        r"""
+        Tick once over the whole quiet time, in whole standard ticks so
+        the game stays on the same schedule as ticking one at a time
+
+        Parameters
+        ----------
+        limit : longest jump, in standard ticks
+
+        Returns
+        -------
+        dt used
+
+        """
+        dt = max(1.0, min(math.floor(self.quiet_time()), limit))
+        self.tick(dt)
+        return dt
+
+    def render(self, alpha=1.0):
+        r"""
+        Draw the latest published snapshot
+
+        Parameters
+        ----------
+        alpha : float in [0, 1]
+            interpolation between the previous (0) and latest (1) snapshot
+
+        """
+        (previous, current) = self.buffer.latest()
+        self.renderer.render(previous, current, alpha)
 
     def play(self):
-        r""" Move all movables
-            Update window graphic object
+        r""" Tick the simulation
+            Draw the new state, update window graphic object
             Insert game delay
         """
-        for mover in self.movables:
-            mover.move()
+        clock = instrument.clock
+        self.tick()
+        start = clock()
+        self.render()
+        self.draw_hud()
+        drawn = clock()
         self.win.update()
+        updated = clock()
+        self.latency.displayed(self.ticks)
         time.sleep(0.05)
+        self.record_frame(drawn - start, updated - drawn, clock() - updated)
+
+    def draw_hud(self):
+        r""" refresh the profiler HUD, if shown """
+        if self.hud is not None:
+            self.hud.update()
+
+    def record_frame(self, canvas, update, sleep):
+        r"""
+        Record a frame's drawing phases if profiling
+
+        Parameters
+        ----------
+        canvas : seconds spent drawing into the canvas
+        update : seconds spent in win.update()
+        sleep  : seconds spent waiting for the next frame
+
+        """
+        if self.profiler is not None:
+            self.profiler.record('canvas', canvas)
+            self.profiler.record('update', update)
+            self.profiler.record('sleep', sleep)
+
+    def run(self, tick_rate=20, frame_rate=60, time_scale=1.0):
+        r"""
+        Play until the game is over, simulating on a background thread
+        while this (the Tk) thread draws the latest snapshots. Positions
+        are interpolated between ticks, so the display rate and the tick
+        rate are independent and slow drawing never slows the game.
+
+        Parameters
+        ----------
+        tick_rate  : simulation ticks per second
+        frame_rate : frames drawn per second
+        time_scale : game speed, the dt of every tick; 10 plays ten
+            times faster at the same tick rate
+
+        """
+        tick_time  = 1.0 / tick_rate
+        frame_time = 1.0 / frame_rate
+        simulation = threading.Thread(target=self._simulate,
+                                      args=(tick_time, time_scale))
+        simulation.daemon = True
+        simulation.start()
+        next_frame = time.time()
+        clock      = instrument.clock
+        while not self.finished():
+            start = clock()
+            (previous, current) = self.buffer.latest()
+            # draw one tick behind the latest snapshot so there is always
+            # a pair to interpolate between
+            if previous is None:
+                alpha = 1.0
+            else:
+                alpha = (time.time() - current.time) / tick_time
+                alpha = min(max(alpha, 0.0), 1.0)
+            self.renderer.render(previous, current, alpha)
+            self.draw_hud()
+            drawn = clock()
+            self.win.update()
+            updated = clock()
+            self.latency.displayed(current.tick)
+            next_frame += frame_time
+            delay = next_frame - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # fell behind, don't try to catch up with a burst of frames
+                next_frame = time.time()
+            self.record_frame(drawn - start, updated - drawn, clock() - updated)
+        simulation.join()
+        self.render()
+        self.win.update()
+
+    def _simulate(self, tick_time, dt):
+        r""" Simulation thread body, ticks on a fixed schedule until game over """
+        next_tick = time.time()
+        while not self.finished():
+            self.tick(dt)
+            next_tick += tick_time
+            delay = next_tick - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.time()
 
     def done(self):
         r""" Release map and movable objects, call for closure """
@@ -357,6 +1172,24 @@ class Maze:
         self.movables = []
         self.prompt_to_close()
 
+    def close(self):
+        r"""
+        Close the window without prompting and drop everything that points
+        back at the maze (movers, map objects, event handlers, sprites), so
+        a finished maze is freed straight away rather than left for the
+        cycle collector, whose full scans stall every other game running
+        in the same process.
+        """
+        self.win.close()
+        self.map      = []
+        self.movables = []
+        self.eaten    = []
+        self.events   = ev.EventBus()
+        self.renderer = None
+        self.viewport = None
+        self.hud      = None
+        self.memory   = None
+
 
 class Immovable:
     r""" Immovable Class
@@ -416,18 +1249,21 @@ class Capsule(Immovable):
         self.place        = point
         self.screen_point = maze.to_screen(point)
         self.maze         = maze
-        self.draw_me()
+        self.dot          = None
+        # a scrolling maze's Viewport draws only the cells in view
+        if maze.view_size is None:
+            self.draw_me()
 
     def draw_me(self):
         r""" Initialize graphics object and draw on window """
-        self.dot = gx.Circle(gx.Point(*self.screen_point), CAP_SIZE)
-        self.dot.setFill(CAP_COLOR)
-        self.dot.setOutline(CAP_COLOR)
+        config   = self.maze.config
+        self.dot = gx.Circle(gx.Point(*self.screen_point), config.cap_size)
+        self.dot.setFill(config.cap_color)
+        self.dot.setOutline(config.cap_color)
         self.dot.draw(self.maze.win)
 
     def eat_me(self, mypac):
-        r""" Triggers capsule removal logic """
-        self.dot.undraw()
+        r""" Triggers capsule removal logic, renderer undraws the dot """
         self.maze.remove_capsule(self.place)
 
 
@@ -467,18 +1303,21 @@ class Food(Immovable):
         self.place        = point
         self.screen_point = maze.to_screen(point)
         self.maze         = maze
-        self.draw_me()
+        self.dot          = None
+        # a scrolling maze's Viewport draws only the cells in view
+        if maze.view_size is None:
+            self.draw_me()
 
     def draw_me(self):
         r""" Initialize graphics object and draw on window """
-        self.dot = gx.Circle(gx.Point(*self.screen_point),FOOD_SIZE)
-        self.dot.setFill(FOOD_COLOR)
-        self.dot.setOutline(FOOD_COLOR)
+        config   = self.maze.config
+        self.dot = gx.Circle(gx.Point(*self.screen_point), config.food_size)
+        self.dot.setFill(config.food_color)
+        self.dot.setOutline(config.food_color)
         self.dot.draw(self.maze.win)
 
     def eat_me(self, pacman):
-        r""" Triggers capsule removal logic """
-        self.dot.undraw()
+        r""" Triggers food removal logic, renderer undraws the dot """
         self.maze.remove_food(self.place)
 
 
@@ -521,7 +1360,8 @@ class Wall(Immovable):
         self.neighbors    = [(x+1, y),(x-1, y),(x, y+1),(x, y-1)]
         self.maze         = maze
         self.screen_point = self.maze.to_screen(location)
-        self.draw_me(maze.win)
+        if maze.view_size is None:
+            self.draw_me(maze.win)
 
     def draw_me(self, win):
         r""" 
@@ -558,10 +1398,12 @@ class Wall(Immovable):
             # No need to make a parameter like food/capsule dot objects
             my_line = gx.Line(gx.Point(*a), gx.Point(*b))
             my_line.setWidth(2)
-            my_line.setOutline(WALL_COLOR)
+            my_line.setOutline(self.maze.config.wall_color)
             my_line.draw(self.maze.win)
 
 class Movable:
+    kind = None   # MoverState kind, set by child classes
+
     def __init__(self, maze, location, speed):
         r"""
         Initialize movable attributes
@@ -575,63 +1417,104 @@ class Movable:
             object speed in grid points per second
 
         """
-        self.maze  = maze
-        self.place = location
-        self.speed = speed
-
-    def furthest_move(self, move):
+        self.maze      = maze
+        self.place     = location
+        self.previous  = location # place at the start of this tick
+        self.speed     = speed
+        self.player    = None     # player controlling it, if any
+        self.direction = 0        # facing in degrees, for drawing
+
+    def furthest_move(self, move, dt=1.0):
         r"""
-        Truncate requested move if walls are in the way
+        Truncate requested move by speed and if walls are in the way.
+        Every cell along the move is checked, so moves longer than one
+        grid point stop at the last open grid point before a wall.
 
         Parameters
         ----------
         move : (1,2) float tuple
             desired movement 
+        dt   : time step, the move is at most speed*dt
         
         """
         (move_x, move_y) = move
         (cur_x, cur_y)   = self.place
         (near_x, near_y) = self.nearest_grid_point()
-        maze             = self.maze
+        speed            = self.speed * dt
+
+        # truncate movement by speed (movement per tick), allowing for
+        # rounding so a mover lands exactly on the point it is heading to
+        if   move_x >  speed + EPSILON:
+            move_x = speed
+        elif move_x < -speed - EPSILON:
+            move_x = -speed
+        if   move_y >  speed + EPSILON:
+            move_y = speed
+        elif move_y < -speed - EPSILON:
+            move_y = -speed
 
         # check for walls and truncate movement if heading for one
-        if move_x > 0:
-            # moving right
-            next_point = (near_x + 1, near_y)
-            if maze.object_at(next_point).is_wall() and cur_x + move_x > near_x:
-                # heading for a wall to the right
-                move_x = near_x - cur_x
-        elif move_x < 0:
-            # moving left
-            next_point = (near_x - 1, near_y)
-            if maze.object_at(next_point).is_wall() and cur_x + move_x < near_x:
-                # heading for a wall to the left
-                move_x = near_x - cur_x
-        if move_y > 0:
-            # moving down (reversed direction for graphics.py)
-            next_point = (near_x, near_y + 1)
-            if maze.object_at(next_point).is_wall() and cur_y + move_y > near_y:
-                # heading for a wall above
-                move_y = near_y - cur_y
-        elif move_y < 0:
-            # moving up (reversed direction for graphics.py)
-            next_point = (near_x, near_y - 1)
-            if maze.object_at(next_point).is_wall() and cur_y + move_y < near_y:
-                # heading for a wall below
-                move_y = near_y - cur_y
-
-        # truncate movement by speed (movement per tick)
-        if   move_x >  self.speed:
-            move_x = self.speed
-        elif move_x < -self.speed:
-            move_x = -self.speed
-        if   move_y >  self.speed:
-            move_y = self.speed
-        elif move_y < -self.speed:
-            move_y = -self.speed
+        # (y is reversed for graphics.py, positive is down)
+        if move_x != 0:
+            stop = self.wall_stop(near_x, cur_x + move_x, near_y, True)
+            if stop is not None:
+                move_x = stop - cur_x
+        if move_y != 0:
+            stop = self.wall_stop(near_y, cur_y + move_y, near_x, False)
+            if stop is not None:
+                move_y = stop - cur_y
 
         return (move_x, move_y)
 
+    def wall_stop(self, near, target, other, horizontal):
+        r"""
+        Walk grid points from near towards target along one axis
+
+        Parameters
+        ----------
+        near       : int grid coordinate the move starts from
+        target     : float coordinate the move wants to reach
+        other      : int grid coordinate on the other axis
+        horizontal : T/F moving along x
+
+        Returns
+        -------
+        coordinate of the last open grid point before a wall the move
+        would run into, or None if the way is clear
+
+        """
+        step  = 1 if target > near else -1
+        point = near
+        maze  = self.maze
+        # a wall at point + step only matters once target passes point
+        while (target - point) * step > 0:
+            if horizontal:
+                cell = (point + step, other)
+            else:
+                cell = (other, point + step)
+            if maze.object_at(cell).is_wall():
+                return point
+            point += step
+        return None
+
+    def to_next_grid_point(self, move):
+        r"""
+        Truncate a move so it goes no further than the next grid point
+
+        Parameters
+        ----------
+        move : (1,2) float tuple
+
+        """
+        truncated = []
+        for (cur, step) in zip(self.place, move):
+            if step > 0:
+                step = min(step, math.floor(cur + EPSILON) + 1 - cur)
+            elif step < 0:
+                step = max(step, math.ceil(cur - EPSILON) - 1 - cur)
+            truncated.append(step)
+        return tuple(truncated)
+
     def nearest_grid_point(self):
         r""" 
         Rounds the object location to determine nearest integer grid point
@@ -647,72 +1530,146 @@ class Movable:
 
     def update_position(self, move):
         r"""
-        
+        Move by a step, rounding to PLACES decimals so that one long step
+        and the ticks of short steps adding up to it end on the same
+        float, and skip_ahead plays the same game as ticking
+
         """
         (old_x, old_y)   = self.place
         (move_x, move_y) = move
         (new_x, new_y)   = (old_x + move_x, old_y + move_y)
-        self.place = (new_x, new_y)
+        self.place = (round(new_x, PLACES), round(new_y, PLACES))
 
-    def capsule_eaten(self):
+    def key_pressed(self, key, when):
         pass
 
+    def save(self):
+        r""" return this mover's changing state as a tuple, extended by
+            child classes """
+        return (self.place, self.previous)
+
+    def restore(self, saved):
+        r""" go back to a tuple returned by save """
+        (self.place, self.previous) = saved[:2]
+
+    def quiet_time(self):
+        r""" time until this mover next does something that needs a
+            tick of its own, set by child classes """
+        return 0.0
+
+    def state(self):
+        r""" return an immutable MoverState of what is drawn """
+        return MoverState(self.kind, self.place, self.direction, self.color)
+
 
 class Pacman(Movable):
+    kind = 'pacman'
+
     def __init__(self, maze, location):
-        Movable.__init__(self, maze, location, PAC_SPEED)
+        Movable.__init__(self, maze, location, maze.config.pac_speed)
+        self.player    = 0
+        self.color     = maze.config.pac_color
         self.direction = 0
-
-    def draw_me(self):
-        maze         = self.maze
-        screen_point = maze.to_screen(self.place)
-        angle        = (self.get_angle()+self.direction) * DEG_TO_RAD
-        mouthpoints = []
-        # set mouth verticies based on direction
-        if self.direction in [0, 180]:
-            # +/- sin for left and right
-            mouthpoints.append((screen_point[0] + PAC_SIZE *math.cos(angle), screen_point[1] + PAC_SIZE *math.sin(angle)))
-            mouthpoints.append((screen_point[0] + PAC_SIZE *math.cos(angle), screen_point[1] - PAC_SIZE *math.sin(angle)))
-        else:
-            # +/- cos for up and down
-            mouthpoints.append((screen_point[0] + PAC_SIZE *math.cos(angle), screen_point[1] + PAC_SIZE *math.sin(angle)))
-            mouthpoints.append((screen_point[0] - PAC_SIZE *math.cos(angle), screen_point[1] + PAC_SIZE *math.sin(angle)))
-        self.body    = gx.Circle(gx.Point(*screen_point),PAC_SIZE)
-        self.mouth   = gx.Polygon([gx.Point(*screen_point), gx.Point(*[math.ceil(x) for x in mouthpoints[0]]), gx.Point(*[math.ceil(x) for x in mouthpoints[1]])])
-        self.body.setFill(PAC_COLOR)
-        self.mouth.setFill(BACKGROUND_COLOR)
-        self.body.draw(self.maze.win)
-        self.mouth.draw(self.maze.win)
-
-    def get_angle(self):
-        (x, y) = self.place
-        (near_x, near_y) = self.nearest_grid_point()
-        distance = abs(x - near_x) + abs(y - near_y)
-        return 1 + 90*distance
-
-    def move(self):
-        keys = self.maze.win.lastKey
-        if   'Left'  in keys:
-            self.try_move((-1,  0))
-        elif 'Right' in keys:
-            self.try_move(( 1,  0))
-        elif 'Up'    in keys:
-            # directions reversed for graphics.py
-            self.try_move(( 0, -1))
-        elif 'Down'  in keys:
-            # directions reversed for graphics.py
-            self.try_move(( 0,  1))
-        elif 'q'     in keys:
+        self.heading   = None                # move currently being made
+        self.wanted    = None                # turn waiting for a junction
+        self.turns     = collections.deque() # (move, time) since last tick
+
+    def save(self):
+        return Movable.save(self) + (self.direction, self.heading, self.wanted,
+                                     tuple(self.turns))
+
+    def restore(self, saved):
+        Movable.restore(self, saved)
+        (self.direction, self.heading, self.wanted, turns) = saved[2:]
+        self.turns = collections.deque(turns)
+
+    def key_pressed(self, key, when):
+        if key in KEY_MOVES:
+            self.turns.append((KEY_MOVES[key], when))
+        elif key == 'q':
             self.maze.game_over = True
-        self.maze.pacman_loc(self, self.place)
 
-    def try_move(self, move):
+    def move(self, dt=1.0):
+        # Take turns in the order they were pressed. A turn that is
+        # possible now is made at once; otherwise the latest one waits
+        # in wanted and is made at the first junction that allows it.
+        maze = self.maze
+        while self.turns:
+            (turn, when) = self.turns.popleft()
+            # the response shows up in the snapshot of the tick under way
+            maze.latency.consumed(when, maze.ticks + 1)
+            if self.furthest_move(turn) != (0, 0):
+                self.heading = turn
+                self.wanted  = None
+            else:
+                self.wanted  = turn
+        # spend dt in straight runs, so a long step can still turn at
+        # the junction it passes
+        left = dt
+        while left > EPSILON:
+            if self.wanted is not None and self.furthest_move(self.wanted) != (0, 0):
+                self.heading = self.wanted
+                self.wanted  = None
+            if self.heading is None:
+                break
+            moved = self.try_move(self.heading, left)
+            if moved <= EPSILON:
+                break
+            left -= moved / self.speed
+
+    def quiet_time(self):
+        # quiet until the next grid point where a capsule or the last
+        # food is eaten, or until a waiting turn can be made: move takes
+        # it once the junction is the nearest grid point, half a cell
+        # before pacman gets there
+        if self.turns:
+            return 0.0
+        if self.heading is None:
+            return float('inf')
+        maze = self.maze
+        (step_x, step_y) = self.heading
+        (cur_x, cur_y)   = self.place
+        (near_x, near_y) = self.nearest_grid_point()
+        if (step_x != 0 and cur_y != near_y) or (step_y != 0 and cur_x != near_x):
+            # still lining up with the grid for a turn
+            return 0.0
+        if self.wanted == (-step_x, -step_y):
+            # turning back is possible as soon as pacman is off a grid
+            # point, so within a tick
+            return 0.0
+        # first grid point ahead of us, and how far away it is
+        point    = (near_x, near_y)
+        distance = (near_x - cur_x)*step_x + (near_y - cur_y)*step_y
+        if distance <= 0:
+            if self.wanted is not None and self.furthest_move(self.wanted) != (0, 0):
+                return 0.0
+            point     = (near_x + step_x, near_y + step_y)
+            distance += 1
+        food = maze.food_count
+        while not maze.object_at(point).is_wall():
+            if maze.has_food(point):
+                food -= 1
+            if food == 0 or maze.cell_bit(point) & maze.capsule_bits:
+                # eaten once a move ends within 3/4 of a step of it, so
+                # leave that tick to be played on its own
+                return max(distance / self.speed - 0.75, 0.0)
+            if self.wanted is not None:
+                (turn_x, turn_y) = self.wanted
+                if not maze.object_at((point[0] + turn_x, point[1] + turn_y)).is_wall():
+                    return max(distance - 0.5, 0.0) / self.speed
+            point     = (point[0] + step_x, point[1] + step_y)
+            distance += 1
+        # running into a wall, then standing still
+        return float('inf') if self.wanted is None else distance / self.speed
+
+    def try_move(self, move, dt=1.0):
+        # returns the distance moved
         (move_x, move_y) = move
         (cur_x, cur_y)   = self.place
         (near_x, near_y) = self.nearest_grid_point()
         if self.furthest_move(move) == (0,0):
             # can't go that direction
-            return
+            return 0
         if move_x != 0 and cur_y != near_y:
             # want horizontal, not at a grid point, get to nearest grid point
             move_x = 0
@@ -722,16 +1679,20 @@ class Pacman(Movable):
             move_x = near_x - cur_x
             move_y = 0
         # restrict movement to furthest available without hitting walls
-        move = self.furthest_move((move_x, move_y))
+        move = self.furthest_move((move_x, move_y), dt)
+        if self.wanted is not None:
+            # stop at the next grid point to see if the turn fits there
+            move = self.to_next_grid_point(move)
         self.move_by(move)
+        return abs(move[0]) + abs(move[1])
 
     def move_by(self, move):
+        start = self.place
         self.update_position(move)
-        old_body  = self.body
-        old_mouth = self.mouth
-        self.draw_me()
-        old_body.undraw()
-        old_mouth.undraw()
+        # eat whatever was passed over on the way, for moves that skip
+        # grid points
+        for point in grid_points_between(start, self.place):
+            self.maze.object_at(point).eat_me(self)
         (cur_x, cur_y)   = self.place
         (near_x, near_y) = self.nearest_grid_point()
         distance = (abs(cur_x - near_x) + abs(cur_y-near_y))
@@ -750,132 +1711,833 @@ class Pacman(Movable):
         elif move_y < 0:
             self.direction = 270
 
-    def pacman_loc(self, mypac, location):
-        pass
-
 
 class Ghost(Movable):
-    num = 0
+    kind = 'ghost'
 
-    def __init__(self, maze, start):
-        Ghost.num       += 1
+    def __init__(self, maze, start, number=1):
+        config          = maze.config
         self.place      = start
         self.next_point = start
         self.movement   = (0, 0)
-        self.color      = GHOST_COLORS[Ghost.num % 4]
+        self.route      = collections.deque() # corridor waypoints still to go
+        self.decisions  = 0
+        self.wanted     = None                # player's next turn, if controlled
+        self.color      = config.ghost_colors[number % len(config.ghost_colors)]
         self.orig_color = self.color
         self.time_left  = 0
         self.start      = start
-        Movable.__init__(self, maze, start, GHOST_SPEED)
-
-    def draw_me(self):
-        maze = self.maze
-        (screen_x, screen_y) = maze.to_screen(self.place)
-        body_points = []
-        for (x,y) in GHOST_SHAPE:
-            body_points.append((x*GRID_SIZE + screen_x, y*GRID_SIZE + screen_y))
-        vertices = [gx.Point(x,y) for (x,y) in body_points]
-        self.body = gx.Polygon(*vertices)
-        self.body.setFill(self.color)
-        self.body.setOutline(self.color)
-        self.body.draw(maze.win)
-
-    def capsule_eaten(self):
-        self.change_color(SCARED_COLOR)
-        self.time_left = SCARED_TIME
+        # settings read on every tick, copied out of the config
+        self.scared_time  = config.scared_time
+        self.warn_time    = config.warn_time
+        self.scared_color = config.scared_color
+        self.catch_sq     = config.catch_distance ** 2
+        Movable.__init__(self, maze, start, config.ghost_speed)
+        maze.events.subscribe(ev.CapsuleEaten, self.capsule_eaten)
+        maze.events.subscribe(ev.PacmanMoved, self.pacman_moved)
+        self.previous   = start
+
+    def key_pressed(self, key, when):
+        # only reaches ghosts given a player; the turn is taken at the
+        # next junction
+        if key in KEY_MOVES:
+            self.wanted = KEY_MOVES[key]
+
+    def save(self):
+        return Movable.save(self) + (self.next_point, self.movement, tuple(self.route),
+                                     self.decisions, self.wanted, self.color,
+                                     self.time_left)
+
+    def restore(self, saved):
+        Movable.restore(self, saved)
+        (self.next_point, self.movement, route, self.decisions, self.wanted,
+         self.color, self.time_left) = saved[2:]
+        self.route = collections.deque(route)
+
+    def capsule_eaten(self, event):
+        self.change_color(self.scared_color)
+        self.time_left = self.scared_time
 
     def change_color(self, new_color):
         self.color = new_color
-        self.body.setFill(new_color)
 
-    def move(self):
+    def move(self, dt=1.0):
+        # keep choosing at each point reached until dt is spent
+        left = dt
+        while left > EPSILON:
+            (cur_x, cur_y)   = self.place
+            (next_x, next_y) = self.next_point
+            move = (next_x - cur_x, next_y - cur_y)
+            move = self.furthest_move(move, left)
+            if move == (0,0):
+                if self.route:
+                    # corner of the corridor, nothing to decide
+                    move = self.follow_route(left)
+                else:
+                    move = self.choose_move(left)
+            self.move_by(move)
+            moved = abs(move[0]) + abs(move[1])
+            if moved <= EPSILON:
+                break
+            left -= moved / self.speed
+        if self.time_left > 0:
+            self.update_scared(dt)
+
+    def quiet_time(self):
+        # quiet until the end of the corridor or the end of being scared
         (cur_x, cur_y)   = self.place
         (next_x, next_y) = self.next_point
-        move = (next_x - cur_x, next_y - cur_y)
-        move = self.furthest_move(move)
-        if move == (0,0):
-            move = self.choose_move()
-        self.move_by(move)
+        distance = abs(next_x - cur_x) + abs(next_y - cur_y)
+        for (x, y) in self.route:
+            distance += abs(x - next_x) + abs(y - next_y)
+            (next_x, next_y) = (x, y)
+        quiet = distance / self.speed
         if self.time_left > 0:
-            self.update_scared()
+            quiet = min(quiet, self.time_left)
+        return quiet
 
-    def update_scared(self):
-        self.time_left = self.time_left - 1
+    def update_scared(self, dt=1.0):
+        self.time_left = max(self.time_left - dt, 0)
         time_left      = self.time_left
-        if time_left < WARN_TIME:
-            if time_left % 2 == 0:
+        # the flashing follows the time left, not the number of ticks
+        if time_left < self.warn_time:
+            if int(math.ceil(time_left)) % 2 == 0:
                 color = self.orig_color
             else:
-                color = SCARED_COLOR
+                color = self.scared_color
             self.change_color(color)
 
-    def choose_move(self):
+    def choose_move(self, dt=1.0):
+        # at a junction (or on a fresh start): pick any way but back, then
+        # commit to the whole corridor that way
         (move_x, move_y) = self.movement
-        (near_x, near_y) = self.nearest_grid_point()
-        possible_moves = []
-
-        if move_x >= 0 and self.can_move_by(( 1,  0)):
-            possible_moves.append(( 1,  0))
-        if move_x <= 0 and self.can_move_by((-1,  0)):
-            possible_moves.append((-1,  0))
-        if move_y >= 0 and self.can_move_by(( 0,  1)):
-            possible_moves.append(( 0,  1))
-        if move_y <= 0 and self.can_move_by(( 0, -1)):
-            possible_moves.append(( 0, -1))
-
-        if len(possible_moves) != 0:
-            choice = random.randint(0, len(possible_moves)-1)
+        near  = self.nearest_grid_point()
+        exits = self.maze.corridors.exits.get(near, [])
+        possible_moves = [move for move in exits if move != (-move_x, -move_y)]
+
+        if self.player is not None:
+            # a player's ghost takes the turn asked for, back included,
+            # and otherwise keeps straight on where it can
+            if self.wanted in exits:
+                possible_moves = [self.wanted]
+                self.wanted    = None
+            elif self.movement in possible_moves:
+                possible_moves = [self.movement]
+
+        if len(possible_moves) == 1:
+            move = possible_moves[0]
+        elif len(possible_moves) != 0:
+            self.decisions += 1
+            choice = self.maze.random.randint(0, len(possible_moves)-1)
             move   = possible_moves[choice]
-            (move_x, move_y) = move
         else:
-            move_x = -move_x
-            move_y = -move_y
-            move   = (move_x, move_y)
-
-        (cur_x, cur_y)  = self.place
-        self.next_point = (cur_x + move_x, cur_y + move_y)
-        self.movement = move
-        return self.furthest_move(move)
-
-    def can_move_by(self, move):
-        move = self.furthest_move(move)
-        return move != (0,0)
+            # dead end, turn back
+            move = (-move_x, -move_y)
+            if move not in exits:
+                # boxed in
+                return (0, 0)
+
+        corridor   = self.maze.corridors.corridor(near, move)
+        self.route = collections.deque(corridor.waypoints)
+        return self.follow_route(dt)
+
+    def follow_route(self, dt=1.0):
+        # head for the next waypoint of the corridor
+        (cur_x, cur_y)   = self.place
+        (next_x, next_y) = self.route.popleft()
+        self.next_point  = (next_x, next_y)
+        move = (next_x - cur_x, next_y - cur_y)
+        # unit direction of this straight run
+        self.movement = (int(math.copysign(1, move[0])) if move[0] else 0,
+                         int(math.copysign(1, move[1])) if move[1] else 0)
+        return self.furthest_move(move, dt)
 
     def move_by(self, move):
         self.update_position(move)
-        old_body  = self.body
-        self.draw_me()
-        old_body.undraw()
 
-    def pacman_loc(self, mypac, location):
-        (my_x, my_y)     = self.place
-        (pac_x, pac_y)   = location
-        (delt_x, delt_y) = (my_x - pac_x, my_y - pac_y)
-        dis_sq           = delt_x*delt_x + delt_y*delt_y
-        limit            = 1.6*1.6
-        if dis_sq < limit:
-            self.bump_into(mypac)
+    def pacman_moved(self, event):
+        # closest the two came while moving this tick, so fast movers
+        # can't pass through each other
+        dis_sq = closest_approach(event.start, event.place, self.previous, self.place)
+        if dis_sq < self.catch_sq:
+            self.bump_into(event.pacman)
 
     def bump_into(self, mypac):
         if self.time_left != 0:
             self.captured(mypac)
         else:
-            self.maze.loser()
+            self.maze.loser(mypac.place)
 
     def captured(self, mypac):
+        self.maze.events.publish(ev.GhostCaptured(self, self.place))
         self.place = self.start
         self.color = self.orig_color
         self.time_left = 0
-        self.body.undraw()
-        self.draw_me()
+        # head home fresh, not towards the point chosen before capture
+        self.next_point = self.start
+        self.movement   = (0, 0)
+        self.route.clear()
+
+
+class StateBuffer:
+    r"""
+    StateBuffer Class
+        Double buffer of published snapshots. The simulation publishes a
+        new Snapshot each tick; the renderer reads the latest two so it
+        can interpolate between them. Safe to use across threads.
+
+    Attributes
+    ----------
+    previous : Snapshot published before current, or None
+    current  : most recently published Snapshot, or None
+
+    Methods
+    -------
+    publish : make a snapshot the current one
+    latest  : return (previous, current)
+
+    """
+
+    def __init__(self):
+        self.lock     = threading.Lock()
+        self.previous = None
+        self.current  = None
+
+    def publish(self, snapshot):
+        r""" make snapshot the current one, keeping the last as previous """
+        with self.lock:
+            self.previous = self.current
+            self.current  = snapshot
+
+    def latest(self):
+        r""" return the (previous, current) pair of snapshots """
+        with self.lock:
+            return (self.previous, self.current)
+
+
+class FoodIndex:
+    r"""
+    FoodIndex Class
+        Bucket grid over the remaining food for nearest food queries. The
+        map is cut into square buckets; a query searches rings of buckets
+        outwards from the query point and stops once no closer food can
+        be in the next ring. Kept up to date as food is eaten.
+
+    Attributes
+    ----------
+    bucket  : bucket side in map cells
+    buckets : list of sets of (x, y) food locations, row major
+    cols    : buckets per row
+    count   : food in the index
+    rows    : bucket rows
+
+    Methods
+    -------
+    add     : add a food location
+    remove  : remove a food location
+    nearest : return the closest food location to a point
+
+    """
+
+    def __init__(self, width, height, bucket=8):
+        self.bucket  = bucket
+        self.cols    = (width + bucket - 1) // bucket
+        self.rows    = (height + bucket - 1) // bucket
+        self.buckets = [set() for index in range(self.cols * self.rows)]
+        self.count   = 0
+
+    def _bucket(self, location):
+        (x, y) = location
+        return self.buckets[(y // self.bucket) * self.cols + x // self.bucket]
+
+    def add(self, location):
+        r""" add an integer (x, y) food location """
+        cells = self._bucket(location)
+        if location not in cells:
+            cells.add(location)
+            self.count += 1
+
+    def remove(self, location):
+        r""" remove an integer (x, y) food location, if present """
+        cells = self._bucket(location)
+        if location in cells:
+            cells.remove(location)
+            self.count -= 1
+
+    def nearest(self, place):
+        r"""
+        Return the food location closest to place, ties broken by
+        location, or None if the index is empty
+
+        Parameters
+        ----------
+        place : (x, y) map location, may be fractional
+
+        """
+        if self.count == 0:
+            return None
+        (px, py) = place
+        size = self.bucket
+        bx   = min(max(int(px) // size, 0), self.cols - 1)
+        by   = min(max(int(py) // size, 0), self.rows - 1)
+        best = None
+        for ring in range(max(self.cols, self.rows)):
+            if best is not None:
+                # food in this ring is at least this far away on one axis
+                bound = (ring - 1) * size
+                if bound > 0 and bound*bound > best[0]:
+                    break
+            for row in range(max(by - ring, 0), min(by + ring, self.rows - 1) + 1):
+                edge = row == by - ring or row == by + ring
+                step = 1 if edge else 2 * ring
+                for col in range(bx - ring, bx + ring + 1, max(step, 1)):
+                    if col < 0 or col >= self.cols:
+                        continue
+                    for cell in self.buckets[row * self.cols + col]:
+                        (dx, dy) = (cell[0] - px, cell[1] - py)
+                        key = (dx*dx + dy*dy, cell[1], cell[0])
+                        if best is None or key < best:
+                            best = key
+        if best is None:
+            return None
+        return (best[2], best[1])
+
+
+class CorridorGraph:
+    r"""
+    CorridorGraph Class
+        The open cells of a maze compiled into a graph. Nodes are the
+        junctions and dead ends (cells without exactly two open
+        neighbours); edges are the corridors joining them, weighted by
+        length. A ghost following a corridor has nothing to decide until
+        it reaches the node at the other end.
+
+    Attributes
+    ----------
+    corridors : (cell, direction) to Corridor, for every node exit and
+        any other cell asked about
+    exits     : open cell to list of open directions, in DIRECTIONS order
+    nodes     : set of node cells
+
+    Methods
+    -------
+    is_node      : T/F cell is a junction or dead end
+    corridor     : return the Corridor leaving a cell in a direction
+    mean_length  : average corridor length, the steps per ghost decision
+
+    """
+
+    def __init__(self, maze):
+        (width, height) = (maze.width, maze.height)
+        open_cells = set()
+        for y in range(height):
+            for x in range(width):
+                if not maze.map[y][x].is_wall():
+                    open_cells.add((x, y))
+        self.exits = {}
+        for (x, y) in open_cells:
+            self.exits[(x, y)] = [(dx, dy) for (dx, dy) in DIRECTIONS
+                                  if (x + dx, y + dy) in open_cells]
+        self.nodes     = set(cell for (cell, moves) in self.exits.items()
+                             if len(moves) != 2)
+        self.corridors = {}
+        for node in self.nodes:
+            for direction in self.exits[node]:
+                self.corridor(node, direction)
+
+    def is_node(self, cell):
+        r""" T/F cell is a junction or dead end """
+        return cell in self.nodes
+
+    def corridor(self, cell, direction):
+        r"""
+        Return the Corridor followed from cell leaving in direction,
+        walking it the first time it is asked for
+
+        Parameters
+        ----------
+        cell      : open (x, y) grid point
+        direction : one of DIRECTIONS, open from cell
+
+        """
+        key = (cell, direction)
+        if key in self.corridors:
+            return self.corridors[key]
+        waypoints = []
+        (x, y)    = cell
+        heading   = direction
+        length    = 0
+        while True:
+            (x, y)  = (x + heading[0], y + heading[1])
+            length += 1
+            if (x, y) in self.nodes or (x, y) == cell:
+                # a junction, or all the way round a loop without one
+                break
+            back = (-heading[0], -heading[1])
+            turn = [move for move in self.exits[(x, y)] if move != back][0]
+            if turn != heading:
+                waypoints.append((x, y))
+                heading = turn
+        waypoints.append((x, y))
+        corridor = Corridor((x, y), length, tuple(waypoints), heading)
+        self.corridors[key] = corridor
+        return corridor
+
+    def mean_length(self):
+        r""" average length of the corridors leaving nodes """
+        lengths = [corridor.length for ((cell, move), corridor) in self.corridors.items()
+                   if cell in self.nodes]
+        if not lengths:
+            return 0.0
+        return sum(lengths) / len(lengths)
+
+
+class Viewport:
+    r"""
+    Viewport Class
+        The part of a large maze shown in a window that scrolls to follow
+        pacman. Wall lines, food and capsule dots are only kept for cells
+        in view plus a margin of pad cells; when the view scrolls, the
+        items of cells leaving it are moved to cells coming into it, so
+        the number of canvas items depends on the window, not the maze.
+
+    Attributes
+    ----------
+    columns : cells across the view
+    rows    : cells down the view
+    pad     : cells kept drawn beyond each side of the view
+    edge    : cells from the side of the view at which it recentres
+    left    : map column at the left of the view
+    top     : map row at the top of the view
+    shown   : map cell to list of (kind, graphics object) drawn for it
+    pools   : kind to list of graphics objects parked off screen
+    created : graphics objects created, over the whole game
+
+    Methods
+    -------
+    follow  : recentre on a place near the side of the view
+    refresh : redraw one cell's items after it changes
+
+    """
+
+    # where each kind of item sits relative to its cell, in cells
+    OFFSETS = {'food': (0, 0), 'capsule': (0, 0), 'hwall': (0.5, 0), 'vwall': (0, 0.5)}
+
+    def __init__(self, maze, columns, rows, pad=1, edge=None):
+        self.maze    = maze
+        self.columns = min(columns, maze.width)
+        self.rows    = min(rows, maze.height)
+        self.pad     = pad
+        if edge is None:
+            edge = max(1, min(self.columns, self.rows) // 4)
+        self.edge    = edge
+        self.shown   = {}
+        self.pools   = dict((kind, []) for kind in self.OFFSETS)
+        self.created = 0
+        # items parked off screen are centred here
+        self.parking = gx.Point(-4*maze.grid_size, -4*maze.grid_size)
+        pacman = [mover for mover in maze.movables if isinstance(mover, Pacman)]
+        (self.left, self.top) = (0, 0)
+        if pacman:
+            (self.left, self.top) = self.recentre(pacman[0].place)
+        maze.origin = (self.left, self.top)
+        for cell in self.region():
+            self.place_cell(cell, self.spare())
+
+    def recentre(self, place):
+        r""" (left, top) of a view centred on place, kept inside the maze """
+        maze = self.maze
+        left = int(round(place[0])) - self.columns // 2
+        top  = int(round(place[1])) - self.rows // 2
+        return (min(max(left, 0), maze.width - self.columns),
+                min(max(top, 0), maze.height - self.rows))
+
+    def region(self):
+        r""" set of map cells kept drawn for the current view """
+        maze = self.maze
+        xs = range(max(self.left - self.pad, 0),
+                   min(self.left + self.columns + self.pad, maze.width))
+        ys = range(max(self.top - self.pad, 0),
+                   min(self.top + self.rows + self.pad, maze.height))
+        return set((x, y) for x in xs for y in ys)
+
+    def kinds(self, cell):
+        r""" kinds of item a map cell needs drawn right now """
+        maze   = self.maze
+        (x, y) = cell
+        kinds  = []
+        if maze.map[y][x].is_wall():
+            if x + 1 < maze.width and maze.map[y][x+1].is_wall():
+                kinds.append('hwall')
+            if y + 1 < maze.height and maze.map[y+1][x].is_wall():
+                kinds.append('vwall')
+        elif maze.has_food(cell):
+            kinds.append('food')
+        elif maze.cell_bit(cell) & maze.capsule_bits:
+            kinds.append('capsule')
+        return kinds
+
+    def spare(self):
+        r""" empty kind to list of items free to take, for place_cell """
+        return dict((kind, []) for kind in self.OFFSETS)
+
+    def make(self, kind):
+        r""" create and draw a new item of a kind, at the parking point """
+        config = self.maze.config
+        (x, y) = (self.parking.x, self.parking.y)
+        half   = self.maze.grid_size / 2
+        if kind in ('hwall', 'vwall'):
+            (dx, dy) = (half, 0) if kind == 'hwall' else (0, half)
+            item = gx.Line(gx.Point(x - dx, y - dy), gx.Point(x + dx, y + dy))
+            item.setWidth(2)
+            item.setOutline(config.wall_color)
+        else:
+            (size, color) = ((config.food_size, config.food_color) if kind == 'food'
+                             else (config.cap_size, config.cap_color))
+            item = gx.Circle(gx.Point(x, y), size)
+            item.setFill(color)
+            item.setOutline(color)
+        item.draw(self.maze.win)
+        self.created += 1
+        return item
+
+    def place_cell(self, cell, spare):
+        r"""
+        Draw a cell's items, reusing objects from spare, then the pools,
+        and creating them only when both are empty
+
+        Parameters
+        ----------
+        cell  : (1,2) integer tuple
+            location in map
+        spare : kind to list of graphics objects still drawn somewhere
+            else and free to take
+
+        """
+        items = []
+        for kind in self.kinds(cell):
+            if spare[kind]:
+                item = spare[kind].pop()
+            elif self.pools[kind]:
+                item = self.pools[kind].pop()
+            else:
+                item = self.make(kind)
+            (off_x, off_y) = self.OFFSETS[kind]
+            (x, y)  = self.maze.to_screen((cell[0] + off_x, cell[1] + off_y))
+            center  = item.getCenter()
+            item.move(x - center.x, y - center.y)
+            items.append((kind, item))
+        if items:
+            self.shown[cell] = items
+
+    def park(self, spare):
+        r""" move unused items off screen and back into their pools """
+        for (kind, items) in spare.items():
+            for item in items:
+                center = item.getCenter()
+                item.move(self.parking.x - center.x, self.parking.y - center.y)
+            self.pools[kind].extend(items)
+
+    def follow(self, place):
+        r"""
+        Recentre the view on place if it has come within edge cells of a
+        side, moving the items of cells that stay in view and recycling
+        those of cells that leave it for cells that come into it
+
+        Returns
+        -------
+        (dx, dy) screen shift of everything drawn, or None if unmoved
+
+        """
+        (x, y) = place
+        (left, top) = (self.left, self.top)
+        if (x - left < self.edge or left + self.columns - 1 - x < self.edge or
+                y - top < self.edge or top + self.rows - 1 - y < self.edge):
+            (left, top) = self.recentre(place)
+        if (left, top) == (self.left, self.top):
+            return None
+        grid  = self.maze.grid_size
+        shift = ((self.left - left) * grid, (self.top - top) * grid)
+        old   = set(self.shown)
+        (self.left, self.top) = (left, top)
+        self.maze.origin = (left, top)
+        new   = self.region()
+        spare = self.spare()
+        for cell in old - new:
+            for (kind, item) in self.shown.pop(cell):
+                spare[kind].append(item)
+        for items in self.shown.values():
+            for (kind, item) in items:
+                item.move(*shift)
+        for cell in new - old:
+            self.place_cell(cell, spare)
+        self.park(spare)
+        return shift
+
+    def refresh(self, cell):
+        r""" redraw a cell in view after its food or capsule came or went """
+        if not (self.left - self.pad <= cell[0] < self.left + self.columns + self.pad and
+                self.top - self.pad <= cell[1] < self.top + self.rows + self.pad):
+            return
+        spare = self.spare()
+        for (kind, item) in self.shown.pop(cell, []):
+            spare[kind].append(item)
+        self.place_cell(cell, spare)
+        self.park(spare)
+
+
+class Renderer:
+    r"""
+    Renderer Class
+        Draws snapshots of a maze's movers into its window. Only the
+        renderer touches movable graphics, so it must run on the thread
+        that owns the window.
+
+    Attributes
+    ----------
+    drawn   : number of Maze.eaten entries already undrawn
+    maze    : maze object
+    message : loss message graphics object, once shown
+    sprites : one sprite per movable, in Maze.movables order
+
+    Methods
+    -------
+    __init__ : make a sprite for each movable
+    render   : draw the movers interpolated between two snapshots
+
+    """
+
+    def __init__(self, maze):
+        self.maze    = maze
+        self.drawn   = 0
+        self.message = None
+        self.sprites = []
+        for mover in maze.movables:
+            if isinstance(mover, Pacman):
+                self.sprites.append(PacmanSprite(maze))
+            else:
+                self.sprites.append(GhostSprite(maze))
+
+    def render(self, previous, current, alpha=1.0):
+        r"""
+        Draw the movers at alpha of the way from previous to current
+
+        Parameters
+        ----------
+        previous : Snapshot or None
+        current  : Snapshot
+        alpha    : float in [0, 1]
+
+        """
+        maze = self.maze
+        # undraw food and capsules eaten since the last frame
+        for item in maze.eaten[self.drawn:current.eaten]:
+            if item.dot is not None:
+                item.dot.undraw()
+            else:
+                maze.viewport.refresh(item.place)
+        self.drawn = max(self.drawn, current.eaten)
+        if maze.viewport is not None:
+            # scroll to keep pacman in view; everything drawn shifts
+            for state in current.movers:
+                if state.kind == 'pacman':
+                    shift = maze.viewport.follow(state.place)
+                    if shift is not None:
+                        for sprite in self.sprites:
+                            sprite.scroll(*shift)
+                    break
+        for (index, state) in enumerate(current.movers):
+            place = state.place
+            if previous is not None and alpha < 1.0:
+                place = interpolate(previous.movers[index].place, place, alpha,
+                                    max(1.0, current.dt))
+            self.sprites[index].draw(place, state)
+        if current.lost and self.message is None:
+            mes_loc = gx.Point(maze.win.getWidth()/2, maze.win.getHeight()/4)
+            self.message = gx.Text(mes_loc, 'You Lose!')
+            self.message.setTextColor('white')
+            self.message.draw(maze.win)
+
+
+def interpolate(start, end, alpha, limit=1):
+    r"""
+    Return the place alpha of the way from start to end. Jumps of more
+    than limit grid points (a captured ghost going home) are not smoothed.
+
+    Parameters
+    ----------
+    start : (1,2) float tuple
+    end   : (1,2) float tuple
+    alpha : float in [0, 1]
+    limit : longest move a tick can make, in grid points
+
+    """
+    (x0, y0) = start
+    (x1, y1) = end
+    if abs(x1 - x0) > limit or abs(y1 - y0) > limit:
+        return end
+    return (x0 + (x1 - x0)*alpha, y0 + (y1 - y0)*alpha)
+
+
+class PacmanSprite:
+    r"""
+    PacmanSprite Class
+        Pacman's body and mouth graphics objects
+
+    Methods
+    -------
+    draw      : draw pacman at a place, facing the state's direction
+    get_angle : mouth opening for a place, widest between grid points
+    scroll    : follow a viewport scroll
+
+    """
+
+    def __init__(self, maze):
+        self.maze       = maze
+        self.size       = maze.config.pac_size
+        self.background = maze.config.background_color
+        self.body       = None
+        self.mouth      = None
+        self.shown      = None
+
+    def get_angle(self, place):
+        (x, y) = place
+        (near_x, near_y) = (int(round(x)), int(round(y)))
+        distance = abs(x - near_x) + abs(y - near_y)
+        return 1 + 90*distance
+
+    def draw(self, place, state):
+        if (place, state.direction) == self.shown:
+            return
+        maze         = self.maze
+        direction    = state.direction
+        screen_point = maze.to_screen(place)
+        angle        = (self.get_angle(place)+direction) * DEG_TO_RAD
+        size         = self.size
+        mouthpoints = []
+        # set mouth verticies based on direction
+        if direction in [0, 180]:
+            # +/- sin for left and right
+            mouthpoints.append((screen_point[0] + size *math.cos(angle), screen_point[1] + size *math.sin(angle)))
+            mouthpoints.append((screen_point[0] + size *math.cos(angle), screen_point[1] - size *math.sin(angle)))
+        else:
+            # +/- cos for up and down
+            mouthpoints.append((screen_point[0] + size *math.cos(angle), screen_point[1] + size *math.sin(angle)))
+            mouthpoints.append((screen_point[0] - size *math.cos(angle), screen_point[1] + size *math.sin(angle)))
+        vertices = [gx.Point(*screen_point), gx.Point(*[math.ceil(x) for x in mouthpoints[0]]), gx.Point(*[math.ceil(x) for x in mouthpoints[1]])]
+        if self.body is None:
+            self.body = gx.Circle(gx.Point(*screen_point), size)
+            self.body.setFill(state.color)
+            self.body.draw(maze.win)
+            self.mouth = gx.Polygon(vertices)
+            self.mouth.setFill(self.background)
+            self.mouth.draw(maze.win)
+        else:
+            # the body keeps its shape, just shift it; the mouth changes
+            # shape, so its points are set in place
+            center = self.body.getCenter()
+            self.body.move(screen_point[0] - center.x, screen_point[1] - center.y)
+            self.mouth.setPoints(vertices)
+        self.shown = (place, direction)
+
+    def scroll(self, dx, dy):
+        r""" the view moved: redraw at the next draw, wherever pacman is """
+        self.shown = None
+
+
+class GhostSprite:
+    r"""
+    GhostSprite Class
+        A ghost's body graphics object, moved and recoloured in place
+
+    Methods
+    -------
+    draw   : draw the ghost at a place in the state's color
+    scroll : follow a viewport scroll
+
+    """
+
+    def __init__(self, maze):
+        self.maze  = maze
+        self.scale = maze.grid_size
+        self.body  = None
+        self.place = None
+        self.color = None
+
+    def draw(self, place, state):
+        maze = self.maze
+        if self.body is None:
+            (screen_x, screen_y) = maze.to_screen(place)
+            body_points = []
+            for (x,y) in GHOST_SHAPE:
+                body_points.append((x*self.scale + screen_x, y*self.scale + screen_y))
+            vertices = [gx.Point(x,y) for (x,y) in body_points]
+            self.body = gx.Polygon(*vertices)
+            self.body.draw(maze.win)
+        elif place != self.place:
+            (old_x, old_y) = self.place
+            (new_x, new_y) = place
+            self.body.move((new_x - old_x)*self.scale, (new_y - old_y)*self.scale)
+        self.place = place
+        if state.color != self.color:
+            self.body.setFill(state.color)
+            self.body.setOutline(state.color)
+            self.color = state.color
+
+    def scroll(self, dx, dy):
+        r""" shift the body with the rest of the view """
+        if self.body is not None:
+            self.body.move(dx, dy)
 
 # Instance variables
 
 
 if __name__ == '__main__':
-    my_maze = Maze(my_layout)
-    while not my_maze.finished():
-        my_maze.play()
+    parser = argparse.ArgumentParser(description='Play PacMan')
+    parser.add_argument('--backend', choices=sorted(gx.BACKENDS),
+                        help='graphics backend (default: tk)')
+    parser.add_argument('--record', metavar='DIR',
+                        help='capture every frame into DIR')
+    parser.add_argument('--record-format', choices=['png', 'raw'],
+                        default='png', help='frame format for --record')
+    parser.add_argument('--latency', action='store_true',
+                        help='print input latency percentiles at the end')
+    parser.add_argument('--profile', action='store_true',
+                        help='print time per loop phase at the end')
+    parser.add_argument('--hud', action='store_true',
+                        help='show time per loop phase on screen')
+    parser.add_argument('--memory', type=int, metavar='N',
+                        help='sample memory every N ticks and print a report')
+    parser.add_argument('--speed', type=float, default=1.0, metavar='X',
+                        help='game speed, e.g. 10 for ten times faster')
+    parser.add_argument('--layout', default='classic',
+                        help="'classic' or 'WxH[:seed]' for a generated maze")
+    parser.add_argument('--viewport', metavar='COLSxROWS',
+                        help='show this many cells, scrolling to follow pacman')
+    args = parser.parse_args()
+    if args.backend:
+        gx.setDefaultBackend(args.backend)
+    viewport = None
+    if args.viewport:
+        viewport = tuple(int(size) for size in args.viewport.lower().split('x'))
+    if args.layout != 'classic':
+        (size, _, seed) = args.layout.partition(':')
+        (width, height) = [int(value) for value in size.lower().split('x')]
+        my_layout = generate_layout(width, height, seed=int(seed or 0))
+    my_maze = Maze(my_layout, viewport=viewport)
+    if args.record:
+        my_maze.win.startRecording(args.record, args.record_format)
+    if args.profile or args.hud:
+        my_maze.enable_profiling(hud=args.hud)
+    if args.memory:
+        my_maze.enable_memory_tracking(args.memory)
+    my_maze.run(time_scale=args.speed)
+    if args.latency:
+        print(my_maze.latency.summary())
+    if args.profile:
+        print(my_maze.profiler.summary())
+    if args.memory:
+        print(my_maze.memory.report())
     my_maze.done()
 
 
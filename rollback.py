@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Two player rollback play over a simulated network link
+
+Player 0 steers pacman and player 1 steers the first ghost. Each player
+runs a Peer with its own copy of the game. A peer never waits for the
+other player: it sends its own input for each tick, predicts the one it
+hasn't received yet (no key pressed, by far the most common input) and
+ticks on. When the real input arrives and differs from the prediction
+it restores the state saved before that tick and runs the ticks since
+again with the corrected inputs, which is why Maze.tick has to be
+deterministic and Maze.save_state cheap.
+
+Link is an in-process, seeded stand-in for a network: messages arrive
+a number of ticks late, with jitter and loss, so two peers can be played
+against each other in one process. Inputs ride along in every message
+until acknowledged, so a lost message only delays them.
+
+usage: python rollback.py [--latency N] [--jitter N] [--loss P] [--delay N]
+                          [--ticks N] [--seed N] [--layout L]
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import argparse
+import json
+import random
+
+import instrument
+import pacman as pm
+import sweep
+
+clock = instrument.clock
+
+PLAYERS = 2
+KEYS    = ['Left', 'Right', 'Up', 'Down']
+
+
+def make_game(layout, seed):
+    r"""
+    Return a Maze for two players: pacman is player 0 and the first
+    ghost player 1. Both peers must make theirs with the same arguments.
+
+    Parameters
+    ----------
+    layout : maze layout
+    seed   : ghost seed
+
+    """
+    maze   = pm.Maze(layout, backend='null', seed=seed)
+    ghosts = [mover for mover in maze.movables if isinstance(mover, pm.Ghost)]
+    if not ghosts:
+        raise ValueError('layout has no ghost for player 1')
+    ghosts[0].player = 1
+    return maze
+
+
+class Link:
+    r"""
+    Link Class
+        One direction of a simulated network connection, measured in
+        ticks. A message sent at tick t arrives at tick t + latency plus
+        up to jitter more, or never with probability loss; messages can
+        overtake each other.
+
+    Attributes
+    ----------
+    latency : ticks every message is late
+    jitter  : most extra ticks a message can be late
+    loss    : probability a message is dropped
+    random  : seeded random number generator
+    flight  : list of (arrival tick, message) on the way
+
+    Methods
+    -------
+    send    : send a message at a tick
+    receive : return the messages that have arrived by a tick
+
+    """
+
+    def __init__(self, latency=0, jitter=0, loss=0.0, seed=None):
+        self.latency = latency
+        self.jitter  = jitter
+        self.loss    = loss
+        self.random  = random.Random(seed)
+        self.flight  = []
+
+    def send(self, tick, message):
+        if self.random.random() < self.loss:
+            return
+        delay = self.latency + self.random.randint(0, self.jitter)
+        self.flight.append((tick + delay, message))
+
+    def receive(self, tick):
+        arrived     = [message for (when, message) in self.flight if when <= tick]
+        self.flight = [(when, message) for (when, message) in self.flight if when > tick]
+        return arrived
+
+
+class Peer:
+    r"""
+    Peer Class
+        One player's copy of a two player game, kept in step with the
+        other player's by prediction and rollback
+
+    Attributes
+    ----------
+    maze      : the Maze this peer simulates
+    player    : number of the local player
+    delay     : ticks local input is held back, trading responsiveness
+        for fewer rollbacks
+    inputs    : per player, tick to key (or None) known for certain
+    predicted : tick to the remote key assumed when it was simulated
+    states    : tick to the state saved before running it
+    tick      : next tick to simulate
+    confirmed : last tick with every player's input known
+    acked     : last tick of local input the remote peer has confirmed
+    rollbacks : number of rollbacks
+    replayed  : ticks simulated again in rollbacks
+    deepest   : most ticks replayed by one rollback
+    spent     : seconds spent restoring and replaying
+
+    Methods
+    -------
+    advance  : play one tick with this tick's local key
+    receive  : take in a message from the remote peer
+    message  : return the message for the remote peer
+    rollback : restore a tick's state and replay up to the present
+
+    """
+
+    def __init__(self, maze, player, delay=0):
+        self.maze      = maze
+        self.player    = player
+        self.remote    = 1 - player
+        self.delay     = delay
+        self.inputs    = [{} for index in range(PLAYERS)]
+        self.predicted = {}
+        self.states    = {}
+        self.tick      = 0
+        self.confirmed = -1
+        self.acked     = -1
+        self.rollbacks = 0
+        self.replayed  = 0
+        self.deepest   = 0
+        self.spent     = 0.0
+        # the first ticks can't have input from either player
+        for tick in range(delay):
+            self.inputs[player][tick] = None
+
+    def message(self):
+        r""" local inputs not yet acknowledged, and the last remote tick known """
+        local = self.inputs[self.player]
+        sent  = [(tick, local[tick]) for tick in sorted(local) if tick > self.acked]
+        return {'inputs': sent, 'ack': self.confirmed}
+
+    def receive(self, message):
+        r"""
+        Take in the remote peer's inputs, rolling back if any tick
+        already simulated was simulated with the wrong guess
+
+        """
+        remote = self.inputs[self.remote]
+        wrong  = None
+        for (tick, key) in message['inputs']:
+            if tick in remote:
+                continue
+            remote[tick] = key
+            if tick in self.predicted and self.predicted.pop(tick) != key:
+                if wrong is None or tick < wrong:
+                    wrong = tick
+        self.acked = max(self.acked, message['ack'])
+        while self.confirmed + 1 in remote and self.confirmed + 1 in self.inputs[self.player]:
+            self.confirmed += 1
+        if wrong is not None:
+            self.rollback(wrong)
+        # nothing before the last confirmed tick can be rolled back to, and
+        # inputs the remote peer has too are needed only until simulated
+        floor = min(self.confirmed, self.tick)
+        for tick in [tick for tick in self.states if tick < floor]:
+            del self.states[tick]
+        floor = min(floor, self.acked)
+        for inputs in self.inputs:
+            for tick in [tick for tick in inputs if tick < floor]:
+                del inputs[tick]
+
+    def simulate(self):
+        r""" run self.tick with the inputs known or predicted """
+        maze = self.maze
+        tick = self.tick
+        self.states[tick] = maze.save_state()
+        for player in range(PLAYERS):
+            inputs = self.inputs[player]
+            if tick in inputs:
+                key = inputs[tick]
+            else:
+                key = None   # prediction: no key pressed
+                self.predicted[tick] = key
+            if key is not None:
+                maze.key_pressed(key, player=player)
+        maze.tick()
+        self.tick += 1
+
+    def advance(self, key=None):
+        r"""
+        Play one tick
+
+        Parameters
+        ----------
+        key : key pressed by the local player this tick, or None
+
+        """
+        self.inputs[self.player][self.tick + self.delay] = key
+        if not self.maze.finished():
+            self.simulate()
+        else:
+            self.tick += 1
+
+    def rollback(self, tick):
+        r""" restore the state saved before tick and replay up to the present """
+        start = clock()
+        now   = self.tick
+        self.maze.restore_state(self.states[tick])
+        self.tick = tick
+        while self.tick < now:
+            self.predicted.pop(self.tick, None)
+            if self.maze.finished():
+                self.tick += 1
+            else:
+                self.simulate()
+        self.rollbacks += 1
+        self.replayed  += now - tick
+        self.deepest    = max(self.deepest, now - tick)
+        self.spent     += clock() - start
+
+
+def checksum(state):
+    r""" hash of a Maze.save_state tuple, to compare peers' games """
+    return hash(state)
+
+
+def replay(layout, seed, inputs, ticks):
+    r"""
+    Play a game from start to ticks with every input known in advance,
+    the result both peers must agree with
+
+    Parameters
+    ----------
+    layout : maze layout
+    seed   : ghost seed
+    inputs : per player, tick to key
+    ticks  : ticks to play
+
+    """
+    maze = make_game(layout, seed)
+    for tick in range(ticks):
+        if maze.finished():
+            break
+        for player in range(PLAYERS):
+            key = inputs[player].get(tick)
+            if key is not None:
+                maze.key_pressed(key, player=player)
+        maze.tick()
+    return maze.save_state()
+
+
+def play(layout, seed=0, ticks=1000, latency=4, jitter=2, loss=0.0, delay=0,
+         press_every=8):
+    r"""
+    Play both peers against each other over a pair of Links, with seeded
+    random key presses, then check they ended up in the same game as a
+    replay with every input known
+
+    Parameters
+    ----------
+    layout      : maze layout
+    seed        : seed for the game, the links and the key presses
+    ticks       : ticks to play
+    latency     : ticks of one way delay on the links
+    jitter      : most extra ticks of delay
+    loss        : probability a message is lost
+    delay       : ticks of local input delay
+    press_every : mean ticks between key presses of each player
+
+    Returns
+    -------
+    dict of rollback stats, save/restore cost and whether the games agree
+
+    """
+    peers = [Peer(make_game(layout, seed), player, delay) for player in range(PLAYERS)]
+    links = [Link(latency, jitter, loss, seed * 2 + player) for player in range(PLAYERS)]
+    keys  = random.Random(seed)
+    sent  = [{} for player in range(PLAYERS)]
+    start = clock()
+    for tick in range(ticks):
+        for (player, peer) in enumerate(peers):
+            key = None
+            if keys.random() < 1.0 / press_every:
+                key = keys.choice(KEYS)
+            sent[player][tick + delay] = key
+            for message in links[1 - player].receive(tick):
+                peer.receive(message)
+            peer.advance(key)
+            links[player].send(tick, peer.message())
+    # let every message land, then both peers have every input
+    for tick in range(ticks, ticks + latency + jitter + 1):
+        for (player, peer) in enumerate(peers):
+            for message in links[1 - player].receive(tick):
+                peer.receive(message)
+            links[player].send(tick, peer.message())
+    elapsed = clock() - start
+    final   = [peer.maze.save_state() for peer in peers]
+    settled = all(peer.confirmed >= ticks - 1 for peer in peers)
+    truth   = replay(layout, seed, [dict((tick, key) for (tick, key) in inputs.items()
+                                         if tick < ticks) for inputs in sent], ticks)
+
+    # cost of one save and one restore on the final state
+    maze  = peers[0].maze
+    state = maze.save_state()
+    begin = clock()
+    for index in range(1000):
+        maze.save_state()
+    save_us = (clock() - begin) * 1000
+    begin = clock()
+    for index in range(1000):
+        maze.restore_state(state)
+    restore_us = (clock() - begin) * 1000
+
+    rollbacks = sum(peer.rollbacks for peer in peers)
+    replayed  = sum(peer.replayed for peer in peers)
+    spent     = sum(peer.spent for peer in peers)
+    return {'ticks': ticks,
+            'game_ticks': maze.ticks,
+            'latency': latency, 'jitter': jitter, 'loss': loss, 'delay': delay,
+            'settled': settled,
+            'in_sync': checksum(final[0]) == checksum(final[1]) == checksum(truth),
+            'rollbacks': rollbacks,
+            'replayed_ticks': replayed,
+            'deepest_rollback': max(peer.deepest for peer in peers),
+            'rollback_ms_mean': spent / rollbacks * 1000 if rollbacks else None,
+            'replay_ticks_per_sec': replayed / spent if spent else None,
+            'save_us': save_us,
+            'restore_us': restore_us,
+            'seconds': elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Two player rollback over a simulated link')
+    parser.add_argument('--latency', type=int, default=4, help='one way delay in ticks')
+    parser.add_argument('--jitter', type=int, default=2, help='extra delay in ticks, at most')
+    parser.add_argument('--loss', type=float, default=0.0, help='message loss probability')
+    parser.add_argument('--delay', type=int, default=0, help='local input delay in ticks')
+    parser.add_argument('--ticks', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--layout', default='classic',
+                        help="'classic' or 'WxH[:seed]', as in sweep.py")
+    args   = parser.parse_args(argv)
+    layout = sweep.load_layout(args.layout, 4)
+    result = play(layout, args.seed, args.ticks, args.latency, args.jitter, args.loss,
+                  args.delay)
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,586 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-session PacMan game server (Python 3, asyncio)
+
+Hosts many games in one process. Each session's Maze is ticked by its
+own coroutine on a fixed, drift free schedule, so no game ever blocks
+another the way the sleep in Maze.play() does. Clients connect over a
+local socket (TCP on localhost or a unix socket), send key presses as
+newline delimited JSON and get back the changes to their game after
+every tick, encoded by broadcast.TickEncoder in the format they asked
+for: newline delimited JSON, or length prefixed binary frames.
+
+Client messages
+    {"type": "join", "layout": "classic"|"WxH[:seed]", "seed": N, "ghosts": N,
+     "format": "json"|"binary"}
+    {"type": "watch", "session": id, "format": "json"|"binary"}
+    {"type": "key", "key": "Left"}      only from the client that joined
+    {"type": "quit"}
+
+Server messages
+    {"type": "welcome", "session": id, "layout": [rows], "tick": n,
+     "quantum": q, "palette": [colors], "movers": [[index, x, y, facing, color]],
+     "food": [[x, y]], "capsules": [[x, y]]}
+    then a tick payload per tick, see broadcast.py
+    {"type": "error", "error": text}
+
+usage: python server.py [--host H] [--port N | --unix PATH] [--tick-rate N]
+       python server.py --loopback N [--seconds S] [--format F] [--spectators N]
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import argparse
+import asyncio
+import collections
+import gc
+import json
+import os
+import random
+import time
+
+import broadcast
+import instrument
+import pacman as pm
+import sweep
+
+# drop a watcher whose unsent output grows past this many bytes
+WRITE_LIMIT = 1 << 20
+# tick lateness samples kept per session
+JITTER_SAMPLES = 1024
+# fraction of a tick between the start phases of consecutive sessions,
+# the golden ratio so any run of sessions is spread evenly
+PHASE_STEP = 0.6180339887
+
+
+class Session:
+    r"""
+    Session Class
+        One game and the clients watching it. run() ticks the maze on a
+        fixed schedule and after each tick encodes the delta once per
+        format in use, sending the same bytes to every watcher.
+
+    Attributes
+    ----------
+    id       : session number
+    maze     : the Maze played
+    encoder  : TickEncoder of the maze
+    feeds    : format to the FanOut of the watchers using it
+    jitter   : deque of seconds each tick started late
+    ticks    : ticks run
+    closed   : T/F stop ticking
+
+    Methods
+    -------
+    send_key : queue a key press for the next tick
+    welcome  : return the welcome message for a new watcher
+    watch    : welcome a watcher and start sending it ticks
+    unwatch  : stop sending a watcher ticks
+    watchers : return the number of watchers
+    run      : coroutine ticking until the game is over or closed
+    close    : stop ticking and drop the watchers
+
+    """
+
+    def __init__(self, number, layout, seed=None, config=None):
+        self.id       = number
+        self.layout   = layout
+        self.maze     = pm.Maze(layout, backend='null', seed=seed, config=config,
+                                validate=True)
+        self.encoder  = broadcast.TickEncoder(self.maze)
+        self.feeds    = dict((format, broadcast.FanOut(format, WRITE_LIMIT))
+                             for format in broadcast.FORMATS)
+        self.jitter   = collections.deque(maxlen=JITTER_SAMPLES)
+        self.ticks    = 0
+        self.closed   = False
+
+    def send_key(self, key):
+        r""" queue a key press; read by the maze at its next tick """
+        self.maze.win.sendKey(key)
+
+    def welcome(self):
+        r""" return the welcome message: the layout and a keyframe """
+        message = {'type': 'welcome', 'session': self.id, 'layout': self.layout}
+        message.update(self.encoder.keyframe())
+        return message
+
+    def watch(self, writer, format=broadcast.JSON):
+        r""" send writer the welcome, then every tick from the next one """
+        writer.write(broadcast.frame_message(self.welcome(), format))
+        self.feeds[format].add(writer)
+
+    def unwatch(self, writer):
+        for feed in self.feeds.values():
+            feed.discard(writer)
+
+    def watchers(self):
+        return sum(len(feed) for feed in self.feeds.values())
+
+    async def run(self, tick_rate):
+        r"""
+        Tick until the game is over or the session is closed
+
+        Parameters
+        ----------
+        tick_rate : ticks per second
+
+        """
+        loop      = asyncio.get_running_loop()
+        period    = 1.0 / tick_rate
+        # spread sessions started together over the tick period, so they
+        # don't all wake at once and queue up behind each other
+        next_tick = loop.time() + (self.id * PHASE_STEP) % 1.0 * period
+        maze      = self.maze
+        while not maze.finished() and not self.closed:
+            next_tick += period
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            late = loop.time() - next_tick
+            self.jitter.append(late)
+            if late > period:
+                # fell a whole tick behind, don't catch up with a burst
+                next_tick = loop.time()
+            maze.tick()
+            self.ticks += 1
+            delta = self.encoder.update()
+            for feed in self.feeds.values():
+                if feed:
+                    if feed.format == broadcast.BINARY:
+                        feed.publish(self.encoder.encode(delta))
+                    else:
+                        feed.publish(self.encoder.encode_json(delta))
+
+    def close(self):
+        r""" stop ticking and drop the watchers """
+        self.closed = True
+        for feed in self.feeds.values():
+            feed.writers.clear()
+        self.maze.close()
+
+
+class GameServer:
+    r"""
+    GameServer Class
+        Accepts clients on a local socket and runs their sessions
+
+    Attributes
+    ----------
+    sessions  : session id to running Session
+    clients   : set of tasks handling connected clients
+    finished  : jitter samples of sessions that have ended
+    tick_rate : ticks per second of every session
+
+    Methods
+    -------
+    start       : coroutine, start listening
+    stop        : coroutine, close every session and client and stop listening
+    new_session : start a session
+    leave       : stop sending a session to a client
+    reset_stats : forget the ticks and jitter recorded so far
+    stats       : return session count, ticks and tick jitter percentiles
+
+    """
+
+    def __init__(self, tick_rate=20):
+        self.tick_rate = tick_rate
+        self.sessions  = {}
+        self.clients   = set()
+        self.finished  = collections.deque(maxlen=100 * JITTER_SAMPLES)
+        self.ticks     = 0
+        self.count     = 0
+        self.server    = None
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        r"""
+        Start listening on host:port, or on a unix socket at path
+
+        Returns
+        -------
+        address clients connect to, (host, port) or path
+
+        """
+        if path is not None:
+            if os.path.exists(path):
+                os.remove(path)
+            self.server = await asyncio.start_unix_server(self.handle_client, path)
+            return path
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        r""" close every session and client and stop listening """
+        for session in list(self.sessions.values()):
+            session.close()
+        if self.server is not None:
+            self.server.close()
+        clients = list(self.clients)
+        for task in clients:
+            task.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+
+    def new_session(self, layout='classic', seed=None, ghosts=4):
+        r"""
+        Start a session ticking
+
+        Parameters
+        ----------
+        layout : 'classic' or 'WxH[:seed]', as in sweep.load_layout
+        seed   : ghost seed
+        ghosts : number of ghosts
+
+        """
+        self.count += 1
+        session = Session(self.count, sweep.load_layout(layout, ghosts), seed)
+        self.sessions[session.id] = session
+        # a maze is thousands of long lived objects; keep them out of the
+        # collector's full scans, which would otherwise stall every session.
+        # Garbage is collected first so only what is alive gets frozen;
+        # the freeze is process wide, so _ended lifts it only once the
+        # last session is gone
+        gc.collect()
+        gc.freeze()
+        task = asyncio.ensure_future(session.run(self.tick_rate))
+        task.add_done_callback(lambda done: self._ended(session, done))
+        return session
+
+    def _ended(self, session, task):
+        r""" record a finished session's ticks and jitter, and report
+            the error it stopped on, if any """
+        self.sessions.pop(session.id, None)
+        self.ticks += session.ticks
+        self.finished.extend(session.jitter)
+        if not task.cancelled() and task.exception() is not None:
+            task.get_loop().call_exception_handler({
+                'message': 'session %d stopped on an error' % session.id,
+                'exception': task.exception(),
+                'task': task})
+            for feed in session.feeds.values():
+                feed.publish(broadcast.frame_message(
+                    {'type': 'error', 'error': 'session stopped on an error'}, feed.format))
+        session.close()
+        if not self.sessions:
+            # hand back to the collector what was frozen meanwhile: the
+            # closed mazes and the cycles of clients that have gone
+            gc.unfreeze()
+
+    async def handle_client(self, reader, writer):
+        r""" read one client's messages until it quits or disconnects """
+        session = None
+        playing = False   # joined session, so its keys steer pacman
+        format  = broadcast.JSON
+        self.clients.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line.decode())
+                except ValueError:
+                    message = None
+                if not isinstance(message, dict):
+                    writer.write(broadcast.frame_message(
+                        {'type': 'error', 'error': 'message is not a JSON object'}, format))
+                    continue
+                kind    = message.get('type')
+                if kind in ('join', 'watch'):
+                    asked = message.get('format', broadcast.JSON)
+                    if asked not in broadcast.FORMATS:
+                        writer.write(broadcast.frame_message(
+                            {'type': 'error', 'error': 'unknown format'}, format))
+                        continue
+                    format = asked
+                    if session is not None:
+                        self.leave(session, writer)
+                    playing = False
+                    if kind == 'join':
+                        try:
+                            session = self.new_session(*join_args(message))
+                        except ValueError as error:
+                            # a malformed request, or a layout that can't be played
+                            session = None
+                            writer.write(broadcast.frame_message(
+                                {'type': 'error', 'error': str(error)}, format))
+                            continue
+                        playing = True
+                    else:
+                        number  = message.get('session')
+                        session = self.sessions.get(number) if is_int(number) else None
+                        if session is None:
+                            writer.write(broadcast.frame_message(
+                                {'type': 'error', 'error': 'no such session'}, format))
+                            continue
+                    session.watch(writer, format)
+                elif kind == 'key':
+                    if not playing:
+                        error = 'only the player who joined can press keys'
+                    elif not isinstance(message.get('key'), str):
+                        error = 'key message without a key name'
+                    else:
+                        session.send_key(message['key'])
+                        continue
+                    writer.write(broadcast.frame_message(
+                        {'type': 'error', 'error': error}, format))
+                elif kind == 'quit':
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # stop() ends the client; finish normally so the stream
+            # server's callback doesn't report the cancellation
+            pass
+        finally:
+            self.clients.discard(asyncio.current_task())
+            if session is not None:
+                self.leave(session, writer)
+            writer.close()
+
+    def leave(self, session, writer):
+        r""" stop sending a session to a client, ending it once unwatched """
+        session.unwatch(writer)
+        if not session.watchers():
+            session.closed = True
+
+    def reset_stats(self):
+        r""" forget the ticks and jitter recorded so far """
+        self.finished.clear()
+        self.ticks = 0
+        for session in self.sessions.values():
+            session.jitter.clear()
+            session.ticks = 0
+
+    def stats(self):
+        r"""
+        Return a dict of the number of running sessions, ticks run and the
+        p50/p99/max tick lateness in milliseconds over all sessions
+
+        """
+        samples = list(self.finished)
+        ticks   = self.ticks
+        for session in self.sessions.values():
+            samples.extend(session.jitter)
+            ticks += session.ticks
+        result = {'sessions': len(self.sessions), 'ticks': ticks}
+        for (name, pct) in (('jitter_p50_ms', 50), ('jitter_p99_ms', 99),
+                            ('jitter_max_ms', 100)):
+            result[name] = instrument.percentile(samples, pct) * 1000 if samples else None
+        return result
+
+
+def is_int(value):
+    r""" T/F value is a JSON integer; bools are ints to Python but not here """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def join_args(message):
+    r"""
+    Return the (layout, seed, ghosts) asked for by a join message
+
+    Raises
+    ------
+    ValueError naming the first field of the wrong type
+
+    """
+    layout = message.get('layout', 'classic')
+    seed   = message.get('seed')
+    ghosts = message.get('ghosts', 4)
+    if not isinstance(layout, str):
+        raise ValueError("layout must be 'classic' or 'WxH[:seed]'")
+    if seed is not None and not is_int(seed):
+        raise ValueError('seed must be an integer')
+    if not is_int(ghosts):
+        raise ValueError('ghosts must be an integer')
+    return (layout, seed, ghosts)
+
+
+async def read_payload(reader, format):
+    r""" next payload from a server stream, b'' at the end of the stream """
+    if format == broadcast.BINARY:
+        try:
+            header = await reader.readexactly(broadcast.LENGTH.size)
+            return await reader.readexactly(broadcast.LENGTH.unpack(header)[0])
+        except asyncio.IncompleteReadError:
+            return b''
+    return (await reader.readline()).rstrip(b'\n')
+
+
+async def connect(address):
+    if isinstance(address, tuple):
+        return await asyncio.open_connection(*address)
+    return await asyncio.open_unix_connection(address)
+
+
+async def loopback_client(address, seconds, seed, warmup=0.0, key_every=10,
+                          format=broadcast.JSON, session=None):
+    r"""
+    Test client: join a game, press a random key every few ticks and
+    rejoin when a game ends, for a number of seconds. Given a session it
+    only spectates that game instead, until it ends.
+
+    Parameters
+    ----------
+    address   : (host, port) or unix socket path
+    seconds   : how long to play
+    seed      : seed for the games and the key presses
+    warmup    : seconds before tick gaps are recorded
+    key_every : ticks between key presses
+    format    : stream format to ask for, broadcast.JSON or BINARY
+    session   : id of a session to watch, None to play
+
+    Returns
+    -------
+    dict of ticks received, games played, seconds between ticks and
+    tick bytes received
+
+    """
+    (reader, writer) = await connect(address)
+    keys    = random.Random(seed)
+    games   = 1
+    gaps    = []
+    ticks   = 0
+    size    = 0
+    decoder = None
+    if session is None:
+        request = {'type': 'join', 'seed': seed, 'format': format}
+    else:
+        request = {'type': 'watch', 'session': session, 'format': format}
+    writer.write((json.dumps(request) + '\n').encode())
+    measure = time.time() + warmup
+    end     = time.time() + seconds
+    last    = None
+    while time.time() < end:
+        payload = await read_payload(reader, format)
+        if not payload:
+            break
+        if decoder is None or payload.startswith(b'{"type":"welcome"'):
+            message = json.loads(payload.decode())
+            if message['type'] != 'welcome':
+                break
+            decoder = broadcast.TickDecoder(message)
+            continue
+        decoder.apply(payload)
+        now = time.time()
+        if last is not None and now > measure:
+            gaps.append(now - last)
+            size += len(payload)
+        last   = now
+        ticks += 1
+        if decoder.over:
+            if session is not None:
+                break
+            games  += 1
+            last    = None
+            decoder = None
+            request = {'type': 'join', 'seed': seed + games, 'format': format}
+            writer.write((json.dumps(request) + '\n').encode())
+        elif session is None and ticks % key_every == 0:
+            key = keys.choice(['Left', 'Right', 'Up', 'Down'])
+            writer.write((json.dumps({'type': 'key', 'key': key}) + '\n').encode())
+    writer.write(b'{"type":"quit"}\n')
+    writer.close()
+    return {'ticks': ticks, 'games': games, 'gaps': gaps, 'bytes': size}
+
+
+async def run_loopback(clients, seconds, tick_rate=20, path=None, warmup=1.0,
+                       format=broadcast.JSON, spectators=0):
+    r"""
+    Start a server and a number of loopback clients in this process
+
+    Parameters
+    ----------
+    clients    : number of clients, each playing its own session
+    seconds    : how long to measure for
+    tick_rate  : ticks per second
+    path       : unix socket path, None for TCP on localhost
+    warmup     : seconds to let every client join before measuring, so
+        the burst of new sessions at the start is left out
+    format     : stream format the clients ask for
+    spectators : number of extra clients watching the first games, spread
+        evenly over them
+
+    Returns
+    -------
+    dict of server stats plus client side tick rate, arrival jitter and
+    mean bytes per tick received
+
+    """
+    server  = GameServer(tick_rate)
+    address = await server.start(path=path)
+    players = [loopback_client(address, warmup + seconds, seed, warmup, format=format)
+               for seed in range(clients)]
+    playing = asyncio.gather(*players)
+    await asyncio.sleep(warmup / 2)
+    # players join in order, so their first sessions are 1 to clients
+    watching = asyncio.gather(*[
+        loopback_client(address, warmup / 2 + seconds, index, warmup / 2, format=format,
+                        session=1 + index % clients)
+        for index in range(spectators)])
+    await asyncio.sleep(warmup / 2)
+    server.reset_stats()
+    start   = time.time()
+    cpu     = time.process_time()
+    results = await playing
+    watched = await watching
+    stats   = server.stats()
+    elapsed = time.time() - start
+    stats['cpu_fraction'] = (time.process_time() - cpu) / elapsed
+    await server.stop()
+    gaps    = [gap for result in results for gap in result['gaps']]
+    ticks   = sum(result['ticks'] for result in results + watched)
+    stats.update({
+        'clients': clients,
+        'spectators': spectators,
+        'format': format,
+        'games': sum(result['games'] for result in results),
+        'ticks_per_sec': sum(result['ticks'] for result in results) / elapsed,
+        'bytes_per_tick': (sum(result['bytes'] for result in results + watched) / ticks
+                           if ticks else None),
+        'arrival_p50_ms': instrument.percentile(gaps, 50) * 1000 if gaps else None,
+        'arrival_p99_ms': instrument.percentile(gaps, 99) * 1000 if gaps else None})
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PacMan game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a unix socket')
+    parser.add_argument('--tick-rate', type=float, default=20)
+    parser.add_argument('--loopback', type=int, metavar='N',
+                        help='run N test clients against an in-process server')
+    parser.add_argument('--seconds', type=float, default=5,
+                        help='how long to measure loopback clients for')
+    parser.add_argument('--format', choices=broadcast.FORMATS, default=broadcast.JSON,
+                        help='tick stream format of the loopback clients')
+    parser.add_argument('--spectators', type=int, default=0, metavar='N',
+                        help='loopback clients watching the games instead of playing')
+    args = parser.parse_args(argv)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if args.loopback:
+        stats = loop.run_until_complete(
+            run_loopback(args.loopback, args.seconds, args.tick_rate, args.unix,
+                         format=args.format, spectators=args.spectators))
+        print(json.dumps(stats, indent=2, sort_keys=True))
+        return
+    server  = GameServer(args.tick_rate)
+    address = loop.run_until_complete(server.start(args.host, args.port, args.unix))
+    print('serving on %s' % (address,))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+        print(json.dumps(server.stats(), indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
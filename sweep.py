@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+"""
+Difficulty sweep for the PacMan game
+
+Plays seeded headless games, with pacman steered by a simple autopilot,
+for every combination of ghost speed, pacman speed, scared time, ghost
+count and layout on a grid. Games run in parallel worker processes and
+each finished game is cached by (config hash, seed, code version), so a
+re-run only plays the games it has not seen. Per cell win rates, game
+lengths and tick costs are written as columns of an .npz file.
+
+usage: python sweep.py [--ghost-speed X ...] [--pac-speed X ...]
+                       [--scared-time N ...] [--ghosts N ...]
+                       [--layout classic|WxH[:seed] ...] [--games N]
+                       [--max-ticks N] [--processes N] [--cache DIR]
+                       [--output FILE]
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import argparse
+import collections
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+import instrument
+import pacman as pm
+
+clock = instrument.clock
+
+# key that asks for each move, the reverse of pacman.KEY_MOVES
+MOVE_KEYS = dict((move, key) for (key, move) in pm.KEY_MOVES.items()
+                 if not key.startswith('KP_'))
+
+# files whose contents decide the outcome of a game
+GAME_SOURCES = ['pacman.py', 'events.py', 'sweep.py', 'instrument.py', 'graphics.py']
+
+# one cell of the sweep grid
+Cell = collections.namedtuple('Cell', ['layout', 'ghosts', 'ghost_speed',
+                                       'pac_speed', 'scared_time', 'max_ticks'])
+
+# columns written for each cell, after the Cell fields
+RESULT_COLUMNS = ['games', 'wins', 'losses', 'timeouts', 'win_rate',
+                  'mean_ticks', 'median_ticks', 'mean_food_left', 'tick_us']
+
+
+class Autopilot:
+    r"""
+    Autopilot Class
+        Steers pacman through key presses, as a player would. For each
+        grid point it takes the first step of the shortest path to the
+        nearest food or capsule, keeping out of reach of ghosts that are
+        not scared. With no safe path it heads away from the nearest ghost.
+        It decides on the tick that reaches or passes the grid point and
+        presses early, so pacman's waiting turn is taken there whatever
+        the speed.
+
+    Attributes
+    ----------
+    maze   : Maze being played
+    pacman : the Pacman steered
+    reach  : grid points around a dangerous ghost treated as walls
+
+    Methods
+    -------
+    step   : press a key if pacman should change direction
+    key    : return the key step would press, or None
+    target : return the grid point pacman is on or reaches this tick
+    choose : return the move to make from a grid point, or None
+
+    """
+
+    def __init__(self, maze, reach=2):
+        self.maze   = maze
+        self.reach  = reach
+        self.pacman = [mover for mover in maze.movables
+                       if isinstance(mover, pm.Pacman)][0]
+
+    def step(self):
+        r""" press a key if pacman should turn at the grid point it is on
+            or reaches this tick """
+        key = self.key()
+        if key is not None:
+            self.maze.key_pressed(key)
+
+    def key(self, dt=1.0):
+        r""" return the key to press if pacman should turn at the grid point
+            it is on or reaches in a tick of dt, or None """
+        pacman = self.pacman
+        point  = self.target(dt)
+        if point is None:
+            return None
+        move = self.choose(point)
+        if move is None or move == pacman.heading:
+            return None
+        if point != pacman.nearest_grid_point() and pacman.furthest_move(move) != (0, 0):
+            # pressed now, the turn would be made back at the grid point
+            # pacman is still nearest to
+            return None
+        return MOVE_KEYS[move]
+
+    def target(self, dt=1.0):
+        r"""
+        Return the grid point pacman is on, or the one ahead that its step
+        in a tick of dt reaches or passes, or None
+
+        """
+        pacman = self.pacman
+        (x, y) = pacman.place
+        near   = pacman.nearest_grid_point()
+        (off_x, off_y) = (abs(x - near[0]) > pm.EPSILON, abs(y - near[1]) > pm.EPSILON)
+        if not (off_x or off_y):
+            return near
+        if pacman.heading is None or (off_x and off_y):
+            return None
+        (step_x, step_y) = pacman.heading
+        if (step_x and off_y) or (step_y and off_x):
+            # lining up with the grid for a turn already made
+            return None
+        if step_x:
+            ahead = (math.floor(x + pm.EPSILON) + 1 if step_x > 0 else
+                     math.ceil(x - pm.EPSILON) - 1, near[1])
+        else:
+            ahead = (near[0], math.floor(y + pm.EPSILON) + 1 if step_y > 0 else
+                     math.ceil(y - pm.EPSILON) - 1)
+        if abs(ahead[0] - x) + abs(ahead[1] - y) > pacman.speed * dt + pm.EPSILON:
+            return None
+        return ahead
+
+    def danger(self):
+        r""" set of grid points too close to ghosts that can catch pacman """
+        cells = set()
+        reach = self.reach
+        for ghost in self.maze.movables:
+            if not isinstance(ghost, pm.Ghost) or ghost.time_left > 0:
+                continue
+            (gx, gy) = ghost.nearest_grid_point()
+            for dx in range(-reach, reach + 1):
+                for dy in range(abs(dx) - reach, reach - abs(dx) + 1):
+                    cells.add((gx + dx, gy + dy))
+        return cells
+
+    def choose(self, start):
+        r"""
+        Return the move (one of pacman.DIRECTIONS) to make from start
+
+        Parameters
+        ----------
+        start : (x, y) integer grid point
+
+        """
+        maze   = self.maze
+        exits  = maze.corridors.exits
+        danger = self.danger()
+        # breadth first search from start for the nearest food or capsule
+        first = {start: None}
+        queue = collections.deque([start])
+        while queue:
+            cell = queue.popleft()
+            if cell != start and (maze.has_food(cell) or
+                                  maze.cell_bit(cell) & maze.capsule_bits):
+                return first[cell]
+            for (dx, dy) in exits.get(cell, ()):
+                following = (cell[0] + dx, cell[1] + dy)
+                if following in first or following in danger:
+                    continue
+                first[following] = first[cell] or (dx, dy)
+                queue.append(following)
+        # nowhere safe to go, get away from the closest ghost
+        ghosts = [mover.place for mover in maze.movables if isinstance(mover, pm.Ghost)]
+        if not ghosts or not exits.get(start):
+            return None
+
+        def clearance(move):
+            (x, y) = (start[0] + move[0], start[1] + move[1])
+            return min((x - gx)**2 + (y - gy)**2 for (gx, gy) in ghosts)
+
+        return max(exits[start], key=clearance)
+
+
+def load_layout(spec, ghosts):
+    r"""
+    Return the layout named by spec with the given number of ghosts
+
+    Parameters
+    ----------
+    spec   : 'classic' for pacman.my_layout, or 'WxH' / 'WxH:seed' for a
+        generated layout
+    ghosts : number of ghosts; a classic layout keeps its first ones
+
+    Raises
+    ------
+    ValueError for a malformed spec, or more ghosts than the layout has
+        starting places for
+
+    """
+    if ghosts < 0:
+        raise ValueError('ghosts must not be negative, got %d' % ghosts)
+    if spec == 'classic':
+        layout = []
+        kept   = 0
+        for row in pm.my_layout:
+            chars = []
+            for char in row:
+                if char == 'G':
+                    kept += 1
+                    if kept > ghosts:
+                        char = ' '
+                chars.append(char)
+            layout.append(''.join(chars))
+    else:
+        (size, _, seed) = spec.partition(':')
+        try:
+            (width, height) = [int(value) for value in size.lower().split('x')]
+            seed = int(seed or 0)
+        except ValueError:
+            raise ValueError("layout %r is not 'classic' or WxH[:seed]" % (spec,))
+        layout = pm.generate_layout(width, height, ghosts=ghosts, seed=seed)
+    placed = sum(row.count('G') for row in layout)
+    if placed < ghosts:
+        raise ValueError('layout %r has room for %d ghosts, not %d' % (spec, placed, ghosts))
+    return layout
+
+
+def cell_config(cell):
+    r""" return the pacman Config for a cell """
+    return pm.make_config(ghost_speed=cell.ghost_speed,
+                          pac_speed=cell.pac_speed,
+                          scared_time=cell.scared_time)
+
+
+def cell_hash(cell):
+    r""" stable hash of everything in a cell that changes a game """
+    text = json.dumps([cell._asdict(), cell_config(cell)._asdict()], sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def code_version():
+    r"""
+    Hash of the game sources. Unlike a git revision it changes with
+    uncommitted edits, so cached results never outlive the rules that
+    made them.
+
+    """
+    digest = hashlib.sha1()
+    here   = os.path.dirname(os.path.abspath(__file__))
+    for name in GAME_SOURCES:
+        with open(os.path.join(here, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def play_game(cell, seed):
+    r"""
+    Play one headless game with the autopilot
+
+    Parameters
+    ----------
+    cell : Cell of settings
+    seed : seed for the ghosts
+
+    Returns
+    -------
+    dict of 'won', 'lost', 'ticks', 'food_left' and 'seconds' spent ticking
+
+    """
+    maze  = pm.Maze(load_layout(cell.layout, cell.ghosts), backend='null',
+                    seed=seed, config=cell_config(cell))
+    pilot = Autopilot(maze)
+    start = clock()
+    while not maze.finished() and maze.ticks < cell.max_ticks:
+        pilot.step()
+        maze.tick()
+    seconds = clock() - start
+    maze.win.close()
+    return {'won': maze.finished() and not maze.lost,
+            'lost': maze.lost,
+            'ticks': maze.ticks,
+            'food_left': maze.food_count,
+            'seconds': seconds}
+
+
+def _play_task(task):
+    r""" worker process body: (cell, seed) to (cell, seed, result) """
+    (cell, seed) = task
+    return (cell, seed, play_game(cell, seed))
+
+
+class ResultCache:
+    r"""
+    ResultCache Class
+        Finished games on disk, one JSON line per game keyed by (config
+        hash, seed, code version). Lines are appended as games finish, so
+        an interrupted sweep keeps what it has done.
+
+    Methods
+    -------
+    get : return the cached result of a game, or None
+    put : store the result of a game
+
+    """
+
+    def __init__(self, directory, version):
+        self.version  = version
+        self.results  = {}
+        self.filename = None
+        if directory is None:
+            return
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.filename = os.path.join(directory, 'games.jsonl')
+        if os.path.exists(self.filename):
+            with open(self.filename) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    key   = (entry['config'], entry['seed'], entry['version'])
+                    self.results[key] = entry['result']
+
+    def get(self, cell, seed):
+        return self.results.get((cell_hash(cell), seed, self.version))
+
+    def put(self, cell, seed, result):
+        key = (cell_hash(cell), seed, self.version)
+        self.results[key] = result
+        if self.filename is not None:
+            entry = {'config': key[0], 'seed': seed, 'version': self.version,
+                     'cell': cell._asdict(), 'result': result}
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+def make_cells(layouts, ghosts, ghost_speeds, pac_speeds, scared_times, max_ticks):
+    r""" return the list of Cells on the grid of the given values """
+    return [Cell(*values) for values in itertools.product(
+        layouts, ghosts, ghost_speeds, pac_speeds, scared_times, [max_ticks])]
+
+
+def summarize(games):
+    r"""
+    Aggregate the results of a cell's games
+
+    Parameters
+    ----------
+    games : list of play_game results
+
+    Returns
+    -------
+    dict of RESULT_COLUMNS
+
+    """
+    ticks = [game['ticks'] for game in games]
+    wins  = sum(1 for game in games if game['won'])
+    lost  = sum(1 for game in games if game['lost'])
+    return {'games': len(games),
+            'wins': wins,
+            'losses': lost,
+            'timeouts': len(games) - wins - lost,
+            'win_rate': wins / len(games),
+            'mean_ticks': sum(ticks) / len(games),
+            'median_ticks': instrument.percentile(ticks, 50),
+            'mean_food_left': sum(game['food_left'] for game in games) / len(games),
+            'tick_us': sum(game['seconds'] for game in games) / max(sum(ticks), 1) * 1e6}
+
+
+def run_sweep(cells, games, seed=0, processes=None, cache=None, progress=None):
+    r"""
+    Play every game of every cell that is not cached, in parallel
+
+    Parameters
+    ----------
+    cells     : list of Cell
+    games     : games per cell, seeds seed .. seed+games-1
+    seed      : first seed
+    processes : worker processes, None for one per CPU, 0 to play here
+    cache     : ResultCache, or None to cache nothing
+    progress  : function(done, total) called as games finish, or None
+
+    Returns
+    -------
+    list of (cell, summary dict), in cells order
+
+    """
+    if games < 1:
+        raise ValueError('games per cell must be at least 1, got %d' % games)
+    if cache is None:
+        cache = ResultCache(None, code_version())
+    seeds   = range(seed, seed + games)
+    results = {}
+    tasks   = []
+    for cell in cells:
+        for game_seed in seeds:
+            found = cache.get(cell, game_seed)
+            if found is None:
+                tasks.append((cell, game_seed))
+            else:
+                results[(cell, game_seed)] = found
+    # refuse unwinnable layouts now, not after games that never end
+    for spec in set((cell.layout, cell.ghosts) for (cell, game_seed) in tasks):
+        pm.check_layout(load_layout(*spec))
+    if tasks:
+        if processes == 0:
+            finished = map(_play_task, tasks)
+            pool     = None
+        else:
+            pool     = multiprocessing.Pool(processes)
+            finished = pool.imap_unordered(_play_task, tasks, chunksize=4)
+        for (done, (cell, game_seed, result)) in enumerate(finished):
+            cache.put(cell, game_seed, result)
+            results[(cell, game_seed)] = result
+            if progress is not None:
+                progress(done + 1, len(tasks))
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return [(cell, summarize([results[(cell, game_seed)] for game_seed in seeds]))
+            for cell in cells]
+
+
+def write_results(filename, summaries, meta):
+    r"""
+    Write sweep results as columns of an .npz file, one row per cell
+
+    Parameters
+    ----------
+    filename  : output .npz
+    summaries : run_sweep result
+    meta      : dict stored as JSON under 'meta'
+
+    """
+    columns = {}
+    for field in Cell._fields:
+        values = [getattr(cell, field) for (cell, summary) in summaries]
+        columns[field] = np.array(values)
+    for name in RESULT_COLUMNS:
+        columns[name] = np.array([summary[name] for (cell, summary) in summaries])
+    columns['meta'] = np.array(json.dumps(meta, sort_keys=True))
+    np.savez_compressed(filename, **columns)
+
+
+def main(argv=None):
+    defaults = pm.DEFAULT_CONFIG
+    parser = argparse.ArgumentParser(description='PacMan difficulty sweep')
+    parser.add_argument('--ghost-speed', type=float, nargs='+',
+                        default=[defaults.ghost_speed])
+    parser.add_argument('--pac-speed', type=float, nargs='+',
+                        default=[defaults.pac_speed])
+    parser.add_argument('--scared-time', type=int, nargs='+',
+                        default=[defaults.scared_time])
+    parser.add_argument('--ghosts', type=int, nargs='+', default=[4])
+    parser.add_argument('--layout', nargs='+', default=['classic'],
+                        help="'classic' or WxH[:seed] for a generated layout")
+    parser.add_argument('--games', type=int, default=20, help='games per cell')
+    parser.add_argument('--seed', type=int, default=0, help='first game seed')
+    parser.add_argument('--max-ticks', type=int, default=3000,
+                        help='ticks before a game counts as a timeout')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes, default one per CPU, 0 for none')
+    parser.add_argument('--cache', metavar='DIR', default='.sweep-cache',
+                        help="cache directory, 'none' to disable")
+    parser.add_argument('--output', metavar='FILE', default='sweep.npz')
+    args    = parser.parse_args(argv)
+    if args.games < 1:
+        parser.error('--games must be at least 1')
+    for (layout, ghosts) in itertools.product(args.layout, args.ghosts):
+        try:
+            load_layout(layout, ghosts)
+        except ValueError as error:
+            parser.error(str(error))
+    version = code_version()
+    cache   = ResultCache(None if args.cache == 'none' else args.cache, version)
+    cells   = make_cells(args.layout, args.ghosts, args.ghost_speed,
+                         args.pac_speed, args.scared_time, args.max_ticks)
+    start   = clock()
+    summaries = run_sweep(cells, args.games, args.seed, args.processes, cache)
+    meta    = {'version': version, 'games': args.games, 'seed': args.seed,
+               'seconds': clock() - start}
+    write_results(args.output, summaries, meta)
+    print('%-12s %6s %11s %9s %11s %8s %10s %8s' % ('layout', 'ghosts', 'ghost_speed',
+          'pac_speed', 'scared_time', 'win_rate', 'mean_ticks', 'tick_us'))
+    for (cell, summary) in summaries:
+        print('%-12s %6d %11.3f %9.3f %11d %8.2f %10.1f %8.1f' % (
+            cell.layout, cell.ghosts, cell.ghost_speed, cell.pac_speed,
+            cell.scared_time, summary['win_rate'], summary['mean_ticks'],
+            summary['tick_us']))
+    print('wrote %s (%d cells, %.1fs)' % (args.output, len(cells), meta['seconds']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Round trip checks for broadcast.py
+
+Every tick of a played game is encoded once per format and applied to a
+TickDecoder; after each tick the decoded movers and eaten items must be
+the game's own, quantised, whichever format carried them and whether
+the decoder started from the first welcome or joined mid game.
+
+usage: python -m pytest test_broadcast.py
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import json
+import unittest
+
+import broadcast
+import pacman as pm
+import sweep
+
+
+def expected(maze, food, capsules):
+    r""" what a decoder should hold: movers as decoded, eaten items """
+    quantum = broadcast.QUANTUM
+    movers  = [[round(state.place[0] * quantum) / quantum,
+                round(state.place[1] * quantum) / quantum, state.direction, state.color]
+               for state in maze.buffer.latest()[1].movers]
+    return (movers,
+            set(cell for cell in food if not maze.has_food(cell)),
+            set(cell for cell in capsules if not maze.capsule_bits & maze.cell_bit(cell)))
+
+
+class TestRoundTrip(unittest.TestCase):
+
+    def play(self, seed, config=None, ticks=2000):
+        r"""
+        Play a game steered by the sweep autopilot, checking decoders of
+        both formats after every tick; return the mover fields bits seen
+
+        """
+        maze     = pm.Maze(pm.my_layout, backend='null', seed=seed, config=config)
+        self.addCleanup(maze.close)
+        cells    = [(x, y) for y in range(maze.height) for x in range(maze.width)]
+        food     = [cell for cell in cells if maze.has_food(cell)]
+        capsules = [cell for cell in cells if maze.capsule_bits & maze.cell_bit(cell)]
+        encoder  = broadcast.TickEncoder(maze)
+        welcome  = json.loads(json.dumps(encoder.keyframe()))
+        decoders = {(format,): broadcast.TickDecoder(welcome) for format in broadcast.FORMATS}
+        pilot    = sweep.Autopilot(maze)
+        fields   = 0
+        for tick in range(ticks):
+            if maze.finished():
+                break
+            pilot.step()
+            maze.tick()
+            delta = encoder.update()
+            for change in delta.movers:
+                fields |= change.fields
+            payloads = {broadcast.BINARY: encoder.encode(delta),
+                        broadcast.JSON: encoder.encode_json(delta)}
+            for (name, decoder) in decoders.items():
+                decoder.apply(payloads[name[-1]])
+            if tick == 100:
+                # a watcher joining mid game, then binary from the next tick
+                decoders[('joined', broadcast.BINARY)] = broadcast.TickDecoder(
+                    json.loads(json.dumps(encoder.keyframe())))
+            want = expected(maze, food, capsules)
+            for (name, decoder) in decoders.items():
+                self.assertEqual((decoder.movers, decoder.food, decoder.capsules), want,
+                                 'seed %d, tick %d, %s' % (seed, tick, name))
+                self.assertEqual((decoder.tick, decoder.lost, decoder.over),
+                                 (maze.ticks, maze.lost, maze.finished()))
+        self.assertTrue(maze.eaten, 'pacman never ate, nothing was checked')
+        return fields
+
+    def test_games(self):
+        fields = 0
+        for seed in range(5):
+            fields |= self.play(seed)
+        # eating capsules recolours ghosts; facing changes as pacman turns
+        self.assertTrue(fields & broadcast.NEAR)
+        self.assertTrue(fields & broadcast.TURNED)
+        self.assertTrue(fields & broadcast.COLORED)
+
+    def test_far_moves(self):
+        # movers going over two cells a tick can't be sent as a step
+        fields = self.play(0, pm.make_config(pac_speed=2.5, ghost_speed=2.25))
+        self.assertTrue(fields & broadcast.FAR)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Checks for the sharded trajectory datasets in dataset.py
+
+Recorded games must read back row for row, memory mapped or not, and a
+writer whose background thread fails must report the error instead of
+leaving the game blocked on a full queue.
+
+usage: python -m pytest test_dataset.py
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import dataset
+
+# seconds a writer is given before it counts as hung
+TIMEOUT = 10
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_record_and_read(self):
+        for compress in (True, False):
+            directory = tempfile.mkdtemp(dir=self.directory)
+            result = dataset.record(directory, games=2, shard_bytes=1 << 16,
+                                    compress=compress, max_ticks=300)
+            reader = dataset.ShardReader(directory)
+            self.assertGreater(result['shards'], 2)
+            self.assertEqual(len(reader), result['transitions'])
+            batches = list(reader.batches(100))
+            ticks   = np.concatenate([batch['tick'] for batch in batches])
+            episode = np.concatenate([batch['episode'] for batch in batches])
+            self.assertEqual(len(ticks), len(reader))
+            # every game's ticks in order, from the start
+            for game in range(2):
+                played = ticks[episode == game]
+                self.assertEqual(list(played), list(range(len(played))))
+            self.assertEqual(batches[0]['obs'].shape[1:],
+                             (len(dataset.PLANES), 15, 31))
+            if not compress:
+                self.assertIsInstance(reader.shard(0)['obs'], np.memmap)
+
+    def test_save_error(self):
+        writer  = None
+        outcome = []
+
+        def fill():
+            try:
+                for row in range(1000):
+                    writer.append(value=np.float64(row))
+            except RuntimeError as error:
+                outcome.append(('append', row, str(error)))
+            try:
+                writer.close()
+            except RuntimeError as error:
+                outcome.append(('close', str(error)))
+
+        failing = mock.patch.object(dataset.np, 'savez_compressed',
+                                    side_effect=IOError('disk full'))
+        with failing:
+            # two rows a shard and two shards queued, so the queue fills
+            # long before the rows run out
+            writer = dataset.ShardWriter(self.directory, shard_bytes=16, max_queue=2)
+            thread = threading.Thread(target=fill)
+            thread.daemon = True
+            thread.start()
+            thread.join(TIMEOUT)
+        self.assertFalse(thread.is_alive(), 'writer hung after failing')
+        self.assertEqual(outcome[0][0], 'append')
+        self.assertLess(outcome[0][1], 1000)
+        self.assertIn('disk full', outcome[0][2])
+        self.assertEqual(outcome[1], ('close', 'shard writer failed: disk full'))
+        self.assertEqual(writer.shards, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Rendering regression checks on the recording backend
+
+Each Maze.play tick draws one frame; the RecordingBackend counts the
+canvas operations each frame made, so a change that makes the renderer
+redraw more than the movers that moved shows up without a display.
+
+usage: python -m pytest test_graphics.py
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import unittest
+from unittest import mock
+
+import graphics as gx
+import pacman as pm
+
+# ticks played, and the keys pressed along the way
+TICKS = 100
+KEYS  = {0: 'Left', 20: 'Up', 40: 'Right', 60: 'Down', 80: 'Left'}
+
+
+class TestRecordingBackend(unittest.TestCase):
+
+    def play(self, ticks=TICKS):
+        r""" play ticks frames of the classic layout, return the maze """
+        maze = pm.Maze(pm.my_layout, backend='recording', seed=0)
+        self.addCleanup(maze.close)
+        # no need to wait out the frame delay
+        sleep = mock.patch.object(pm.time, 'sleep')
+        sleep.start()
+        self.addCleanup(sleep.stop)
+        for tick in range(ticks):
+            if tick in KEYS:
+                maze.key_pressed(KEYS[tick])
+            maze.play()
+        return maze
+
+    def test_ops_per_frame(self):
+        maze   = self.play()
+        frames = maze.win.backend.frameCounts()
+        # frame 0 holds the maze drawn up front
+        self.assertEqual(len(frames), TICKS + 1)
+        self.assertTrue(maze.eaten, 'pacman never ate, the keys no longer steer')
+        # per sprite a move and a recolour (fill and outline), pacman's
+        # mouth reshaped, and one eaten dot deleted
+        limit = 3*len(maze.movables) + 2
+        for (index, counts) in enumerate(frames[1:], 1):
+            self.assertLessEqual(sum(counts.values()), limit,
+                                 'frame %d: %r' % (index, counts))
+
+    def test_nothing_created_while_moving(self):
+        frames = self.play().win.backend.frameCounts()
+        # the sprites are created by the first frame drawn; after that
+        # every item moves or changes shape in place
+        for counts in frames[2:]:
+            self.assertFalse([op for op in counts if op.startswith('create_')], counts)
+
+    def test_trace_replays(self):
+        maze   = self.play(10)
+        trace  = maze.win.backend.trace
+        target = gx.GraphWin('replay', maze.win.getWidth(), maze.win.getHeight(),
+                             backend='recording')
+        self.addCleanup(target.close)
+        gx.replayTrace(trace, target)
+        replayed = target.backend.trace
+        self.assertEqual([entry.op for entry in replayed if entry.op != 'update'],
+                         [entry.op for entry in trace if entry.op != 'update'])
+
+    def test_every_create_counted(self):
+        win = gx.GraphWin('images', 100, 100, backend='recording')
+        self.addCleanup(win.close)
+        backend = win.backend
+        backend.create_image(10, 10, image='photo')
+        backend.create_window(20, 20, window='frame')
+        counts = backend.frameCounts()[-1]
+        self.assertEqual(counts.get('create_image'), 1)
+        self.assertEqual(counts.get('create_window'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Checks for the visit heatmaps in heatmap.py
+
+A saved heatmap must come back with its counts and the layout they were
+counted on, and refuse to be drawn over or merged with any other layout.
+
+usage: python -m pytest test_heatmap.py
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import heatmap as hm
+import pacman as pm
+
+# two layouts of the same size and movers
+OTHER_LAYOUT = pm.generate_layout(31, 15, seed=1)
+
+
+class TestHeatmap(unittest.TestCase):
+
+    def setUp(self):
+        self.heatmap = hm.collect(pm.my_layout, games=2, processes=0)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'heat.npz')
+        self.heatmap.save(filename)
+        loaded = hm.Heatmap.load(filename)
+        self.assertEqual(loaded.layout, pm.layout_key(pm.my_layout))
+        self.assertEqual((loaded.games, loaded.ticks), (2, self.heatmap.ticks))
+        np.testing.assert_array_equal(loaded.occupancy, self.heatmap.occupancy)
+
+    def test_other_layout_refused(self):
+        for layout in (OTHER_LAYOUT, pm.generate_layout(21, 15, seed=1)):
+            maze = pm.Maze(layout, backend='null')
+            self.addCleanup(maze.close)
+            self.assertRaises(ValueError, hm.overlay, maze, self.heatmap)
+        other = hm.collect(OTHER_LAYOUT, games=1, processes=0)
+        self.assertRaises(ValueError, self.heatmap.merge, other)
+
+    def test_no_games(self):
+        self.assertRaises(ValueError, hm.collect, pm.my_layout, 0, processes=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Simulation checks for pacman.py
+
+Maze.skip_ahead jumps over quiet time in one tick; played with the same
+key presses it must end in the same game as ticking one at a time.
+The faster structures are each checked against a plain recomputation:
+the food bitsets and nearest food index, the swept collision check and
+the corridor graph. Games with different Configs must not share settings,
+and layout analysis must find what can't be reached. A scrolling viewport
+must keep exactly the cells near the view drawn, with recycled items.
+
+usage: python -m pytest test_pacman.py
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import random
+import unittest
+
+import pacman as pm
+import sweep
+
+KEYS  = ['Left', 'Right', 'Up', 'Down']
+TICKS = 1000
+
+
+def key_times(seed, gap, ticks=TICKS):
+    r""" seeded {whole tick: key} with up to gap ticks between presses """
+    rng   = random.Random(seed)
+    keys  = {}
+    tick  = 0
+    while tick < ticks:
+        tick += rng.randint(1, gap)
+        keys[tick] = rng.choice(KEYS)
+    return keys
+
+
+def play(layout, seed, keys, skip, ticks=TICKS):
+    r"""
+    Play a game pressing keys at their times, a tick at a time or with
+    skip_ahead never jumping past the next press
+
+    Returns
+    -------
+    save_state() tuple at the end, without what only says how the
+    time was split into ticks (tick count, last dt and each mover's
+    place before its last move)
+
+    """
+    maze  = pm.Maze(layout, backend='null', seed=seed)
+    times = sorted(keys)
+    while not maze.finished() and maze.time < ticks:
+        now = int(round(maze.time))
+        if now in keys:
+            maze.key_pressed(keys[now], when=0.0)
+        if skip:
+            later = [time for time in times if time > now]
+            limit = (later[0] if later else ticks) - maze.time
+            maze.skip_ahead(limit=min(limit, ticks - maze.time))
+        else:
+            maze.tick()
+    state = maze.save_state()
+    maze.close()
+    return (state[1],) + state[3:10] + (tuple(saved[:1] + saved[2:] for saved in state[10]),)
+
+
+class TestSkipAhead(unittest.TestCase):
+
+    def check(self, layout, seeds, gaps):
+        for gap in gaps:
+            for seed in seeds:
+                keys = key_times(seed, gap)
+                self.assertEqual(play(layout, seed, keys, False), play(layout, seed, keys, True),
+                                 'seed %d, keys up to %d ticks apart' % (seed, gap))
+
+    def test_classic_layout(self):
+        self.check(pm.my_layout, range(30), (3, 10, 40))
+
+    def test_generated_layout(self):
+        self.check(pm.generate_layout(31, 21, seed=5), range(10), (4, 64))
+
+    def test_skips(self):
+        # the check means nothing if skip_ahead never jumps
+        maze  = pm.Maze(pm.my_layout, backend='null', seed=0)
+        maze.key_pressed('Left', when=0.0)
+        jumps = [maze.skip_ahead() for tick in range(20)]
+        maze.close()
+        self.assertGreater(max(jumps), 1)
+
+
+class TestFood(unittest.TestCase):
+
+    def food_cells(self, maze):
+        return [(x, y) for y in range(maze.height) for x in range(maze.width)
+                if isinstance(maze.map[y][x], pm.Food)]
+
+    def test_bits_match_map(self):
+        maze = pm.Maze(pm.my_layout, backend='null', seed=0)
+        self.addCleanup(maze.close)
+        maze.key_pressed('Left', when=0.0)
+        for tick in range(200):
+            maze.tick()
+        cells = self.food_cells(maze)
+        self.assertLess(len(cells), sum(row.count('.') for row in pm.my_layout))
+        self.assertEqual(maze.food_count, len(cells))
+        for y in range(maze.height):
+            for x in range(maze.width):
+                self.assertEqual(maze.has_food((x, y)), (x, y) in cells)
+        self.assertEqual(maze.food_in((3, 2), (20, 11)),
+                         len([(x, y) for (x, y) in cells if 3 <= x <= 20 and 2 <= y <= 11]))
+        self.assertEqual(maze.food_in((maze.width, maze.height), (-5, -5)), len(cells))
+
+    def test_nearest_matches_brute_force(self):
+        rng   = random.Random(0)
+        index = pm.FoodIndex(40, 30, bucket=4)
+        cells = set()
+        while True:
+            for trial in range(20):
+                place = (rng.uniform(-2, 42), rng.uniform(-2, 32))
+                found = index.nearest(place)
+                if not cells:
+                    self.assertIsNone(found)
+                    continue
+                best = min((x - place[0])**2 + (y - place[1])**2 for (x, y) in cells)
+                self.assertAlmostEqual((found[0] - place[0])**2 + (found[1] - place[1])**2,
+                                       best, msg=place)
+            if len(cells) >= 200:
+                break
+            cell = (rng.randrange(40), rng.randrange(30))
+            index.add(cell)
+            cells.add(cell)
+        for cell in sorted(cells):
+            index.remove(cell)
+            cells.discard(cell)
+            self.assertEqual(index.count, len(cells))
+        self.assertIsNone(index.nearest((5, 5)))
+
+
+class TestSweptCollision(unittest.TestCase):
+
+    # pacman and one ghost facing each other down a dead end corridor
+    CORRIDOR = ['%%%%%%%%%%%',
+                '%P.......G%',
+                '%%%%%%%%%%%']
+
+    def test_closest_approach(self):
+        # passing through each other, head on
+        self.assertAlmostEqual(pm.closest_approach((0, 0), (4, 0), (4, 0), (0, 0)), 0.0)
+        # closest at the start, then at the end
+        self.assertAlmostEqual(pm.closest_approach((0, 0), (-1, 0), (2, 0), (3, 0)), 4.0)
+        self.assertAlmostEqual(pm.closest_approach((0, 0), (1, 0), (5, 0), (5, 0)), 16.0)
+        # side by side, same move
+        self.assertAlmostEqual(pm.closest_approach((0, 0), (3, 0), (0, 1), (3, 1)), 1.0)
+
+    def test_fast_movers_cannot_pass(self):
+        config = pm.make_config(pac_speed=3.0, ghost_speed=3.0)
+        maze   = pm.Maze(self.CORRIDOR, backend='null', seed=0, config=config)
+        self.addCleanup(maze.close)
+        maze.key_pressed('Right', when=0.0)
+        while not maze.finished():
+            maze.tick()
+        self.assertTrue(maze.lost)
+        (pacman, ghost) = maze.movables
+        # they swapped sides in the catching tick, ending well apart
+        self.assertGreater(pacman.place[0], ghost.place[0])
+        self.assertGreater(pacman.place[0] - ghost.place[0], config.catch_distance)
+
+
+class TestCorridorGraph(unittest.TestCase):
+
+    def walk(self, cell, corridor):
+        r""" the cells passed following corridor's waypoints from cell """
+        cells = []
+        for point in corridor.waypoints:
+            (dx, dy) = (point[0] - cell[0], point[1] - cell[1])
+            # waypoints are corners, joined by straight runs
+            self.assertTrue(dx == 0 or dy == 0, (cell, point))
+            (sx, sy) = ((dx > 0) - (dx < 0), (dy > 0) - (dy < 0))
+            while cell != point:
+                cell = (cell[0] + sx, cell[1] + sy)
+                cells.append(cell)
+        return cells
+
+    def test_classic_layout(self):
+        maze  = pm.Maze(pm.my_layout, backend='null', seed=0)
+        self.addCleanup(maze.close)
+        graph = maze.corridors
+        for (cell, moves) in graph.exits.items():
+            self.assertEqual(graph.is_node(cell), len(moves) != 2, cell)
+        for node in graph.nodes:
+            for move in graph.exits[node]:
+                corridor = graph.corridor(node, move)
+                cells    = self.walk(node, corridor)
+                self.assertEqual(len(cells), corridor.length)
+                self.assertEqual(cells[0], (node[0] + move[0], node[1] + move[1]))
+                self.assertEqual(cells[-1], corridor.end)
+                self.assertTrue(graph.is_node(corridor.end))
+                for passed in cells[:-1]:
+                    self.assertIn(passed, graph.exits)
+                    self.assertFalse(graph.is_node(passed), passed)
+                # the same corridor walked back
+                back = graph.corridor(corridor.end, (-corridor.heading[0], -corridor.heading[1]))
+                self.assertEqual((back.end, back.length), (node, corridor.length))
+        self.assertGreater(graph.mean_length(), 1.0)
+
+    def test_loop_without_junctions(self):
+        ring  = ['%%%%%',
+                 '%P..%',
+                 '%.%.%',
+                 '%...%',
+                 '%%%%%']
+        maze  = pm.Maze(ring, backend='null', seed=0)
+        self.addCleanup(maze.close)
+        graph = maze.corridors
+        self.assertEqual(graph.nodes, set())
+        self.assertEqual(graph.mean_length(), 0.0)
+        corridor = graph.corridor((1, 1), (1, 0))
+        self.assertEqual((corridor.end, corridor.length), ((1, 1), 8))
+        self.assertEqual(corridor.waypoints, ((3, 1), (3, 3), (1, 3), (1, 1)))
+
+
+class TestConfig(unittest.TestCase):
+
+    def test_make_config(self):
+        config = pm.make_config(grid_size=10, ghost_speed=0.5, ghost_colors=['red'])
+        self.assertEqual((config.margin, config.pac_size), (10, 8.0))
+        self.assertEqual(config.ghost_speed, 0.5)
+        self.assertEqual(config.ghost_colors, ('red',))
+        self.assertEqual(pm.make_config(grid_size=10, margin=4).margin, 4)
+        # only the copy changed
+        self.assertEqual(pm.DEFAULT_CONFIG.grid_size, pm.GRID_SIZE)
+        self.assertEqual(pm.DEFAULT_CONFIG.ghost_speed, pm.GHOST_SPEED)
+
+    def test_games_side_by_side(self):
+        slow = pm.Maze(pm.my_layout, backend='null', seed=0)
+        fast = pm.Maze(pm.my_layout, backend='null', seed=0,
+                       config=pm.make_config(pac_speed=0.5, ghost_speed=0.4,
+                                             ghost_colors=['orange']))
+        self.addCleanup(slow.close)
+        self.addCleanup(fast.close)
+        for maze in (slow, fast):
+            maze.key_pressed('Left', when=0.0)
+            maze.tick()
+        pacmen = [[mover for mover in maze.movables if mover.kind == 'pacman'][0]
+                  for maze in (slow, fast)]
+        ghosts = [[mover for mover in maze.movables if mover.kind == 'ghost']
+                  for maze in (slow, fast)]
+        self.assertEqual([pacman.place[0] for pacman in pacmen], [14.75, 14.5])
+        self.assertEqual([pacman.speed for pacman in pacmen], [0.25, 0.5])
+        self.assertEqual(set(ghost.speed for ghost in ghosts[0]), {0.2})
+        self.assertEqual(set(ghost.speed for ghost in ghosts[1]), {0.4})
+        self.assertEqual(set(ghost.color for ghost in ghosts[1]), {'orange'})
+        self.assertNotIn('orange', [mover.color for mover in slow.movables])
+
+
+class TestLayoutAnalysis(unittest.TestCase):
+
+    # food and a ghost walled off from pacman, in a region of their own
+    SPLIT = ['%%%%%%%',
+             '%P..%.%',
+             '%.%%%G%',
+             '%%%%%%%']
+
+    def test_split_layout(self):
+        report = pm.analyze_layout(self.SPLIT)
+        self.assertEqual((report.width, report.height), (7, 4))
+        self.assertEqual((report.open_cells, report.components, report.food), (6, 2, 4))
+        self.assertEqual(report.unreachable_food, ((5, 1),))
+        self.assertEqual(report.isolated_ghosts, ((5, 2),))
+        self.assertEqual(report.boxed_ghosts, ())
+        self.assertEqual((report.dead_ends, report.junctions), (4, 0))
+        self.assertFalse(report.winnable)
+        # analysed once per layout
+        self.assertIs(pm.analyze_layout(list(self.SPLIT)), report)
+
+    def test_check_layout(self):
+        for (layout, problem) in ((self.SPLIT, 'unreachable'),
+                                  (['%%%%', '%P %', '%%%%'], 'no food'),
+                                  (['%%%%', '%..%', '%%%%'], 'no pacman')):
+            with self.assertRaises(pm.LayoutError) as caught:
+                pm.check_layout(layout)
+            self.assertIn(problem, str(caught.exception))
+            # refused before any of the game is built
+            self.assertRaises(pm.LayoutError, pm.Maze, layout, backend='null',
+                              validate=True)
+
+    def test_playable_layouts(self):
+        report = pm.check_layout(pm.my_layout)
+        self.assertEqual(report.unreachable_capsules, ())
+        self.assertEqual(report.isolated_ghosts, ())
+        self.assertEqual(report.food, sum(row.count('.') for row in pm.my_layout))
+        for seed in range(20):
+            self.assertTrue(pm.check_layout(pm.generate_layout(25, 17, seed=seed)).winnable)
+
+
+class TestViewport(unittest.TestCase):
+
+    def check_view(self, maze, most):
+        r""" items drawn are those of the cells near the view, in place;
+            most is updated with the peak count shown of each kind """
+        view   = maze.viewport
+        region = view.region()
+        self.assertLessEqual(set(view.shown), region)
+        shown  = dict((kind, 0) for kind in view.OFFSETS)
+        for cell in region:
+            items = view.shown.get(cell, [])
+            self.assertEqual([kind for (kind, item) in items], view.kinds(cell), cell)
+            for (kind, item) in items:
+                (off_x, off_y) = view.OFFSETS[kind]
+                (x, y) = maze.to_screen((cell[0] + off_x, cell[1] + off_y))
+                center = item.getCenter()
+                self.assertAlmostEqual(center.x, x, msg=(cell, kind))
+                self.assertAlmostEqual(center.y, y, msg=(cell, kind))
+                shown[kind] += 1
+        for (kind, count) in shown.items():
+            most[kind] = max(most.get(kind, 0), count)
+
+    def test_scrolling(self):
+        maze  = pm.Maze(pm.generate_layout(61, 41, seed=2), backend='null', seed=0,
+                        viewport=(15, 11))
+        self.addCleanup(maze.close)
+        pilot = sweep.Autopilot(maze)
+        view  = maze.viewport
+        most  = {}
+        moves = set()
+        self.check_view(maze, most)
+        for tick in range(1500):
+            if maze.finished():
+                break
+            if tick == 200:
+                saved = maze.save_state()
+            pilot.step()
+            maze.tick()
+            maze.render()
+            moves.add((view.left, view.top))
+            self.check_view(maze, most)
+        self.assertGreater(len(moves), 5, 'the view never scrolled')
+        # items are only made when every one of that kind is in use
+        self.assertLessEqual(view.created, sum(most.values()))
+        whole = sum(len(view.kinds((x, y))) for y in range(maze.height)
+                    for x in range(maze.width))
+        self.assertLess(view.created, whole / 4)
+        # food eaten since comes back in view
+        maze.restore_state(saved)
+        maze.render()
+        self.check_view(maze, most)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Checks for rollback play and the Maze state it rolls back
+
+Two peers playing over lossy, jittery links must end in the game a
+replay with every input known gives, and Maze.restore_state must put a
+game back exactly as save_state found it, so ticks run again come out
+the same as the first time.
+
+usage: python -m pytest test_rollback.py
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import unittest
+
+import pacman as pm
+import rollback
+import sweep
+
+
+def food_map(maze):
+    r""" cells the map holds food and capsule objects in """
+    return ([(x, y) for y in range(maze.height) for x in range(maze.width)
+             if isinstance(maze.map[y][x], pm.Food)],
+            [(x, y) for y in range(maze.height) for x in range(maze.width)
+             if isinstance(maze.map[y][x], pm.Capsule)])
+
+
+class TestRollback(unittest.TestCase):
+
+    def check(self, **link):
+        result = rollback.play(pm.my_layout, ticks=600, **link)
+        self.assertTrue(result['settled'], link)
+        self.assertTrue(result['in_sync'], link)
+        return result
+
+    def test_in_sync(self):
+        for seed in range(3):
+            result = self.check(seed=seed, latency=4, jitter=2)
+            self.assertGreater(result['rollbacks'], 0)
+
+    def test_in_sync_under_loss(self):
+        results = [self.check(seed=seed, latency=3, jitter=4, loss=0.3) for seed in range(3)]
+        # lost messages are resent later, so some rollbacks reach further
+        # back than the longest a delivered message takes
+        self.assertGreater(max(result['deepest_rollback'] for result in results), 3 + 4)
+
+    def test_input_delay(self):
+        # with the delay covering the latency nothing is ever predicted wrong
+        result = self.check(seed=0, latency=2, jitter=0, delay=3)
+        self.assertEqual(result['rollbacks'], 0)
+
+
+class TestSaveState(unittest.TestCase):
+
+    def setUp(self):
+        self.maze  = rollback.make_game(pm.my_layout, seed=0)
+        self.pilot = sweep.Autopilot(self.maze)
+        self.addCleanup(self.maze.close)
+
+    def run_ticks(self, ticks):
+        r""" tick steered by the autopilot; return the key pressed per tick """
+        keys = []
+        for tick in range(ticks):
+            key = self.pilot.key()
+            if key is not None:
+                self.maze.key_pressed(key, when=0.0)
+            keys.append(key)
+            self.maze.tick()
+        return keys
+
+    def replay(self, keys):
+        for key in keys:
+            if key is not None:
+                self.maze.key_pressed(key, when=0.0)
+            self.maze.tick()
+
+    def test_restore_replays(self):
+        maze  = self.maze
+        self.run_ticks(50)
+        saved = maze.save_state()
+        cells = food_map(maze)
+        keys  = self.run_ticks(300)
+        final = maze.save_state()
+        self.assertLess(len(food_map(maze)[0]), len(cells[0]), 'nothing eaten to put back')
+        self.assertLess(len(food_map(maze)[1]), len(cells[1]), 'no capsule to put back')
+        maze.restore_state(saved)
+        self.assertEqual(maze.save_state(), saved)
+        self.assertEqual(food_map(maze), cells)
+        self.assertEqual(maze.food_index.count, maze.food_count)
+        self.assertEqual(maze.buffer.latest()[1], maze.snapshot()._replace(
+            time=maze.buffer.latest()[1].time))
+        self.replay(keys)
+        self.assertEqual(maze.save_state(), final)
+
+    def test_restore_after_loss(self):
+        maze  = self.maze
+        saved = maze.save_state()
+        # player 1's ghost heads for pacman until it's caught
+        while not maze.finished() and maze.ticks < 2000:
+            maze.key_pressed('Down', when=0.0, player=1)
+            maze.tick()
+        self.assertTrue(maze.lost)
+        maze.restore_state(saved)
+        self.assertFalse(maze.finished())
+        self.assertEqual(maze.save_state(), saved)
+
+
+if __name__ == '__main__':
+    unittest.main()
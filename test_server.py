@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Checks for the asyncio game server in server.py
+
+A malformed client message gets an error reply and the connection stays
+open; a session that stops on an error tells its watchers and is reported
+rather than lost.
+
+usage: python -m pytest test_server.py
+
+@author: Matt Beck
+"""
+
+# IMPORTS
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+import asyncio
+import gc
+import json
+import unittest
+
+import server
+
+# bad request line, and the start of the error the server replies with
+BAD_REQUESTS = [
+    (b'nonsense',                           'message is not'),
+    (b'[1, 2]',                             'message is not'),
+    (b'{"type": "join", "layout": 5}',      'layout must be'),
+    (b'{"type": "join", "layout": "abc"}',  "layout 'abc'"),
+    (b'{"type": "join", "ghosts": "4"}',    'ghosts must be'),
+    (b'{"type": "join", "ghosts": 9}',      "layout 'classic' has room"),
+    (b'{"type": "join", "seed": true}',     'seed must be'),
+    (b'{"type": "watch", "session": [1]}',  'no such session'),
+    (b'{"type": "key", "key": "Left"}',     'only the player')]
+
+
+class TestGameServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = server.GameServer(tick_rate=100)
+        address     = await self.server.start()
+        (self.reader, self.writer) = await asyncio.open_connection(*address)
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.server.stop()
+
+    async def ask(self, line):
+        self.writer.write(line + b'\n')
+        return json.loads((await self.reader.readline()).decode())
+
+    async def test_bad_requests_get_errors(self):
+        for (line, error) in BAD_REQUESTS:
+            reply = await self.ask(line)
+            self.assertEqual(reply['type'], 'error', line)
+            self.assertTrue(reply['error'].startswith(error), (line, reply))
+        # still connected and able to play
+        reply = await self.ask(b'{"type": "join", "seed": 1}')
+        self.assertEqual(reply['type'], 'welcome')
+        self.assertEqual(self.server.stats()['sessions'], 1)
+
+    async def test_failed_session_reported(self):
+        reported = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: reported.append(context))
+        await self.ask(b'{"type": "join", "seed": 1}')
+        session = list(self.server.sessions.values())[0]
+
+        def tick(dt=1.0):
+            raise RuntimeError('tick failed')
+
+        session.maze.tick = tick
+        while True:
+            message = json.loads((await self.reader.readline()).decode())
+            if message.get('type') == 'error':
+                break
+        self.assertEqual([str(context['exception']) for context in reported], ['tick failed'])
+        self.assertEqual(self.server.sessions, {})
+        # nothing is left frozen once no session is running
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()